@@ -1,24 +1,251 @@
 #!/usr/bin/env python3
 """Customer Service Chatbot"""
 
+import asyncio
+import contextvars
+import functools
 import uuid
 import os
 import re
 import json
-from typing import Any, Dict, List, Optional
+import threading
+import time
+import weakref
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
-from openai import OpenAI
-from database import init_database, lookup_ticket, add_user, add_ticket
-from langsmith import traceable, trace, Client
-from langchain_core.prompts import ChatPromptTemplate
+from database import (TicketRecord, init_database, lookup_ticket_record, insert_ticket, add_tickets, on_ticket_change,
+                      reserve_ticket_ids, search_tickets, match_score, query_term_count, get_ticket_page, commit_tickets,
+                      ticket_id_exists, add_pending_ticket_source, MAX_TICKET_ID_ATTEMPTS)
+from prompt_registry import PromptRegistry
+from fast_classifier import FastClassifier, extract_ticket_id, load_example_model
+from response_cache import CACHEABLE_INTENTS, ResponseCache
+from ticket_cache import TicketCache
+from conversation_memory import ConversationMemory, create_memory
+from ticket_ids import TicketIdAllocator
+from ticket_journal import TicketWriteQueue
+from rate_limiter import RateLimiter
+from token_count import load_encoder
+from routing import ROUTE_SCHEMA, Route, parse_route, route_messages
+from tracing import TraceExporter, head_sampled, install as install_tracing
+from async_runtime import MicroBatcher, iterate_sync, run_sync
+from metrics import metrics
+from langsmith import traceable, trace
 from langsmith.client import convert_prompt_to_openai_format
+from langsmith.run_helpers import get_current_run_tree
 
+if TYPE_CHECKING:
+    from langsmith import Client
+    from openai import AsyncOpenAI, OpenAI
+
+# Module constants below read the environment, so .env is applied first (cheap)
 load_dotenv()
 
-init_database()
+# Max customer messages processed at once by aprocess_customer_messages
+MAX_CONCURRENT_MESSAGES = int(os.getenv("MAX_CONCURRENT_MESSAGES", "64"))
+
+WRITE_RESPONSE_PROMPT = "write_response_prompt_v2"
+
+# "pipeline": classify, then write_response (two LLM calls for turns the local classifier can't handle).
+# "single_call": one structured completion classifies and replies; a second call only follows a tool (routing.py)
+ROUTING_MODE = os.getenv("ROUTING_MODE", "pipeline")
+
+# New tickets are journaled and committed in groups by a background writer instead of
+# one commit per request (ticket_journal.py); the customer gets the ID straight away
+TICKET_WRITE_BEHIND = os.getenv("TICKET_WRITE_BEHIND", "false").lower() == "true"
+
+# A ticket request whose summary shares this share of its search terms with one of the
+# customer's open tickets is answered with that ticket instead of creating a new one
+TICKET_DEDUP_ENABLED = os.getenv("TICKET_DEDUP_ENABLED", "true").lower() != "false"
+TICKET_DEDUP_THRESHOLD = float(os.getenv("TICKET_DEDUP_THRESHOLD", "0.85"))
+# A request of fewer search terms ("payment failed") matches too many tickets to call one a duplicate
+TICKET_DEDUP_MIN_TERMS = int(os.getenv("TICKET_DEDUP_MIN_TERMS", "3"))
+# Tickets listed when a customer asks about a ticket without giving its ID
+TICKET_MATCHES_SHOWN = 3
+# "my last case" / "my previous ticket" means exactly one ticket: the newest
+_SINGLE_RECENT_TICKET = re.compile(
+    r"\b(last|latest|newest|most recent|previous|recent)\s+((open|closed|resolved|unresolved|pending)\s+)?"
+    r"(case|ticket|issue|request|one|complaint)\b", re.I)
+_TICKET_STATUS_WORDS = (("open", re.compile(r"\b(open|unresolved|pending)\b", re.I)),
+                        ("closed", re.compile(r"\b(closed|resolved|solved)\b", re.I)))
+
+# Set by batch.py so concurrent messages share LLM classification calls and ticket commits
+classification_batcher: "contextvars.ContextVar[Optional[MicroBatcher]]" = contextvars.ContextVar(
+    "classification_batcher", default=None)
+ticket_batcher: "contextvars.ContextVar[Optional[MicroBatcher]]" = contextvars.ContextVar(
+    "ticket_batcher", default=None)
+
+
+# Clients, the prompt registry, the local classifier and the response cache are
+# built on first use (or all at once by bootstrap()), so importing agent does no
+# network, disk or model work. The database schema is created when its pool opens.
+def _created_once(factory: Callable[[], Any]) -> Callable[[], Any]:
+    """Decorator: run `factory` on the first call only and return its result afterwards"""
+    lock = threading.Lock()
+    created = []
+
+    @functools.wraps(factory)
+    def get():
+        if not created:
+            with lock:
+                if not created:
+                    created.append(factory())
+        return created[0]
+    return get
+
+
+@_created_once
+def get_client() -> "OpenAI":
+    """Return the shared synchronous OpenAI client"""
+    from openai import OpenAI
+
+    # Retries are left to the rate limiter, which backs off all callers together
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+
+@_created_once
+def get_ls_client() -> "Client":
+    """Return the shared LangSmith client"""
+    from langsmith import Client
+
+    return Client(api_key=os.getenv("LANGCHAIN_API_KEY"))
+
+
+@_created_once
+def get_trace_exporter() -> Optional[TraceExporter]:
+    """Sampled, queued export of every LangSmith run (TRACE_* settings; see tracing.py).
+
+    This replaces langsmith's global client for the whole process, so only
+    entry points (the REPL, server.py, batch.py) call it; importing agent doesn't.
+    """
+    return install_tracing(get_ls_client)
+
+
+@_created_once
+def get_prompt_registry() -> PromptRegistry:
+    """Hub prompts are pulled once and then served from memory (optionally pinned to a commit)"""
+    prompt_pins = {}
+    if os.getenv("WRITE_RESPONSE_PROMPT_COMMIT"):
+        prompt_pins[WRITE_RESPONSE_PROMPT] = os.getenv("WRITE_RESPONSE_PROMPT_COMMIT")
+    return PromptRegistry(lambda identifier: get_ls_client().pull_prompt(identifier), pins=prompt_pins)
+
+
+@_created_once
+def get_fast_classifier() -> FastClassifier:
+    """Local rules/model stage; only low-confidence messages reach the LLM classifier"""
+    return FastClassifier(model=load_example_model())
+
+
+@_created_once
+def get_response_cache() -> Optional[ResponseCache]:
+    """Replies for repeated greetings / status questions are served without calling gpt-4o"""
+    if os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "false":
+        return None
+    response_cache = ResponseCache(
+        persist_path=os.getenv("RESPONSE_CACHE_DB"),
+        semantic=os.getenv("RESPONSE_CACHE_SEMANTIC", "false").lower() == "true",
+    )
+    on_ticket_change(response_cache.invalidate_ticket)
+    return response_cache
+
+
+@_created_once
+def get_ticket_cache() -> Optional[TicketCache]:
+    """Repeated lookups of the same ticket skip sqlite and re-formatting until the row changes"""
+    if os.getenv("TICKET_CACHE_ENABLED", "true").lower() == "false":
+        return None
+    ticket_cache = TicketCache()
+    on_ticket_change(ticket_cache.invalidate_ticket)
+    return ticket_cache
+
+
+@_created_once
+def get_rate_limiter() -> RateLimiter:
+    """Request/token budgets shared by every OpenAI call (OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT)"""
+    return RateLimiter()
+
+
+@_created_once
+def get_conversation_memory() -> ConversationMemory:
+    """Per-thread history (CONVERSATION_BACKEND=memory|sqlite), kept within a token budget"""
+    return create_memory()
 
-ls_client = Client(api_key=os.getenv("LANGCHAIN_API_KEY"))
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+@_created_once
+def get_ticket_id_allocator() -> TicketIdAllocator:
+    """Unique ticket IDs from blocks reserved in the tickets database"""
+    return TicketIdAllocator(reserve_ticket_ids)
+
+
+@_created_once
+def get_ticket_write_queue() -> Optional[TicketWriteQueue]:
+    """Write-behind queue for new tickets (TICKET_WRITE_BEHIND); lookups see its tickets before they commit"""
+    if not TICKET_WRITE_BEHIND:
+        return None
+    ticket_queue = TicketWriteQueue(commit_tickets)
+    add_pending_ticket_source(ticket_queue.pending, ticket_queue.pending_for_user)
+    return ticket_queue
+
+
+def next_ticket_id() -> str:
+    """A ticket ID no other worker will hand out (evaluations replace this for repeatable IDs)"""
+    return get_ticket_id_allocator().next_id()
+
+
+@_created_once
+def start_metrics_exporters() -> bool:
+    """Optional metrics export: Prometheus text on METRICS_PORT and/or a periodic JSON dump"""
+    if os.getenv("METRICS_PORT"):
+        metrics.start_http_server(int(os.getenv("METRICS_PORT")), os.getenv("METRICS_HOST", "127.0.0.1"))
+    if os.getenv("METRICS_JSON_PATH"):
+        metrics.start_json_dump(os.getenv("METRICS_JSON_PATH"), float(os.getenv("METRICS_DUMP_INTERVAL", "60")))
+    return True
+
+
+def bootstrap():
+    """Create the database schema, clients, classifier, caches, tokenizer, metrics exporters and prompt up front.
+
+    Optional: each piece is otherwise created on first use. Servers call this at
+    startup so the first customer message doesn't pay for it.
+    """
+    init_database()
+    get_client().chat.completions  # resources are imported on first access
+    get_ls_client()
+    get_prompt_registry()
+    get_fast_classifier()
+    get_response_cache()
+    get_ticket_cache()
+    get_conversation_memory()
+    get_rate_limiter()
+    # The tokenizer downloads its encoding on first use; not on the event loop mid-turn
+    load_encoder()
+    start_metrics_exporters()
+    try:
+        written_prompt = get_prompt_registry().get(WRITE_RESPONSE_PROMPT)
+        # Formatting once pulls in the prompt converter's own lazy imports
+        _response_messages(written_prompt, _response_prompt_inputs("", "other", "", []))
+    except Exception as e:
+        print(f"Error loading prompt '{WRITE_RESPONSE_PROMPT}': {e}")
+
+
+# Attributes that used to be created at import (agent.client, agent.prompt_registry, ...)
+_LAZY_ATTRIBUTES = {
+    "client": get_client,
+    "ls_client": get_ls_client,
+    "prompt_registry": get_prompt_registry,
+    "fast_classifier": get_fast_classifier,
+    "response_cache": get_response_cache,
+    "ticket_cache": get_ticket_cache,
+    "conversation_memory": get_conversation_memory,
+    "trace_exporter": get_trace_exporter,
+    "rate_limiter": get_rate_limiter,
+    "ticket_write_queue": get_ticket_write_queue,
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 @traceable(
     run_type="llm",
@@ -26,21 +253,144 @@ client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 )
 def call_openai(messages: list, model: str = "gpt-4o", temperature: float = 0.1) -> list:
     """Make call to OpenAI API"""
-    response = client.chat.completions.create(
+    response = get_rate_limiter().call(
+        get_client().chat.completions.create,
         model=model,
         messages=messages,
         temperature=temperature
     )
+    metrics.record_usage("call_openai", response.usage)
     
     return [response.choices[0].message.role, response.choices[0].message.content]
 
 
+# AsyncOpenAI's connection pool is tied to the event loop it was first used on,
+# so keep one client per loop
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+
+def get_async_client() -> "AsyncOpenAI":
+    """Return the AsyncOpenAI client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        from openai import AsyncOpenAI
+
+        async_client = _async_clients[loop] = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+    return async_client
+
+
+@traceable(
+    name="call_openai",
+    run_type="llm",
+    metadata={"ls_model_name": "gpt-4o", "ls_provider": "openai"}
+)
+async def acall_openai(messages: list, model: str = "gpt-4o", temperature: float = 0.1) -> list:
+    """Make async call to OpenAI API"""
+    response = await get_rate_limiter().acall(
+        get_async_client().chat.completions.create,
+        model=model,
+        messages=messages,
+        temperature=temperature
+    )
+    metrics.record_usage("call_openai", response.usage)
+
+    return [response.choices[0].message.role, response.choices[0].message.content]
+
+
 #explicit prompt example (no push/pull from hub)
 @traceable
-def classify_request(message_content: str) -> Dict[str, str]:
+@metrics.timed("agent_stage_latency_seconds", stage="classify")
+def classify_request(message_content: str, history: str = "") -> Dict[str, str]:
     """Classify user's request and extract ticket ID if present"""
-    classification_prompt = f"""
-    Analyze this customer service message and classify it:
+    # Fast path: greetings, thanks, "ticket 12345 status?" etc. are handled locally
+    local_classification = get_fast_classifier().classify(message_content)
+    if local_classification is not None:
+        return local_classification
+
+    response = call_openai([{"role": "user", "content": _classification_prompt(message_content, history)}])
+    return _parse_classification(response, message_content)
+
+
+@traceable(name="classify_request")
+@metrics.timed("agent_stage_latency_seconds", stage="classify")
+async def aclassify_request(message_content: str, history: str = "", fast_path: bool = True) -> Dict[str, str]:
+    """Async version of classify_request (fast_path=False: the caller already tried the local stage)"""
+    local_classification = get_fast_classifier().classify(message_content) if fast_path else None
+    if local_classification is not None:
+        return local_classification
+
+    batcher = classification_batcher.get()
+    if batcher is not None and not history:
+        return await batcher.submit(message_content)
+
+    response = await acall_openai([{"role": "user", "content": _classification_prompt(message_content, history)}])
+    return _parse_classification(response, message_content)
+
+
+@metrics.timed("agent_stage_latency_seconds", stage="classify_batch")
+async def aclassify_with_llm(messages: List[str]) -> List[Dict[str, str]]:
+    """One LLM call for many messages; any the reply doesn't cover are classified one by one"""
+    if len(messages) == 1:
+        response = await acall_openai([{"role": "user", "content": _classification_prompt(messages[0])}])
+        return [_parse_classification(response, messages[0])]
+
+    response = await acall_openai([{"role": "user", "content": _batch_classification_prompt(messages)}])
+    by_index = _parse_batch_classification(response)
+    results = []
+    for i, message in enumerate(messages, start=1):
+        if i in by_index:
+            results.append(_parse_classification(json.dumps(by_index[i]), message))
+        else:
+            single = await acall_openai([{"role": "user", "content": _classification_prompt(message)}])
+            results.append(_parse_classification(single, message))
+    return results
+
+
+def _batch_classification_prompt(messages: List[str]) -> str:
+    numbered = "\n".join(f"    {i}. {' '.join(message.split())}" for i, message in enumerate(messages, start=1))
+    return f"""
+    Analyze each of these customer service messages and classify it.
+    Messages to classify:
+{numbered}
+
+    Classification rules:
+    - "ticket_info": If the user is asking about a past issue or a specific ticket
+    - "ticket_request": If the user wants to create a new support ticket (they state a current problem)
+    - "other": For casual conversation, greetings, or non-support related messages
+
+    IMPORTANT: If a message contains a 5-character alphanumeric ticket ID (like 12345 or 61e4e), extract it as ticket_id.
+    If no 5-character ticket ID is found, set ticket_id to null.
+
+    Respond with a JSON array containing one object per message:
+    [
+        {{"index": 1, "intent": "one of: ticket_info, ticket_request, other", "summary": "brief summary", "ticket_id": "5-digit number or null"}}
+    ]
+    """
+
+
+def _parse_batch_classification(response: Any) -> Dict[int, Dict[str, Any]]:
+    """Map message index -> classification object from a batch reply (missing/invalid items omitted)"""
+    response_content = response[1] if isinstance(response, list) else response
+    try:
+        items = json.loads(re.search(r"\[.*\]", response_content, re.DOTALL).group())
+    except Exception:
+        return {}
+    return {
+        item["index"]: item for item in items
+        if isinstance(item, dict) and isinstance(item.get("index"), int) and "intent" in item
+    }
+
+
+def _classification_prompt(message_content: str, history: str = "") -> str:
+    conversation = ""
+    if history:
+        conversation = f"""
+    Conversation so far (context only; classify the latest message):
+    {history}
+    If the latest message refers to an earlier ticket ("my last case", "that ticket"), use that ticket's ID.
+    """
+    return f"""
+    Analyze this customer service message and classify it:{conversation}
     Content: {message_content}
     
     Classification rules:
@@ -58,9 +408,10 @@ def classify_request(message_content: str) -> Dict[str, str]:
         "ticket_id": "5-digit number or null"
     }}
     """
-    
-    response = call_openai([{"role": "user", "content": classification_prompt}])
-    
+
+
+def _parse_classification(response: Any, message_content: str) -> Dict[str, str]:
+    """Parse the classifier's reply into intent/summary/ticket_id"""
     response_content = response[1] if isinstance(response, list) else response
     
     # Parse JSON response
@@ -123,25 +474,41 @@ def convert_doc(search_results: List[str]) -> List[Dict[str, Any]]:
 )
 def search_ticket(ticket_id: Optional[str], username: str) -> List[Dict[str, Any]]:
     """Check if ticket ID exists and look up ticket"""
+    return convert_doc(_ticket_search_results(ticket_id, username))
+
+
+@traceable(
+    name="search_ticket",
+    run_type="retriever",
+    metadata={"retriever": "ticket_lookup", "source": "sqlite"},
+    process_inputs=lambda inputs: {k: v for k, v in inputs.items() if k != "prefetched"},
+)
+async def asearch_ticket(ticket_id: Optional[str], username: str,
+                         prefetched: Optional["asyncio.Future[List[str]]"] = None) -> List[Dict[str, Any]]:
+    """Async version of search_ticket (the sqlite lookup runs in a worker thread).
+
+    `prefetched` is a lookup already started for this ticket_id by SpeculativePrefetch.
+    """
+    if prefetched is not None:
+        return convert_doc(await prefetched)
+    return convert_doc(await asyncio.to_thread(_ticket_search_results, ticket_id, username))
+
+
+@metrics.timed("agent_stage_latency_seconds", stage="ticket_lookup")
+def _ticket_search_results(ticket_id: Optional[str], username: str) -> List[str]:
+    """Look up the ticket and format it for the response prompt (blocking)"""
     if ticket_id:
         # User provided ticket ID, look it up
         try:
-            ticket_data = lookup_ticket(ticket_id, username)
-            if ticket_data:
-                search_results = [
-                    f"**Ticket #{ticket_data['ticket_id']} Status**",
-                    f"Status: {ticket_data['status'].title()}",
-                    f"Priority: {ticket_data['priority'].title()}",
-                    f"Description: {ticket_data['description']}",
-                    f"Created: {ticket_data['created_at']}",
-                    f"Last Updated: {ticket_data['updated_at']}"
-                ]
-
-            else:
-                search_results = [
-                    f"Ticket #{ticket_id} not found for user '{username}'. Please check your ticket number and try again."
-                ]
+            ticket_cache = get_ticket_cache()
+            if ticket_cache is None:
+                return list(_format_ticket(ticket_id, username, lookup_ticket_record(ticket_id, username)))
+            search_results, hit = ticket_cache.get_or_load(ticket_id, username, lookup_ticket_record, _format_ticket)
+            metrics.inc("agent_ticket_cache_total", result="hit" if hit else "miss")
+            search_results = list(search_results)
         except Exception as e:
+            print(f"Error looking up ticket: {e}")
+            metrics.inc("agent_errors_total", stage="lookup_ticket")
             search_results = [f"Error querying ticket information: {str(e)}"]
     else:
         # No ticket ID provided, ask for it
@@ -149,12 +516,99 @@ def search_ticket(ticket_id: Optional[str], username: str) -> List[Dict[str, Any
             "I understand you're asking about a past issue or ticket. Please provide your 5-digit ticket ID number so I can look up the details for you."
         ]
     
-    return convert_doc(search_results)
+    return search_results
+
+
+def _format_ticket(ticket_id: str, username: str, ticket: Optional[TicketRecord]) -> Tuple[str, ...]:
+    """search_results lines for a looked-up ticket (or its absence)"""
+    if ticket:
+        return (
+            f"**Ticket #{ticket.ticket_id} Status**",
+            f"Status: {ticket.status.title()}",
+            f"Priority: {ticket.priority.title()}",
+            f"Description: {ticket.description}",
+            f"Created: {ticket.created_at}",
+            f"Last Updated: {ticket.updated_at}"
+        )
+    return (
+        f"Ticket #{ticket_id} not found for user '{username}'. Please check your ticket number and try again.",
+    )
+
+@traceable(
+    name="search_ticket_matches",
+    run_type="retriever",
+    metadata={"retriever": "ticket_fts", "source": "sqlite"}
+)
+async def asearch_ticket_matches(message_content: str, username: str) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Tickets for a question that names no ticket ID, and the ID of the best one"""
+    search_results, ticket_id = await asyncio.to_thread(_ticket_match_results, message_content, username)
+    return convert_doc(search_results), ticket_id
+
+
+@metrics.timed("agent_stage_latency_seconds", stage="ticket_search")
+def _ticket_match_results(message_content: str, username: str) -> Tuple[List[str], Optional[str]]:
+    """The user's tickets that best match the message, else their latest ones (blocking)"""
+    matches = search_tickets(message_content, username, limit=TICKET_MATCHES_SHOWN)
+    if matches:
+        header = f"No ticket ID was given. {username}'s tickets that best match the message, best first:"
+        tickets = [(t.ticket_id, t.status, t.priority, t.description, t.created_at) for t in matches]
+    else:
+        # "Can you look up my last case?" has nothing to search for: answer from the history
+        count, status = _history_request(message_content)
+        described = f"{status} " if status else ""
+        header = (f"No ticket ID was given. {username}'s most recent {described}ticket:" if count == 1 else
+                  f"No ticket ID was given. {username}'s most recent {described}tickets, newest first:")
+        try:
+            history = get_ticket_page(username, count, status=status).tickets
+        except Exception as e:
+            print(f"Error getting user tickets: {e}")
+            metrics.inc("agent_errors_total", stage="get_ticket_page")
+            history = []
+        tickets = [(t.ticket_id, t.status, t.priority, t.description, t.created_at) for t in history]
+    if not tickets:
+        return _ticket_search_results(None, username), None
+    search_results = [header] + [
+        f"Ticket #{ticket_id} ({status.title()}, {priority.title()} priority, created {created_at}): {description}"
+        for ticket_id, status, priority, description, created_at in tickets
+    ]
+    search_results.append("Confirm which ticket the customer means if it isn't clear from the message.")
+    return search_results, tickets[0][0]
+
+
+def _history_request(message_content: str) -> Tuple[int, Optional[str]]:
+    """How many of the newest tickets a history question asks for, and of which status"""
+    count = 1 if _SINGLE_RECENT_TICKET.search(message_content) else TICKET_MATCHES_SHOWN
+    statuses = [status for status, pattern in _TICKET_STATUS_WORDS if pattern.search(message_content)]
+    return count, statuses[0] if len(statuses) == 1 else None
+
+
+def find_duplicate_ticket(description: str, username: str) -> Optional[TicketRecord]:
+    """The user's open ticket that most likely reports the same problem, if any"""
+    if query_term_count(description) < TICKET_DEDUP_MIN_TERMS:
+        return None
+    for candidate in search_tickets(description, username, limit=1, status="open"):
+        if match_score(description, candidate.description) >= TICKET_DEDUP_THRESHOLD:
+            return candidate
+    return None
+
+
+def _duplicate_ticket_results(ticket: TicketRecord) -> List[str]:
+    """search_results for a ticket request answered with an existing open ticket"""
+    return [
+        "**Existing Ticket Found** (no new ticket was created)",
+        f"This looks like the same issue as open ticket #{ticket.ticket_id}.",
+        f"Status: {ticket.status.title()}",
+        f"Priority: {ticket.priority.title()}",
+        f"Description: {ticket.description}",
+        f"Created: {ticket.created_at}",
+    ]
 
+
+@metrics.timed("agent_stage_latency_seconds", stage="create_ticket")
 def create_ticket(description: str, username: str) -> Dict[str, Any]:
     """Create a new ticket for the customer request"""
     # Generate ticket details
-    ticket_id = f"{uuid.uuid4().hex[:5]}"  # 5-character ticket ID
+    ticket_id = next_ticket_id()  # 5-character ticket ID
     
 
     with trace(
@@ -163,19 +617,47 @@ def create_ticket(description: str, username: str) -> Dict[str, Any]:
         inputs={"new_ticket_id": ticket_id, "description": description, "username": username},
         metadata={"example_metadata": "hello!"} #partial trace
     ) as ls_trace:
-    # Add user to database if they don't exist
-        add_user(username)
-        
-        # Create the ticket in the database
-        success = add_ticket(
-            ticket_id=ticket_id,
-            username=username,
-            status="open",
-            description=description,
-            priority="medium"  # Default
-        )
+        ticket_queue = get_ticket_write_queue()
+        if ticket_queue is not None:
+            ticket_id, success = _queue_ticket(ticket_queue, ticket_id, description, username)
+        else:
+            # Add the user if needed and create the ticket (under a new ID if this one is taken)
+            stored_id = insert_ticket(
+                ticket_id=ticket_id,
+                username=username,
+                status="open",
+                description=description,
+                priority="medium",  # Default
+                next_id=next_ticket_id
+            )
+            success = stored_id is not None
+            ticket_id = stored_id or ticket_id
         ls_trace.end(outputs={"example_output": "Finished creating ticket"})
     
+    return _ticket_result(ticket_id, description, username, success)
+
+
+def _queue_ticket(ticket_queue: TicketWriteQueue, ticket_id: str, description: str,
+                  username: str) -> Tuple[str, bool]:
+    """Journal a new ticket for the background writer; (ticket_id, success)"""
+    try:
+        # The ID is promised before the row is written, so it can't be retried later:
+        # skip IDs already taken by tickets that didn't come from the allocator
+        for _ in range(MAX_TICKET_ID_ATTEMPTS):
+            if not ticket_id_exists(ticket_id):
+                break
+            metrics.inc("agent_ticket_id_retries_total")
+            ticket_id = next_ticket_id()
+        ticket_queue.submit(ticket_id, username, "open", description, "medium")
+        return ticket_id, True
+    except Exception as e:
+        print(f"Error queueing ticket: {e}")
+        metrics.inc("agent_errors_total", stage="queue_ticket")
+        return ticket_id, False
+
+
+def _ticket_result(ticket_id: str, description: str, username: str, success: bool) -> Dict[str, Any]:
+    """create_ticket's return value for a ticket that was (or failed to be) inserted"""
     if success:
         # Return ticket details
         search_results = [
@@ -199,15 +681,216 @@ def create_ticket(description: str, username: str) -> Dict[str, Any]:
             "success": False
         }
 
+async def acreate_ticket(description: str, username: str) -> Dict[str, Any]:
+    """Async version of create_ticket (the sqlite writes run in a worker thread)"""
+    batcher = ticket_batcher.get()
+    if batcher is not None:
+        return await batcher.submit((description, username))
+    return await asyncio.to_thread(create_ticket, description, username)
+
+
+async def acreate_tickets(requests: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    """Async version of create_tickets (ID allocation and the sqlite writes run in a worker thread)"""
+    return await asyncio.to_thread(create_tickets, requests)
+
+
+@metrics.timed("agent_stage_latency_seconds", stage="create_tickets")
+def create_tickets(requests: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    """Create tickets for (description, username) pairs with a single database commit"""
+    if get_ticket_write_queue() is not None:
+        # Queued tickets are already committed in groups by the background writer
+        return [create_ticket(description, username) for description, username in requests]
+
+    tickets = [
+        {
+            "ticket_id": next_ticket_id(),
+            "username": username,
+            "status": "open",
+            "description": description,
+            "priority": "medium",
+        }
+        for description, username in requests
+    ]
+    with trace(
+        name="create_ticket",
+        run_type="chain",
+        inputs={"new_ticket_ids": [ticket["ticket_id"] for ticket in tickets],
+                "descriptions": [description for description, _ in requests],
+                "usernames": [username for _, username in requests]},
+    ) as ls_trace:
+        # Tickets whose IDs are taken are stored under new ones (written back into the dicts)
+        inserted = add_tickets(tickets, next_id=next_ticket_id)
+        ls_trace.end(outputs={"ticket_ids": [ticket["ticket_id"] for ticket in tickets], "inserted": inserted})
+    return [
+        _ticket_result(ticket["ticket_id"], ticket["description"], ticket["username"], ok)
+        for ticket, ok in zip(tickets, inserted)
+    ]
+
 @traceable
 def write_response(message_content: str, intent: str, summary: str, search_results: List[Dict[str, Any]], 
-                  ticket_id: Optional[str] = None) -> str:
+                  ticket_id: Optional[str] = None, history: str = "") -> str:
     """Generate response using context from previous steps"""
+    cached = _cached_response(message_content, intent, search_results, history)
+    if cached is not None:
+        return cached
+
+    prompt_inputs = _response_prompt_inputs(message_content, intent, summary, search_results, ticket_id, history)
+    with metrics.timer("agent_stage_latency_seconds", stage="prompt_pull"):
+        written_prompt = get_prompt_registry().get(WRITE_RESPONSE_PROMPT)
+    messages = _response_messages(written_prompt, prompt_inputs)
+
+    with metrics.timer("agent_stage_latency_seconds", stage="generate"):
+        draft_response = get_rate_limiter().call(
+            get_client().chat.completions.create,
+            model="gpt-4o",
+            messages=messages,
+            temperature=0.2,
+        )
+    metrics.record_usage("write_response", draft_response.usage)
+
+    #**** PUSH PROMPT TO HUB ****
+    #prompt_template = ChatPromptTemplate.from_template(draft_prompt)
+    #ls_client.push_prompt("write_response_prompt", object=prompt_template)
+
+    # Extract content from [role, content] format
+    reply = draft_response.choices[0].message.content
+    _cache_response(message_content, intent, search_results, reply, ticket_id, history)
+    return reply
+
+
+@traceable(name="write_response")
+async def awrite_response(message_content: str, intent: str, summary: str, search_results: List[Dict[str, Any]],
+                          ticket_id: Optional[str] = None, history: str = "") -> str:
+    """Async version of write_response"""
+    cached = _cached_response(message_content, intent, search_results, history)
+    if cached is not None:
+        return cached
+
+    prompt_inputs = _response_prompt_inputs(message_content, intent, summary, search_results, ticket_id, history)
+    written_prompt = await _aget_prompt(WRITE_RESPONSE_PROMPT)
+    messages = _response_messages(written_prompt, prompt_inputs)
+
+    with metrics.timer("agent_stage_latency_seconds", stage="generate"):
+        draft_response = await get_rate_limiter().acall(
+            get_async_client().chat.completions.create,
+            model="gpt-4o",
+            messages=messages,
+            temperature=0.2,
+        )
+    metrics.record_usage("write_response", draft_response.usage)
+
+    reply = draft_response.choices[0].message.content
+    _cache_response(message_content, intent, search_results, reply, ticket_id, history)
+    return reply
+
+
+def _join_chunks(chunks: List[str]) -> str:
+    """Assemble streamed chunks into the final output recorded on the trace"""
+    return "".join(chunks)
+
+
+def _record_time_to_first_token(started_at: float):
+    """Attach time-to-first-token to the current LangSmith run"""
+    run_tree = get_current_run_tree()
+    if run_tree is not None:
+        run_tree.add_metadata({"time_to_first_token_s": round(time.perf_counter() - started_at, 4)})
+
+
+def write_response_stream(message_content: str, intent: str, summary: str, search_results: List[Dict[str, Any]],
+                          ticket_id: Optional[str] = None, history: str = "") -> Iterator[str]:
+    """Streaming version of write_response: yields reply chunks as they arrive"""
+    return iterate_sync(awrite_response_stream(message_content, intent, summary, search_results, ticket_id, history))
+
+
+@traceable(name="write_response", reduce_fn=_join_chunks)
+async def awrite_response_stream(message_content: str, intent: str, summary: str, search_results: List[Dict[str, Any]],
+                                 ticket_id: Optional[str] = None, history: str = "") -> AsyncIterator[str]:
+    """Async streaming version of write_response"""
+    cached = _cached_response(message_content, intent, search_results, history)
+    if cached is not None:
+        yield cached
+        return
+
+    prompt_inputs = _response_prompt_inputs(message_content, intent, summary, search_results, ticket_id, history)
+    written_prompt = await _aget_prompt(WRITE_RESPONSE_PROMPT)
+    messages = _response_messages(written_prompt, prompt_inputs)
+
+    started_at = time.perf_counter()
+    with metrics.timer("agent_stage_latency_seconds", stage="generate"):
+        stream = await get_rate_limiter().acall(
+            get_async_client().chat.completions.create,
+            model="gpt-4o",
+            messages=messages,
+            temperature=0.2,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+        first_token = True
+        chunks = []
+        async for chunk in stream:
+            if chunk.usage is not None:
+                metrics.record_usage("write_response", chunk.usage)
+            content = chunk.choices[0].delta.content if chunk.choices else None
+            if not content:
+                continue
+            if first_token:
+                _record_time_to_first_token(started_at)
+                metrics.observe("agent_time_to_first_token_seconds", time.perf_counter() - started_at)
+                first_token = False
+            chunks.append(content)
+            yield content
+
+    # Only a fully received reply is cached (an abandoned stream raises before this)
+    _cache_response(message_content, intent, search_results, _join_chunks(chunks), ticket_id, history)
+
+
+def _cached_response(message_content: str, intent: str, search_results: List[Dict[str, Any]],
+                     history: str = "") -> Optional[str]:
+    """Look up a previously generated reply for the same intent, message, search results and history"""
+    response_cache = get_response_cache()
+    if response_cache is None:
+        return None
+    cached = response_cache.get(intent, message_content, search_results, context=history)
+    if intent in CACHEABLE_INTENTS:
+        metrics.inc("agent_response_cache_total", result="miss" if cached is None else "hit")
+    return cached
+
+
+def _cache_response(message_content: str, intent: str, search_results: List[Dict[str, Any]],
+                    reply: str, ticket_id: Optional[str] = None, history: str = ""):
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        response_cache.put(intent, message_content, search_results, reply, ticket_id, context=history)
+
+
+@metrics.timed("agent_stage_latency_seconds", stage="prompt_pull")
+async def _aget_prompt(name: str) -> Any:
+    """Get a hub prompt without blocking the event loop on a cold pull"""
+    prompt_registry = get_prompt_registry()
+    if name in prompt_registry:
+        return prompt_registry.get(name)
+    return await asyncio.to_thread(prompt_registry.get, name)
+
+
+def _response_messages(written_prompt: Any, prompt_inputs: Dict[str, str]) -> list:
+    """Fill in the hub prompt and convert it to OpenAI chat messages"""
+    formatted_prompt = written_prompt.invoke(prompt_inputs)
+    return convert_prompt_to_openai_format(formatted_prompt)["messages"]
+
+
+def _response_prompt_inputs(message_content: str, intent: str, summary: str, search_results: List[Dict[str, Any]],
+                            ticket_id: Optional[str] = None, history: str = "") -> Dict[str, str]:
+    """Build the write_response prompt variables from the previous steps"""
     
     # Determine the context and build appropriate response)
     context_sections = []
     response_guidelines = []
 
+    if history:
+        # Already trimmed to the conversation token budget
+        context_sections.append(f"**Conversation So Far:**\n{history}")
+
     if intent == "ticket_info":
         # Ticket lookup results
         if search_results:
@@ -245,70 +928,299 @@ def write_response(message_content: str, intent: str, summary: str, search_resul
     #**** PULL PROMPT FROM HUB ****
     context_sections = chr(10).join(context_sections) if context_sections else ""
     response_guidelines =chr(10).join([f"- {guideline}" for guideline in response_guidelines])
-    written_prompt= ls_client.pull_prompt("write_response_prompt_v2") 
 
-    formatted_prompt = written_prompt.invoke({
+    return {
         "message_content": message_content,
         "intent": intent,
         "summary": summary,
-        "context_sections": "\n".join(context_sections),
-        "response_guidelines": "\n".join(response_guidelines),
-    })
+        "context_sections": context_sections,
+        "response_guidelines": response_guidelines,
+    }
 
-    messages = convert_prompt_to_openai_format(formatted_prompt)["messages"]
+class SpeculativePrefetch:
+    """Work started alongside classification that the later stages will probably need.
 
-    draft_response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=messages,
-        temperature=0.2,
-    )
+    If the message contains something that looks like a ticket ID, the sqlite
+    lookup for it starts immediately; if the prompt for write_response isn't
+    in memory yet, it is pulled at the same time. Both are dropped if the
+    classification goes another way.
+    """
 
-    #**** PUSH PROMPT TO HUB ****
-    #prompt_template = ChatPromptTemplate.from_template(draft_prompt)
-    #ls_client.push_prompt("write_response_prompt", object=prompt_template)
+    def __init__(self, message_content: str, username: str):
+        self.ticket_id = extract_ticket_id(message_content)
+        self.lookup_task = None
+        self.prompt_task = None
+        if self.ticket_id:
+            self.lookup_task = asyncio.ensure_future(
+                asyncio.to_thread(_ticket_search_results, self.ticket_id, username)
+            )
+            metrics.inc("agent_speculation_total", result="started")
+        if WRITE_RESPONSE_PROMPT not in get_prompt_registry():
+            self.prompt_task = asyncio.ensure_future(_aget_prompt(WRITE_RESPONSE_PROMPT))
+            # awrite_response reports pull errors itself; don't warn about them here
+            self.prompt_task.add_done_callback(lambda task: task.cancelled() or task.exception())
 
-    # Extract content from [role, content] format
-    return draft_response.choices[0].message.content
+    def take_lookup(self, intent: str, ticket_id: Optional[str]) -> Optional["asyncio.Future[List[str]]"]:
+        """Return the prefetched lookup if it matches the classification, else discard it"""
+        if self.lookup_task is None:
+            return None
+        task, self.lookup_task = self.lookup_task, None
+        if intent == "ticket_info" and ticket_id == self.ticket_id:
+            metrics.inc("agent_speculation_total", result="used")
+            return task
+        task.cancel()
+        metrics.inc("agent_speculation_total", result="discarded")
+        return None
+
+    def discard(self):
+        """Drop anything still outstanding (e.g. when classification fails)"""
+        if self.lookup_task is not None:
+            self.lookup_task.cancel()
+            self.lookup_task = None
+            metrics.inc("agent_speculation_total", result="discarded")
+
+
+def process_customer_message(message_content: str, username: str, langsmith_extra: Optional[Dict[str, Any]] = None,
+                             thread_id: Optional[str] = None) -> str:
+    """Main function to process customer messages (sync wrapper around aprocess_customer_message)"""
+    return run_sync(aprocess_customer_message(message_content, username, thread_id,
+                                              langsmith_extra=langsmith_extra))
+
+def process_customer_message_stream(message_content: str, username: str,
+                                    langsmith_extra: Optional[Dict[str, Any]] = None,
+                                    thread_id: Optional[str] = None) -> Iterator[str]:
+    """Streaming version of process_customer_message: yields reply chunks as they arrive"""
+    return iterate_sync(aprocess_customer_message_stream(message_content, username, thread_id,
+                                                         langsmith_extra=langsmith_extra))
+
+@head_sampled("process_customer_message")
+@traceable(name="process_customer_message")
+@metrics.timed("agent_stage_latency_seconds", stage="total")
+async def aprocess_customer_message(message_content: str, username: str, thread_id: Optional[str] = None) -> str:
+    """Main function to process customer messages (thread_id enables conversation memory)"""
+    reply, response_inputs = await _aroute_turn(message_content, username, thread_id)
+
+    # Step 3: Generate response (unless single-call routing already wrote it)
+    if reply is None:
+        reply = await awrite_response(**response_inputs)
+    await _aremember_turn(username, thread_id, message_content, reply, response_inputs["ticket_id"])
+    return reply
+
+@head_sampled("process_customer_message")
+@traceable(name="process_customer_message", reduce_fn=_join_chunks)
+@metrics.timed("agent_stage_latency_seconds", stage="total")
+async def aprocess_customer_message_stream(message_content: str, username: str,
+                                           thread_id: Optional[str] = None) -> AsyncIterator[str]:
+    """Async streaming version of process_customer_message"""
+    started_at = time.perf_counter()
+    reply, response_inputs = await _aroute_turn(message_content, username, thread_id)
+
+    # Step 3: Stream the response (single-call routing delivers its finished reply as one chunk)
+    first_token = True
+    chunks = []
+    async for chunk in (_single_chunk(reply) if reply is not None else awrite_response_stream(**response_inputs)):
+        if first_token:
+            _record_time_to_first_token(started_at)
+            first_token = False
+        chunks.append(chunk)
+        yield chunk
+    await _aremember_turn(username, thread_id, message_content, _join_chunks(chunks), response_inputs["ticket_id"])
+
+
+def _memory_key(username: str, thread_id: str) -> str:
+    """Threads belong to a customer: another username sending the same thread_id gets its own memory"""
+    return json.dumps([username, thread_id])
+
+
+async def _aremember_turn(username: str, thread_id: Optional[str], message_content: str, reply: str,
+                          ticket_id: Optional[str]):
+    """Append the exchange to the thread's conversation memory"""
+    if not thread_id:
+        return
+    memory = get_conversation_memory()
+    key = _memory_key(username, thread_id)
+
+    def remember():
+        memory.append(key, "user", message_content, ticket_id=ticket_id)
+        memory.append(key, "assistant", reply)
+
+    # The sqlite backend writes to disk
+    await asyncio.to_thread(remember)
+
+async def _athread_context(username: str, thread_id: Optional[str]) -> Tuple[str, Optional[str]]:
+    """The thread's conversation so far (trimmed to its token budget) and its last ticket ID"""
+    if not thread_id:
+        return "", None
+    memory = get_conversation_memory()
+    key = _memory_key(username, thread_id)
+    return await asyncio.to_thread(lambda: (memory.context(key), memory.last_ticket_id(key)))
+
+
+async def _aticket_request_results(summary: str, username: str) -> Tuple[List[str], Optional[str]]:
+    """Create a ticket for the request, or point to the customer's open ticket for the same problem"""
+    duplicate = None
+    if TICKET_DEDUP_ENABLED:
+        duplicate = await asyncio.to_thread(find_duplicate_ticket, summary, username)
+    if duplicate is not None:
+        return _duplicate_ticket_results(duplicate), duplicate.ticket_id
+    ticket_result = await acreate_ticket(summary, username)
+    return ticket_result["search_results"], ticket_result.get("ticket_id")
+
+
+async def _aprepare_response(message_content: str, username: str, thread_id: Optional[str] = None,
+                             classification: Optional[Dict[str, str]] = None,
+                             fast_path: bool = True) -> Dict[str, Any]:
+    """Steps 1-2 of the pipeline: classify (unless the caller did), route, and return the write_response arguments"""
+    start_metrics_exporters()
+    history, last_ticket_id = await _athread_context(username, thread_id)
+
+    # Step 0: Start the likely ticket lookup / prompt pull while we classify
+    prefetch = SpeculativePrefetch(message_content, username)
 
-@traceable
-def process_customer_message(message_content: str, username: str) -> str:
-    """Main function to process customer messages"""
-    
     # Step 1: Classify the request
-    classification = classify_request(message_content)
+    try:
+        if classification is None:
+            classification = await aclassify_request(message_content, history, fast_path)
+    except BaseException:
+        prefetch.discard()
+        raise
     intent = classification.get("intent", "other")
     summary = classification.get("summary", "")
     ticket_id = classification.get("ticket_id")
+    if intent == "ticket_info" and not ticket_id and thread_id:
+        # "Can you look up my last case?" refers to the ticket from earlier in the thread
+        ticket_id = last_ticket_id
     
     # Step 2: Route based on intent
+    if intent != "ticket_info":
+        prefetch.take_lookup(intent, ticket_id)
     search_results = []
     final_ticket_id = None
     
     if intent == "ticket_info":
-        search_results = search_ticket(ticket_id, username)
+        prefetched = prefetch.take_lookup(intent, ticket_id)
+        if ticket_id:
+            search_results = await asearch_ticket(ticket_id, username, prefetched=prefetched)
+        else:
+            search_results, ticket_id = await asearch_ticket_matches(message_content, username)
+        # Links the cached reply to this ticket so a status change invalidates it
+        final_ticket_id = ticket_id
         
     elif intent == "ticket_request":
-        ticket_result = create_ticket(summary, username)
-        search_results = ticket_result["search_results"]
-        final_ticket_id = ticket_result.get("ticket_id")
+        search_results, final_ticket_id = await _aticket_request_results(summary, username)
         
     else:  # intent == "other"
         search_results = []
     
-    # Step 3: Generate response
-    response = write_response(
-        message_content=message_content,
-        intent=intent,
-        summary=summary,
-        search_results=search_results,
-        ticket_id=final_ticket_id
+    if prefetch.prompt_task is not None:
+        await asyncio.wait([prefetch.prompt_task])
+    return {
+        "message_content": message_content,
+        "intent": intent,
+        "summary": summary,
+        "search_results": search_results,
+        "ticket_id": final_ticket_id,
+        "history": history,
+    }
+
+
+@traceable(
+    name="route_turn",
+    run_type="llm",
+    metadata={"ls_model_name": "gpt-4o", "ls_provider": "openai"}
+)
+async def aroute_with_llm(messages: list) -> Optional[Route]:
+    """One structured completion: intent, ticket_id and either the reply or the tool it needs"""
+    response = await get_rate_limiter().acall(
+        get_async_client().chat.completions.create,
+        model="gpt-4o",
+        messages=messages,
+        temperature=0.2,
+        response_format={"type": "json_schema", "json_schema": ROUTE_SCHEMA},
     )
-    
-    return response
+    metrics.record_usage("route_turn", response.usage)
+    return parse_route(response.choices[0].message.content)
+
+
+@metrics.timed("agent_stage_latency_seconds", stage="routing_context")
+def _routing_context(message_content: str, username: str, ticket_id: Optional[str]) -> List[str]:
+    """Ticket facts the routing call may answer from (blocking): the named ticket, then the likely ones"""
+    context = _ticket_search_results(ticket_id, username) if ticket_id else []
+    matches, best_ticket_id = _ticket_match_results(message_content, username)
+    if best_ticket_id is not None:
+        context.extend(matches)
+    return context
+
+
+async def _aroute_turn(message_content: str, username: str,
+                       thread_id: Optional[str] = None) -> Tuple[Optional[str], Dict[str, Any]]:
+    """(reply, write_response arguments); the reply is None when write_response still has to write it"""
+    if ROUTING_MODE != "single_call":
+        return None, await _aprepare_response(message_content, username, thread_id)
+    local_classification = get_fast_classifier().classify(message_content)
+    if local_classification is not None:
+        # Classified locally: the pipeline needs only one LLM call for these anyway
+        return None, await _aprepare_response(message_content, username, thread_id, local_classification)
+
+    start_metrics_exporters()
+    history, last_ticket_id = await _athread_context(username, thread_id)
+    named_ticket_id = extract_ticket_id(message_content) or last_ticket_id
+    ticket_context = await asyncio.to_thread(_routing_context, message_content, username, named_ticket_id)
+    route = await aroute_with_llm(route_messages(message_content, history, ticket_context))
+    if route is None:
+        print("Routing reply didn't match its schema; falling back to the two-call pipeline")
+        metrics.inc("agent_errors_total", stage="route_turn")
+        return None, await _aprepare_response(message_content, username, thread_id, fast_path=False)
+    metrics.inc("agent_routing_total", intent=route.intent, action=route.action)
+
+    response_inputs = {
+        "message_content": message_content,
+        "intent": route.intent,
+        "summary": route.summary,
+        "search_results": [],
+        "ticket_id": None,
+        "history": history,
+    }
+    if route.intent == "ticket_request":
+        # The reply has to name the new (or duplicate) ticket, so it's written once that exists
+        search_results, ticket_id = await _aticket_request_results(route.summary or message_content, username)
+        response_inputs.update(search_results=search_results, ticket_id=ticket_id)
+        return None, response_inputs
+    if route.intent == "ticket_info":
+        ticket_id = route.ticket_id or named_ticket_id
+        response_inputs["ticket_id"] = ticket_id
+        if ticket_id and not any(ticket_id in line for line in ticket_context):
+            # A ticket the context doesn't cover: look it up, then write the reply from it
+            response_inputs["search_results"] = await asearch_ticket(ticket_id, username)
+            return None, response_inputs
+        response_inputs["search_results"] = convert_doc(ticket_context)
+    if route.reply is None:
+        # A tool was asked for that the context already answers
+        return None, response_inputs
+    return route.reply, response_inputs
+
+
+async def _single_chunk(text: str) -> AsyncIterator[str]:
+    yield text
+
+
+async def aprocess_customer_messages(messages: List[Tuple[str, str]],
+                                     concurrency: int = MAX_CONCURRENT_MESSAGES) -> List[str]:
+    """Process (message_content, username) pairs concurrently, at most `concurrency` at a time"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def process_one(message_content: str, username: str) -> str:
+        async with semaphore:
+            return await aprocess_customer_message(message_content, username)
+
+    return await asyncio.gather(*(process_one(m, u) for m, u in messages))
 
 
 # Interactive terminal interface
 if __name__ == "__main__":
+    get_trace_exporter()
+    bootstrap()
+
     print("Customer Service Chatbot")
     print("=" * 50)
     print()
@@ -338,12 +1250,12 @@ if __name__ == "__main__":
             if not user_input:
                 continue
             
-            # Process the message
-            print("Processing...")
-            response = process_customer_message(user_input, username, langsmith_extra = {"metadata": {"thread_id": thread_id}})
-            
-            # Display response
-            print(f"Bot: {response}")
+            # Process the message, printing the reply as it streams in
+            print("Bot: ", end="", flush=True)
+            for chunk in process_customer_message_stream(user_input, username, langsmith_extra = {"metadata": {"thread_id": thread_id}},
+                                                         thread_id=str(thread_id)):
+                print(chunk, end="", flush=True)
+            print()
             print()
             
         except KeyboardInterrupt:
@@ -0,0 +1,140 @@
+"""Background event loop used to run the async pipeline from synchronous code"""
+import asyncio
+import concurrent.futures
+import contextvars
+import queue
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Coroutine, Iterator, List, Optional, Tuple
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_lock = threading.Lock()
+
+
+def background_loop() -> asyncio.AbstractEventLoop:
+    """Return the shared event loop, starting its thread on first use"""
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="agent-event-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def submit(coro: Coroutine[Any, Any, Any]) -> concurrent.futures.Future:
+    """Schedule a coroutine on the shared loop and return a thread-safe future.
+
+    The caller's contextvars are copied into the task so LangSmith traces nest
+    under the caller's run. Cancelling the future cancels the task.
+    """
+    loop = background_loop()
+    ctx = contextvars.copy_context()
+    future: concurrent.futures.Future = concurrent.futures.Future()
+
+    def on_done(task: asyncio.Task):
+        if future.done():
+            return
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+
+    def start():
+        task = ctx.run(loop.create_task, coro)
+        task.add_done_callback(on_done)
+        future.add_done_callback(
+            lambda f: f.cancelled() and loop.call_soon_threadsafe(task.cancel)
+        )
+
+    loop.call_soon_threadsafe(start)
+    return future
+
+
+def run_sync(coro: Coroutine[Any, Any, Any]) -> Any:
+    """Run a coroutine on the shared loop and block until it finishes.
+
+    One long-lived loop (rather than asyncio.run per call) lets async clients
+    keep their HTTP connections between calls.
+    """
+    return submit(coro).result()
+
+
+_DONE = object()
+
+
+def iterate_sync(agen: AsyncIterator[Any]) -> Iterator[Any]:
+    """Consume an async iterator on the shared loop, yielding its items to sync code"""
+    items: "queue.Queue[Any]" = queue.Queue()
+
+    async def pump():
+        try:
+            async for item in agen:
+                items.put(item)
+        finally:
+            items.put(_DONE)
+
+    future = submit(pump())
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                break
+            yield item
+        future.result()
+    finally:
+        # Stop producing if the caller abandoned the iterator early
+        future.cancel()
+
+
+class MicroBatcher:
+    """Collect single async requests into batches for one bulk call.
+
+    `submit(item)` waits until `max_batch` items are queued or `max_wait`
+    seconds pass since the first one, then `handler(items)` runs once and each
+    caller gets its own entry of the returned list. If the handler raises, every
+    caller in that batch gets the exception. Must be used from a single event loop.
+    """
+
+    def __init__(self, handler: Callable[[List[Any]], Awaitable[List[Any]]], max_batch: int = 16,
+                 max_wait: float = 0.05):
+        self.handler = handler
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.stats = {"items": 0, "batches": 0}
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        self.stats["items"] += len(batch)
+        self.stats["batches"] += 1
+        try:
+            results = await self.handler([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
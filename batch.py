@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""Process a JSONL file of customer messages offline
+
+Each input line is {"message_content": "...", "username": "...", "id": ..., "thread_id": ...}
+("id" and "thread_id" optional). Each output line is written as soon as that message
+finishes: {"id", "line", "username", "message_content", "response", "error"}.
+
+Progress is checkpointed next to the output file, so re-running the same command
+after a crash skips everything already written. Concurrent messages share LLM
+classification calls and ticket inserts are committed in groups.
+
+Usage: python batch.py messages.jsonl responses.jsonl [--concurrency 16] [--batch-size 16]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+import agent
+from async_runtime import MicroBatcher
+from rate_limiter import llm_lane
+
+DEFAULT_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))
+# Write the checkpoint after this many finished messages (and at the end)
+CHECKPOINT_EVERY = 20
+
+
+def read_checkpoint(path: str) -> Tuple[int, int]:
+    """(line, byte offset) of the first input line not known to be finished"""
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+        return checkpoint["line"], checkpoint["offset"]
+    except (OSError, ValueError, KeyError):
+        return 0, 0
+
+
+def write_checkpoint(path: str, line: int, offset: int):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"line": line, "offset": offset, "updated_at": time.time()}, f)
+    os.replace(tmp_path, path)
+
+
+def finished_lines(output_path: str) -> Set[int]:
+    """Input line numbers already in the output; drops a partially written last line"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    good_size = 0
+    with open(output_path, "rb") as f:
+        for raw in f:
+            try:
+                done.add(json.loads(raw)["line"])
+            except (ValueError, KeyError):
+                break
+            good_size += len(raw)
+    if good_size != os.path.getsize(output_path):
+        with open(output_path, "r+b") as f:
+            f.truncate(good_size)
+    return done
+
+
+def read_messages(input_path: str, start_line: int, start_offset: int) -> Iterator[Tuple[int, int, int, Optional[Dict[str, Any]]]]:
+    """Yield (line number, start offset, end offset, record) from the checkpoint on; record is None if unparsable"""
+    with open(input_path, "rb") as f:
+        f.seek(start_offset)
+        line_no, offset = start_line, start_offset
+        for raw in f:
+            if raw.strip():
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    record = None
+                yield line_no, offset, offset + len(raw), record
+            line_no += 1
+            offset += len(raw)
+
+
+class Progress:
+    """Checkpoint position: the oldest unfinished line, or the end of what has been read"""
+
+    def __init__(self, checkpoint_path: str, output, line: int, offset: int):
+        self.checkpoint_path = checkpoint_path
+        self.output = output
+        self.read_line = line
+        self.read_offset = offset
+        self.in_flight: Dict[int, int] = {}
+        self._since_save = 0
+
+    def read(self, line_no: int, end_offset: int):
+        self.read_line, self.read_offset = line_no + 1, end_offset
+
+    def start(self, line_no: int, start_offset: int):
+        self.in_flight[line_no] = start_offset
+
+    def finish(self, line_no: int):
+        self.in_flight.pop(line_no, None)
+        self._since_save += 1
+        if self._since_save >= CHECKPOINT_EVERY:
+            self.save()
+
+    def save(self):
+        if self.in_flight:
+            line = min(self.in_flight)
+            offset = self.in_flight[line]
+        else:
+            line, offset = self.read_line, self.read_offset
+        # The checkpoint must never point past output that isn't on disk yet
+        self.output.flush()
+        os.fsync(self.output.fileno())
+        write_checkpoint(self.checkpoint_path, line, offset)
+        self._since_save = 0
+
+
+async def run_batch(input_path: str, output_path: str, checkpoint_path: str, concurrency: int,
+                    batch_size: int, batch_wait: float) -> Dict[str, int]:
+    start_line, start_offset = read_checkpoint(checkpoint_path)
+    done = finished_lines(output_path)
+    counts = {"processed": 0, "skipped": 0, "errors": 0}
+
+    # Tasks copy the context when created, so every message below shares these batchers
+    classifier = MicroBatcher(agent.aclassify_with_llm, max_batch=batch_size, max_wait=batch_wait)
+    tickets = MicroBatcher(agent.acreate_tickets, max_batch=batch_size, max_wait=batch_wait)
+    agent.classification_batcher.set(classifier)
+    agent.ticket_batcher.set(tickets)
+    # Interactive turns get OpenAI budget first
+    llm_lane.set("batch")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks: Set[asyncio.Task] = set()
+
+    with open(output_path, "a") as output:
+        progress = Progress(checkpoint_path, output, start_line, start_offset)
+
+        async def one(line_no: int, record: Optional[Dict[str, Any]]):
+            result = {"id": line_no, "line": line_no, "response": None, "error": None}
+            try:
+                if record is None:
+                    result["error"] = "invalid JSON"
+                else:
+                    message_content = record.get("message_content") or record.get("message") or ""
+                    username = record.get("username") or "guest"
+                    result.update(id=record.get("id", line_no), username=username, message_content=message_content)
+                    result["response"] = await agent.aprocess_customer_message(
+                        message_content, username, record.get("thread_id"))
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+            finally:
+                semaphore.release()
+            if result["error"]:
+                counts["errors"] += 1
+                print(f"Error on line {line_no}: {result['error']}")
+            counts["processed"] += 1
+            output.write(json.dumps(result) + "\n")
+            progress.finish(line_no)
+
+        for line_no, start_offset, end_offset, record in read_messages(input_path, start_line, start_offset):
+            if line_no in done:
+                counts["skipped"] += 1
+                progress.read(line_no, end_offset)
+                continue
+            # At most `concurrency` messages are read ahead of the ones finishing
+            await semaphore.acquire()
+            progress.start(line_no, start_offset)
+            progress.read(line_no, end_offset)
+            task = asyncio.ensure_future(one(line_no, record))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.gather(*tasks)
+        progress.save()
+
+    counts["classification_batches"] = classifier.stats["batches"]
+    counts["ticket_batches"] = tickets.stats["batches"]
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="JSONL file of messages")
+    parser.add_argument("output", help="JSONL file for responses (appended to, resumed if present)")
+    parser.add_argument("--checkpoint", help="default: <output>.checkpoint")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--batch-size", type=int, default=16, help="max messages per classification call / ticket commit")
+    parser.add_argument("--batch-wait", type=float, default=0.05, help="seconds to wait for a batch to fill")
+    args = parser.parse_args()
+
+    agent.get_trace_exporter()
+    agent.bootstrap()
+    start = time.perf_counter()
+    counts = asyncio.run(run_batch(args.input, args.output, args.checkpoint or f"{args.output}.checkpoint",
+                                   args.concurrency, args.batch_size, args.batch_wait))
+    print(f"Processed {counts['processed']} messages ({counts['errors']} errors, {counts['skipped']} already done) "
+          f"in {time.perf_counter() - start:.1f}s; {counts['classification_batches']} classification calls, "
+          f"{counts['ticket_batches']} ticket commits")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""Offline end-to-end benchmark of process_customer_message against the mock server
+
+Runs the evaluation dataset messages (plus synthetic variants) through the async
+pipeline at fixed concurrency levels, with OpenAI and LangSmith replaced by
+benchmarks/mock_server.py and a throwaway sqlite database. Reports throughput,
+per-stage p50/p95/p99 latency and DB ops/sec.
+
+Usage: python benchmarks/bench_agent.py [--concurrency 1 8 32] [--scale 10] [--latency 0.3]
+                                        [--stream] [--json out.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from evaluations.example_datasets import example_inputs
+
+# Tickets referenced by the dataset messages, so ticket_info turns find something
+SEEDED_TICKETS = [
+    ("61e4e", "open", "Your reported issue", "medium"),
+    ("12345", "open", "Current issue details", "high"),
+    ("12346", "closed", "Email notification not working", "medium"),
+    ("12347", "open", "Profile page error", "low"),
+]
+
+SYNTHETIC_TEMPLATES = [
+    "what's the status of ticket {ticket_id}?",
+    "any update on {ticket_id}?",
+    "my {feature} is broken",
+    "the {feature} keeps failing since this morning",
+    "hello",
+    "thanks so much!",
+    "can you explain how billing works?",
+]
+SYNTHETIC_FEATURES = ["dashboard", "login page", "export button", "mobile app", "search", "invoice download"]
+
+USERNAME = "bench_user"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def build_messages(scale: int, seed: int = 0) -> List[str]:
+    """Dataset messages followed by `scale - 1` rounds of synthetic variants"""
+    rng = random.Random(seed)
+    messages = [message for message, _ in example_inputs]
+    ticket_ids = [ticket_id for ticket_id, *_ in SEEDED_TICKETS]
+    for _ in range(max(0, scale - 1)):
+        for _ in range(len(example_inputs)):
+            template = rng.choice(SYNTHETIC_TEMPLATES)
+            messages.append(template.format(ticket_id=rng.choice(ticket_ids),
+                                            feature=rng.choice(SYNTHETIC_FEATURES)))
+    return messages
+
+
+def start_mock_server(args) -> Tuple[str, subprocess.Popen]:
+    """Start benchmarks/mock_server.py in its own process and wait for it to listen"""
+    proc = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "benchmarks", "mock_server.py"),
+        "--port", str(args.port),
+        "--latency", str(args.latency),
+        "--token-delay", str(args.token_delay),
+        "--prompt-latency", str(args.prompt_latency),
+    ], stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{args.port}"
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"{url}/info", timeout=1).read()
+            return url, proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("Mock server did not start")
+
+
+class StageTimer:
+    """Wraps pipeline functions to record per-call latency by stage"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def wrap_async(self, stage: str, fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return wrapper
+
+    def wrap_async_iter(self, stage: str, fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                async for item in fn(*args, **kwargs):
+                    yield item
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return wrapper
+
+    def wrap_sync(self, stage: str, fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return wrapper
+
+    def reset(self):
+        with self._lock:
+            self.samples.clear()
+
+
+def instrument(agent, timer: StageTimer):
+    """Swap the agent's stage and DB functions for timed versions"""
+    agent.aclassify_request = timer.wrap_async("classify", agent.aclassify_request)
+    agent.asearch_ticket = timer.wrap_async("search_ticket", agent.asearch_ticket)
+    agent.acreate_ticket = timer.wrap_async("create_ticket", agent.acreate_ticket)
+    agent.awrite_response = timer.wrap_async("write_response", agent.awrite_response)
+    agent.awrite_response_stream = timer.wrap_async_iter("write_response", agent.awrite_response_stream)
+    agent._aget_prompt = timer.wrap_async("prompt_pull", agent._aget_prompt)
+    for name in ("lookup_ticket_record", "insert_ticket", "add_tickets", "commit_tickets"):
+        setattr(agent, name, timer.wrap_sync(f"db.{name}", getattr(agent, name)))
+
+
+async def run_level(agent, messages: List[str], concurrency: int, stream: bool, timer: StageTimer) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    errors = 0
+    classifier = agent.get_fast_classifier()
+    classified_before = dict(classifier.stats)
+
+    async def one(message: str):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                if stream:
+                    first = None
+                    async for _ in agent.aprocess_customer_message_stream(message, USERNAME):
+                        if first is None:
+                            first = time.perf_counter() - start
+                    timer.record("time_to_first_token", first or 0.0)
+                else:
+                    await agent.aprocess_customer_message(message, USERNAME)
+            except Exception as e:
+                errors += 1
+                print(f"Error processing '{message}': {e}")
+            timer.record("end_to_end", time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(message) for message in messages))
+    wall = time.perf_counter() - start
+
+    db_ops = sum(len(v) for k, v in timer.samples.items() if k.startswith("db."))
+    # This level's share of local_fraction(), which counts since startup
+    classified = classifier.stats["total"] - classified_before["total"]
+    escalated = classifier.stats["escalated"] - classified_before["escalated"]
+    return {
+        "concurrency": concurrency,
+        "messages": len(messages),
+        "errors": errors,
+        "wall_s": wall,
+        "throughput_msg_s": len(messages) / wall,
+        "db_ops_s": db_ops / wall,
+        "local_fraction": (classified - escalated) / classified if classified else 0.0,
+        "stages": {
+            stage: {
+                "count": len(values),
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+            }
+            for stage, values in sorted(timer.samples.items())
+        },
+    }
+
+
+def print_report(result: Dict[str, Any]):
+    print(f"\nconcurrency={result['concurrency']}  messages={result['messages']}  errors={result['errors']}  "
+          f"throughput={result['throughput_msg_s']:.1f} msg/s  db_ops={result['db_ops_s']:.1f}/s  "
+          f"classified_locally={result['local_fraction']:.0%}")
+    print(f"  {'stage':<22} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage, stats in result["stages"].items():
+        print(f"  {stage:<22} {stats['count']:>6} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}")
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> bool:
+    """Return False if throughput dropped or end-to-end p95 grew by more than `tolerance`"""
+    with open(baseline_path) as f:
+        baseline = {r["concurrency"]: r for r in json.load(f)["results"]}
+    ok = True
+    for result in results:
+        base = baseline.get(result["concurrency"])
+        if not base:
+            continue
+        if result["throughput_msg_s"] < base["throughput_msg_s"] * (1 - tolerance):
+            print(f"REGRESSION c={result['concurrency']}: throughput "
+                  f"{base['throughput_msg_s']:.1f} -> {result['throughput_msg_s']:.1f} msg/s")
+            ok = False
+        base_p95 = base["stages"]["end_to_end"]["p95_ms"]
+        p95 = result["stages"]["end_to_end"]["p95_ms"]
+        if p95 > base_p95 * (1 + tolerance):
+            print(f"REGRESSION c={result['concurrency']}: end_to_end p95 {base_p95:.1f} -> {p95:.1f} ms")
+            ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--scale", type=int, default=5, help="dataset copies (synthetic variants after the first)")
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--prompt-latency", type=float, default=0.1)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--stream", action="store_true", help="use the streaming pipeline")
+    parser.add_argument("--trace", action="store_true", help="send LangSmith traces to the mock server")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="baseline results file; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    url, server = start_mock_server(args)
+    tmp = tempfile.TemporaryDirectory()
+    try:
+        os.environ.update({
+            "OPENAI_API_KEY": "mock",
+            "OPENAI_BASE_URL": f"{url}/v1",
+            "LANGCHAIN_API_KEY": "mock",
+            "LANGSMITH_API_KEY": "mock",
+            "LANGSMITH_ENDPOINT": url,
+            "LANGCHAIN_ENDPOINT": url,
+            "LANGSMITH_TRACING": "true" if args.trace else "false",
+            "LANGCHAIN_TRACING_V2": "true" if args.trace else "false",
+            "PROMPT_SNAPSHOT_DIR": os.path.join(tmp.name, "prompt_snapshots"),
+        })
+        import database
+        database.DB_PATH = os.path.join(tmp.name, "bench.db")
+        import agent
+
+        if args.trace:
+            # As server.py does at startup
+            agent.get_trace_exporter()
+        database.add_user(USERNAME)
+        for ticket_id, status, description, priority in SEEDED_TICKETS:
+            database.add_ticket(ticket_id, USERNAME, status, description, priority)
+
+        messages = build_messages(args.scale)
+        timer = StageTimer()
+        instrument(agent, timer)
+
+        # Warm up the prompt cache, HTTP connections and sqlite pool before measuring
+        asyncio.run(run_level(agent, messages[:len(example_inputs)], 1, args.stream, timer))
+
+        results = []
+        for concurrency in args.concurrency:
+            timer.reset()
+            result = asyncio.run(run_level(agent, messages, concurrency, args.stream, timer))
+            print_report(result)
+            results.append(result)
+        database.close_pools()
+    finally:
+        server.terminate()
+        server.wait()
+        tmp.cleanup()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    if args.compare and not compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
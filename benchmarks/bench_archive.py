@@ -0,0 +1,166 @@
+"""Ticket lookup latency at scale with and without archival of closed tickets
+
+Fills a throwaway database with --tickets synthetic tickets spread over --users
+customers and created over the last --days days. Tickets are inserted through
+the normal triggers, so the FTS index is as large as it would be in production.
+Most older tickets are closed; recent ones are mostly open. Lookups are timed
+for tickets customers ask about (open or recent), for old closed tickets and
+for IDs that don't exist, plus history pages. Then
+database.archive_closed_tickets moves closed tickets older than --archive-after
+days to the archive file, while another thread keeps looking tickets up to show
+the migration runs online. The same lookups are timed again.
+
+Usage: python benchmarks/bench_archive.py [--tickets 10000000] [--users 1000000] [--lookups 5000]
+                                          [--archive-after 90] [--batch-size 5000]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+import database
+from bench_ticket_search import description
+
+FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def seed(count: int, users: int, days: int, rng: random.Random):
+    """Tickets with ages spread evenly over `days`; closed unless recent, by chance"""
+    now = datetime.now(timezone.utc)
+    chunk = 100_000
+    with database.get_pool().connection() as conn:
+        conn.executemany("INSERT OR IGNORE INTO users (username) VALUES (?)", [(f"customer{u}",) for u in range(users)])
+    for start in range(0, count, chunk):
+        rows = []
+        for n in range(start, min(start + chunk, count)):
+            age = rng.random() * days
+            created = now - timedelta(days=age)
+            # Tickets get resolved within a few days; the newest are still open
+            closed = rng.random() < min(0.97, age / 7)
+            updated = created + timedelta(hours=rng.random() * 72) if closed else created
+            rows.append((f"{n:07x}", f"customer{rng.randrange(users)}", "closed" if closed else "open",
+                         description(rng), "medium", created.strftime(FORMAT), min(updated, now).strftime(FORMAT)))
+        with database.get_pool().connection() as conn:
+            conn.executemany("""
+                INSERT INTO tickets (ticket_id, username, status, description, priority, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+
+
+def sample_keys(rng: random.Random, count: int, cutoff: str):
+    """(ticket_id, username) samples: hot (open or recent), cold (old and closed) and missing"""
+    with database.get_pool().connection() as conn:
+        max_rowid = conn.execute("SELECT MAX(rowid) FROM tickets").fetchone()[0]
+        hot, cold = [], []
+        while len(hot) < count or len(cold) < count:
+            row = conn.execute("SELECT ticket_id, username, status, updated_at FROM tickets WHERE rowid = ?",
+                               (rng.randrange(1, max_rowid + 1),)).fetchone()
+            if row is None:
+                continue
+            if row[2] == "closed" and row[3] < cutoff:
+                if len(cold) < count:
+                    cold.append(row[:2])
+            elif len(hot) < count:
+                hot.append(row[:2])
+    missing = [(f"z{n:06x}", f"customer{rng.randrange(1000)}") for n in range(count)]
+    return hot, cold, missing
+
+
+def timed(fn, calls) -> list:
+    samples = []
+    for args in calls:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def summary(samples: list) -> str:
+    samples = sorted(samples)
+    p99 = samples[max(0, int(len(samples) * 0.99) - 1)]
+    return f"p50 {statistics.median(samples):7.3f}  p99 {p99:7.3f}"
+
+
+def measure(hot, cold, missing, users: list) -> dict:
+    return {
+        "lookup hot (open/recent)": timed(database.lookup_ticket_record, hot),
+        "lookup old closed": timed(database.lookup_ticket_record, cold),
+        "lookup missing ID": timed(database.lookup_ticket_record, missing),
+        "history page": timed(database.get_ticket_page, [(user, 20) for user in users]),
+        "open tickets page": timed(database.get_ticket_page, [(user, 20, None, "open") for user in users]),
+    }
+
+
+def file_mb(path: str) -> float:
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p)) / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tickets", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=730, help="age of the oldest tickets")
+    parser.add_argument("--lookups", type=int, default=5000, help="lookups per kind")
+    parser.add_argument("--archive-after", type=float, default=90, help="archive closed tickets older than this")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--dir", default=None, help="directory for the database files (default: a temp dir)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        database.DB_PATH = os.path.join(tmp, "tickets.db")
+        start = time.perf_counter()
+        seed(args.tickets, args.users, args.days, rng)
+        print(f"Inserted {args.tickets} tickets for {args.users} users in {time.perf_counter() - start:.0f}s "
+              f"({file_mb(database.DB_PATH):.0f} MB)")
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=args.archive_after)).strftime(FORMAT)
+        hot, cold, missing = sample_keys(rng, args.lookups, cutoff)
+        users = [f"customer{rng.randrange(args.users)}" for _ in range(args.lookups)]
+        # Warm up, so both runs start from the same OS page cache state
+        measure(hot, cold, missing, users)
+        before = measure(hot, cold, missing, users)
+
+        # Lookups keep running during the migration; it must not stall them
+        during, stop = [], threading.Event()
+
+        def lookups():
+            while not stop.is_set():
+                during.extend(timed(database.lookup_ticket_record, rng.sample(hot, 100)))
+
+        thread = threading.Thread(target=lookups)
+        thread.start()
+        start = time.perf_counter()
+        marks = [start]
+        moved = database.archive_closed_tickets(args.archive_after, args.batch_size,
+                                                progress=lambda total: marks.append(time.perf_counter()))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        thread.join()
+        slowest = max((b - a for a, b in zip(marks, marks[1:])), default=0.0)
+        with database.get_pool().connection() as conn:
+            remaining = conn.execute("SELECT COUNT(*) FROM tickets").fetchone()[0]
+        print(f"Archived {moved} tickets in {elapsed:.0f}s; {remaining} stay hot "
+              f"(hot {file_mb(database.DB_PATH):.0f} MB incl. free pages, "
+              f"archive {file_mb(database.archive_path()):.0f} MB)")
+        print(f"{len(marks) - 1} batches, slowest {slowest * 1000:.0f} ms; "
+              f"lookups during the migration: {summary(during)} ms ({len(during)} lookups)")
+
+        measure(hot, cold, missing, users)
+        after = measure(hot, cold, missing, users)
+        print(f"{'(ms)':<26}{'before archival':>28}{'after archival':>28}")
+        for name in before:
+            print(f"{name:<26}{summary(before[name]):>28}{summary(after[name]):>28}")
+        database.close_pools()
+
+
+if __name__ == "__main__":
+    main()
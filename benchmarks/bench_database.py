@@ -0,0 +1,78 @@
+"""Micro-benchmark: ticket lookups/sec with connect-per-call vs the connection pool
+
+Usage: python benchmarks/bench_database.py [--tickets 5000] [--lookups 20000] [--threads 1 4 8]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+
+
+def lookup_unpooled(ticket_id: str, username: str):
+    """The original lookup_ticket: open, query, close on every call"""
+    conn = sqlite3.connect(database.DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT ticket_id, username, status, description, priority, created_at, updated_at
+        FROM tickets 
+        WHERE ticket_id = ? AND username = ?
+    """, (ticket_id, username))
+    result = cursor.fetchone()
+    conn.close()
+    return result
+
+
+def seed(n_tickets: int):
+    with database.get_pool().connection() as conn:
+        conn.executemany("INSERT OR IGNORE INTO users (username) VALUES (?)",
+                         [(f"user{i}",) for i in range(100)])
+        conn.executemany("""
+            INSERT INTO tickets (ticket_id, username, status, description, priority)
+            VALUES (?, ?, 'open', 'benchmark ticket', 'medium')
+        """, [(f"{i:05x}", f"user{i % 100}") for i in range(n_tickets)])
+    return [(f"{i:05x}", f"user{i % 100}") for i in range(n_tickets)]
+
+
+def run(lookup, keys, n_lookups: int, threads: int) -> float:
+    sample = [random.choice(keys) for _ in range(n_lookups)]
+    chunks = [sample[i::threads] for i in range(threads)]
+
+    def worker(chunk):
+        for ticket_id, username in chunk:
+            lookup(ticket_id, username)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(worker, chunks))
+    return n_lookups / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tickets", type=int, default=5000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "bench.db")
+        database.init_database()
+        keys = seed(args.tickets)
+
+        print(f"{'threads':>8} {'unpooled/s':>12} {'pooled/s':>12} {'speedup':>8}")
+        for threads in args.threads:
+            before = run(lookup_unpooled, keys, args.lookups, threads)
+            after = run(database.lookup_ticket, keys, args.lookups, threads)
+            print(f"{threads:>8} {before:>12.0f} {after:>12.0f} {after / before:>7.1f}x")
+        database.close_pools()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""OpenAI rate-limit benchmark: a batch job and interactive turns sharing one quota
+
+Runs against an in-process mock server that answers 429 above --rpm completions
+per minute. A batch-lane job sends --batch calls with --concurrency in flight
+while an interactive call arrives every --interval seconds. The run is repeated
+with the client-side budget off (retries only) and set to the server's limit,
+reporting 429s, failed calls and interactive latency for each.
+
+Usage: python benchmarks/bench_rate_limits.py [--rpm 600] [--batch 900] [--concurrency 64] [--interval 0.25]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from mock_server import MockServer
+
+
+async def workload(agent, batch: int, concurrency: int, interval: float):
+    from rate_limiter import llm_lane
+
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = {"batch": 0, "interactive": 0}
+    latencies = []
+
+    async def batch_call(n: int):
+        llm_lane.set("batch")
+        async with semaphore:
+            try:
+                await agent.acall_openai([{"role": "user", "content": f"batch message {n}"}])
+            except Exception:
+                failures["batch"] += 1
+
+    async def interactive_call(n: int):
+        start = time.perf_counter()
+        try:
+            await agent.acall_openai([{"role": "user", "content": f"interactive message {n}"}])
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            failures["interactive"] += 1
+
+    start = time.perf_counter()
+    batch_job = asyncio.gather(*(batch_call(n) for n in range(batch)))
+    interactive = []
+    while not batch_job.done():
+        interactive.append(asyncio.create_task(interactive_call(len(interactive))))
+        await asyncio.sleep(interval)
+    await asyncio.gather(*interactive)
+    return time.perf_counter() - start, failures, latencies
+
+
+def report(name: str, server: MockServer, elapsed: float, failures, latencies):
+    latencies = sorted(latencies) or [0.0]
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(f"{name:<16} {elapsed:6.1f}s  429s {server.requests.get('429 /chat/completions', 0):5d}  "
+          f"failed batch {failures['batch']:4d} / interactive {failures['interactive']:3d}  "
+          f"interactive p50 {statistics.median(latencies) * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms  "
+          f"max {latencies[-1] * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rpm", type=int, default=600, help="the mock server's requests-per-minute limit")
+    parser.add_argument("--batch", type=int, default=900)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--interval", type=float, default=0.25, help="seconds between interactive calls")
+    parser.add_argument("--latency", type=float, default=0.05, help="mock completion latency")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ.update({"OPENAI_API_KEY": "x", "LANGCHAIN_API_KEY": "x", "LANGSMITH_TRACING": "false",
+                       "RESPONSE_CACHE_ENABLED": "false"})
+    import database
+    database.DB_PATH = os.path.join(tmp.name, "bench.db")
+    import agent
+    from rate_limiter import RateLimiter
+
+    for name, rpm in (("retries only", 0), ("client budget", args.rpm)):
+        server = MockServer(latency=args.latency, rpm_limit=args.rpm).start()
+        os.environ["OPENAI_BASE_URL"] = server.url + "/v1"
+        limiter = RateLimiter(rpm=rpm)
+        agent.get_rate_limiter = lambda: limiter
+        elapsed, failures, latencies = asyncio.run(workload(agent, args.batch, args.concurrency, args.interval))
+        report(name, server, elapsed, failures, latencies)
+        server.shutdown()
+    database.close_pools()
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
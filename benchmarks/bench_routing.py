@@ -0,0 +1,105 @@
+"""LLM calls per turn: the classify + write_response pipeline vs single-call routing
+
+Runs the evaluation dataset messages (plus synthetic variants, as in
+bench_agent.py, and turns the local classifier leaves to the LLM) one at a
+time through aprocess_customer_message under each ROUTING_MODE, against an
+in-process mock server, and counts the chat completions every turn made.
+Turns are grouped by how they were routed: handled by the local classifier,
+or by the LLM with the intent the mock assigns.
+
+Usage: python benchmarks/bench_routing.py [--scale 3] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from bench_agent import SEEDED_TICKETS, USERNAME, build_messages
+from fast_classifier import rule_classify
+from mock_server import MockServer
+
+MODES = ("pipeline", "single_call")
+
+# Turns the local classifier leaves to the LLM: mixed signals, follow-ups without IDs, open questions
+LLM_ROUTED_MESSAGES = [
+    "I filed 12345 last week but now the export button is broken too",
+    "The dashboard is broken again, same thing as 12347 I think",
+    "is 61e4e done? the login page still errors for me",
+    "can you remind me what my last case was about?",
+    "what's your refund policy for annual plans?",
+    "do you support single sign-on with Okta?",
+    "the invoice download fails with an error on every browser",
+    "search results come back empty since the update",
+]
+
+
+async def run_mode(agent, server: MockServer, messages: List[str], groups: List[str]) -> Dict[str, list]:
+    calls: Dict[str, List[int]] = defaultdict(list)
+    latencies = []
+    for message, group in zip(messages, groups):
+        before = server.requests.get("POST /chat/completions", 0)
+        start = time.perf_counter()
+        await agent.aprocess_customer_message(message, USERNAME)
+        latencies.append(time.perf_counter() - start)
+        made = server.requests.get("POST /chat/completions", 0) - before
+        calls[group].append(made)
+        calls["all turns"].append(made)
+    calls["latency"] = latencies
+    return calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=int, default=3, help="dataset copies (synthetic variants after the first)")
+    parser.add_argument("--latency", type=float, default=0.05, help="mock completion latency")
+    args = parser.parse_args()
+
+    server = MockServer(latency=args.latency, prompt_latency=0.0).start()
+    tmp = tempfile.TemporaryDirectory()
+    os.environ.update({"OPENAI_API_KEY": "mock", "OPENAI_BASE_URL": f"{server.url}/v1", "LANGCHAIN_API_KEY": "mock",
+                       "LANGSMITH_ENDPOINT": server.url, "LANGSMITH_TRACING": "false",
+                       "RESPONSE_CACHE_ENABLED": "false",
+                       "PROMPT_SNAPSHOT_DIR": os.path.join(tmp.name, "prompt_snapshots")})
+    import database
+    database.DB_PATH = os.path.join(tmp.name, "bench.db")
+    import agent
+
+    database.add_user(USERNAME)
+    for ticket_id, status, description, priority in SEEDED_TICKETS:
+        database.add_ticket(ticket_id, USERNAME, status, description, priority)
+    messages = build_messages(args.scale) + LLM_ROUTED_MESSAGES * args.scale
+    classifier = agent.get_fast_classifier()
+    groups = [
+        "local classifier" if classifier.classify(message) is not None
+        else f"llm: {(rule_classify(message) or ('other',))[0]}"
+        for message in messages
+    ]
+
+    results = {}
+    for mode in MODES:
+        agent.ROUTING_MODE = mode
+        results[mode] = asyncio.run(run_mode(agent, server, messages, groups))
+
+    names = ["all turns"] + sorted(set(groups))
+    print(f"{len(messages)} turns; average LLM calls per turn")
+    print(f"{'':<26}" + "".join(f"{mode:>14}" for mode in MODES))
+    for name in names:
+        counts = [results[mode][name] for mode in MODES]
+        print(f"{name + f' ({len(counts[0])})':<26}" + "".join(f"{statistics.mean(c):>14.2f}" for c in counts))
+    print(f"{'p50 turn latency (ms)':<26}"
+          + "".join(f"{statistics.median(results[mode]['latency']) * 1000:>14.0f}" for mode in MODES))
+    database.close_pools()
+    server.shutdown()
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
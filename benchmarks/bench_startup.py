@@ -0,0 +1,98 @@
+"""Cold-start benchmark: `import agent` time and first-message latency
+
+Each run is a fresh interpreter (so nothing is cached in sys.modules) talking to
+benchmarks/mock_server.py with a throwaway database. Reports median/max of:
+  import_ms          `import agent`
+  bootstrap_ms       agent.bootstrap() (only with --bootstrap)
+  first_message_ms   first process_customer_message call
+  second_message_ms  a second call, i.e. the warm steady state
+
+Usage: python benchmarks/bench_startup.py [--runs 5] [--bootstrap] [--json out.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from benchmarks.bench_agent import start_mock_server
+
+CHILD = """
+import json, os, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import agent
+timings = {{"import_ms": (time.perf_counter() - start) * 1000}}
+import database
+database.DB_PATH = os.path.join({tmp!r}, "startup.db")
+if {bootstrap!r}:
+    start = time.perf_counter()
+    agent.bootstrap()
+    timings["bootstrap_ms"] = (time.perf_counter() - start) * 1000
+for key, message in (("first_message_ms", "what's the status of ticket 12345?"), ("second_message_ms", "hi there")):
+    start = time.perf_counter()
+    agent.process_customer_message(message, "startup_user")
+    timings[key] = (time.perf_counter() - start) * 1000
+print(json.dumps(timings))
+"""
+
+
+def run_child(tmp: str, bootstrap: bool, env: dict) -> dict:
+    code = CHILD.format(root=ROOT, tmp=tmp, bootstrap=bootstrap)
+    out = subprocess.run([sys.executable, "-c", code], env=env, cwd=tmp, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--bootstrap", action="store_true", help="call agent.bootstrap() before the first message")
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--prompt-latency", type=float, default=0.1)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    url, server = start_mock_server(SimpleNamespace(port=args.port, latency=args.latency, token_delay=0.0,
+                                                    prompt_latency=args.prompt_latency))
+    env = dict(os.environ,
+               OPENAI_API_KEY="mock",
+               OPENAI_BASE_URL=f"{url}/v1",
+               LANGCHAIN_API_KEY="mock",
+               LANGSMITH_API_KEY="mock",
+               LANGSMITH_ENDPOINT=url,
+               LANGCHAIN_ENDPOINT=url,
+               LANGSMITH_TRACING="false",
+               LANGCHAIN_TRACING_V2="false",
+               RESPONSE_CACHE_ENABLED="false")
+    samples = []
+    try:
+        for _ in range(args.runs):
+            # New directory per run: no prompt snapshot or database left by the previous one
+            with tempfile.TemporaryDirectory() as tmp:
+                env["PROMPT_SNAPSHOT_DIR"] = os.path.join(tmp, "prompt_snapshots")
+                samples.append(run_child(tmp, args.bootstrap, env))
+    finally:
+        server.terminate()
+        server.wait()
+
+    summary = {}
+    print(f"{'metric':<20} {'median ms':>10} {'max ms':>10}")
+    for key in samples[0]:
+        values = [sample[key] for sample in samples]
+        summary[key] = {"median_ms": statistics.median(values), "max_ms": max(values)}
+        print(f"{key:<20} {summary[key]['median_ms']:>10.1f} {summary[key]['max_ms']:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "summary": summary, "samples": samples}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
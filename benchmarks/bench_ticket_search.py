@@ -0,0 +1,109 @@
+"""Ticket full-text search benchmark at scale
+
+Fills a throwaway database with --tickets synthetic tickets spread over --users
+customers (inserted through the normal triggers, so the FTS index is built as
+it would be in production), then times database.search_tickets, the
+duplicate check used for ticket requests and ticket history pages, for random
+customers.
+
+Usage: python benchmarks/bench_ticket_search.py [--tickets 1000000] [--users 200000] [--queries 2000]
+                                               [--heavy 20000]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+import database
+
+PRODUCTS = ["printer", "laptop", "router", "monitor", "keyboard", "phone", "tablet", "headset", "camera", "charger",
+            "subscription", "invoice", "order", "package", "account", "password", "refund", "warranty", "battery", "cable"]
+PROBLEMS = ["is broken", "won't turn on", "arrived damaged", "keeps disconnecting", "was charged twice",
+            "never arrived", "stopped working", "makes a grinding noise", "shows an error", "is missing parts",
+            "can't be reset", "overheats", "is the wrong color", "is running slow", "won't sync"]
+DETAILS = ["since yesterday", "after the update", "every morning", "when it rains", "on the second floor",
+           "after two weeks", "during checkout", "at startup", "with the new firmware", "in the mobile app"]
+
+
+def description(rng: random.Random) -> str:
+    return f"My {rng.choice(PRODUCTS)} {rng.choice(PROBLEMS)} {rng.choice(DETAILS)}"
+
+
+def seed(count: int, users: int, heavy: int, rng: random.Random):
+    """`count` tickets over `users` customers; `heavy` of them belong to heavy_customer"""
+    chunk = 50_000
+    with database.get_pool().connection() as conn:
+        conn.executemany("INSERT OR IGNORE INTO users (username) VALUES (?)",
+                         [("heavy_customer",)] + [(f"customer{u}",) for u in range(users)])
+        for start in range(0, count, chunk):
+            conn.executemany(
+                "INSERT INTO tickets (ticket_id, username, status, description, priority) VALUES (?, ?, ?, ?, ?)",
+                ((f"{n:07x}", "heavy_customer" if n % (count // heavy) == 0 else f"customer{rng.randrange(users)}",
+                  rng.choice(("open", "closed")), description(rng), "medium")
+                 for n in range(start, min(start + chunk, count))),
+            )
+
+
+def timed(fn, calls) -> list:
+    samples = []
+    for args in calls:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(name: str, samples: list):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:<22} p50 {statistics.median(samples):7.3f} ms   p95 {p95:7.3f} ms   max {samples[-1]:7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tickets", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--heavy", type=int, default=20_000, help="tickets owned by a single customer")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "search.db")
+        start = time.perf_counter()
+        seed(args.tickets, args.users, args.heavy, rng)
+        elapsed = time.perf_counter() - start
+        print(f"Inserted {args.tickets} tickets for {args.users} users in {elapsed:.1f}s "
+              f"({args.tickets / elapsed:.0f}/s including FTS triggers)")
+
+        import agent
+
+        calls = [(description(rng), f"customer{rng.randrange(args.users)}") for _ in range(args.queries)]
+        report("search_tickets", timed(database.search_tickets, calls))
+        report("find_duplicate_ticket", timed(agent.find_duplicate_ticket, calls))
+        # The worst case: one customer with many tickets
+        heavy = [(description(rng), "heavy_customer") for _ in range(args.queries // 10)]
+        report("search (heavy)", timed(database.search_tickets, heavy))
+        # History pages: a random customer, then the heavy one at increasing depth
+        report("history page", timed(database.get_ticket_page, [(user, 20) for _, user in calls]))
+        cursors, cursor = [], None
+        for _ in range(min(args.heavy // 20, 500)):
+            page = database.get_ticket_page("heavy_customer", 20, cursor)
+            cursors.append(cursor)
+            cursor = page.next_cursor
+        report("history page (heavy)", timed(database.get_ticket_page, [("heavy_customer", 20, c) for c in cursors]))
+        start = time.perf_counter()
+        walked = sum(1 for _ in database.iter_user_tickets("heavy_customer"))
+        print(f"iter_user_tickets: {walked} heavy_customer tickets in {(time.perf_counter() - start) * 1000:.0f} ms")
+        database.close_pools()
+
+
+if __name__ == "__main__":
+    main()
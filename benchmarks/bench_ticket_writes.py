@@ -0,0 +1,97 @@
+"""Ticket creation during an incident spike: a commit per ticket vs the write-behind queue
+
+--reporters threads each create --tickets tickets through agent.create_ticket at
+once (new users, as when many customers report the same outage), against a
+throwaway database. This runs first with TICKET_WRITE_BEHIND off (add_user and
+ticket in one synchronous commit) and then on (journal append; a background
+writer group-commits). It reports create_ticket latency, throughput and how
+long the queue took to commit everything, and checks that every ticket is
+readable the moment create_ticket returns and stored once the queue drains.
+
+Usage: python benchmarks/bench_ticket_writes.py [--reporters 200] [--tickets 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+
+def spike(agent, database, reporters: int, tickets: int):
+    """Run the spike; returns (seconds, latencies, ticket IDs not readable right after creation)"""
+    latencies = []
+    unreadable = []
+    barrier = threading.Barrier(reporters)
+
+    def reporter(n: int):
+        username = f"reporter{n}"
+        barrier.wait()
+        for i in range(tickets):
+            start = time.perf_counter()
+            result = agent.create_ticket(f"The service is down for me, attempt {i}", username)
+            latencies.append(time.perf_counter() - start)
+            if not result["success"] or database.lookup_ticket(result["ticket_id"], username) is None:
+                unreadable.append(result.get("ticket_id"))
+
+    threads = [threading.Thread(target=reporter, args=(n,)) for n in range(reporters)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, latencies, unreadable
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reporters", type=int, default=200, help="concurrent customers reporting at once")
+    parser.add_argument("--tickets", type=int, default=5, help="tickets per customer")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ.update({"OPENAI_API_KEY": "x", "LANGCHAIN_API_KEY": "x", "LANGSMITH_TRACING": "false",
+                       "TICKET_JOURNAL_PATH": os.path.join(tmp.name, "ticket_journal.jsonl")})
+    import database
+    import agent
+    from ticket_journal import TicketWriteQueue
+
+    total = args.reporters * args.tickets
+    print(f"{args.reporters} customers x {args.tickets} tickets, created concurrently")
+    for name, write_behind in (("commit per ticket", False), ("write-behind", True)):
+        database.close_pools()
+        database.DB_PATH = os.path.join(tmp.name, f"{'queued' if write_behind else 'sync'}.db")
+        database.init_database()
+        ticket_queue = TicketWriteQueue(database.commit_tickets) if write_behind else None
+        if ticket_queue is not None:
+            database.add_pending_ticket_source(ticket_queue.pending, ticket_queue.pending_for_user)
+        agent.get_ticket_write_queue = lambda: ticket_queue
+
+        elapsed, latencies, unreadable = spike(agent, database, args.reporters, args.tickets)
+        drain = 0.0
+        if ticket_queue is not None:
+            start = time.perf_counter()
+            ticket_queue.flush(60)
+            drain = time.perf_counter() - start
+        with database.get_pool().connection() as conn:
+            stored = conn.execute("SELECT COUNT(*) FROM tickets").fetchone()[0]
+        latencies.sort()
+        print(f"{name:<18} p50 {statistics.median(latencies) * 1000:7.2f} ms  "
+              f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:7.2f} ms  "
+              f"max {latencies[-1] * 1000:7.1f} ms  {total / elapsed:8.0f} tickets/s  "
+              f"stored {stored}/{total}  unreadable {len(unreadable)}")
+        if ticket_queue is not None:
+            print(f"{'':<18} {ticket_queue.stats['commits']} group commits "
+                  f"(mean {ticket_queue.stats['committed'] / max(1, ticket_queue.stats['commits']):.0f} tickets), "
+                  f"all committed {drain * 1000:.0f} ms after the last create_ticket returned")
+            ticket_queue.close()
+    database.close_pools()
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Load test for server.py against the mock LLM backend
+
+Starts benchmarks/mock_server.py in-process and server.py as a subprocess with
+--workers worker processes and a throwaway database. It then runs --conversations
+concurrent conversations of --turns HTTP messages each, plus one WebSocket
+conversation. It reports throughput, latency, 503s (backpressure) and whether
+every conversation stayed on one worker. With --drain, SIGTERM is sent
+mid-load; every request that was accepted must still complete.
+
+Usage: python benchmarks/load_server.py [--workers 4] [--conversations 200] [--turns 3]
+                                        [--max-in-flight 64] [--latency 0.3] [--drain]
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Set
+
+import httpx
+import tornado.websocket
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from mock_server import MockServer
+
+MESSAGES = [
+    "Hi, I need help with my account",
+    "My laptop won't turn on since the update, please open a ticket",
+    "What's the status of my last case?",
+    "Thanks, that's all",
+]
+
+
+async def wait_healthy(url: str, timeout: float = 60) -> bool:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{url}/healthz")).status_code == 200:
+                    return True
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    return False
+
+
+async def conversation(client: httpx.AsyncClient, url: str, n: int, turns: int, stats: Dict[str, list],
+                       pids: Dict[str, Set[str]]):
+    thread_id = None
+    for turn in range(turns):
+        body = {"message": MESSAGES[turn % len(MESSAGES)], "username": f"loaduser{n}", "thread_id": thread_id}
+        start = time.perf_counter()
+        try:
+            response = await client.post(f"{url}/v1/messages", json=body)
+        except httpx.HTTPError as e:
+            stats["connection_errors"].append(type(e).__name__)
+            return
+        if response.status_code == 503:
+            stats["rejected"].append(turn)
+            await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+            continue
+        if response.status_code != 200:
+            stats["errors"].append(response.status_code)
+            continue
+        stats["latency"].append(time.perf_counter() - start)
+        thread_id = response.json()["thread_id"]
+        pids.setdefault(thread_id, set()).add(response.headers.get("X-Worker-Pid", "?"))
+
+
+async def websocket_conversation(url: str) -> List[str]:
+    """Two turns over one WebSocket; returns the replies"""
+    connection = await tornado.websocket.websocket_connect(url.replace("http", "ws") + "/v1/ws?username=wsuser")
+    session = json.loads(await connection.read_message())
+    replies = []
+    for message in MESSAGES[:2]:
+        await connection.write_message(json.dumps({"message": message}))
+        while True:
+            event = json.loads(await connection.read_message())
+            if event["type"] == "done":
+                replies.append(event["reply"])
+                break
+            if event["type"] == "error":
+                replies.append(f"error: {event['error']}")
+                break
+    connection.close()
+    assert session["thread_id"]
+    return replies
+
+
+async def run(args, url: str, server_process: subprocess.Popen):
+    stats: Dict[str, list] = {"latency": [], "rejected": [], "errors": [], "connection_errors": []}
+    pids: Dict[str, Set[str]] = {}
+    limits = httpx.Limits(max_connections=args.conversations, max_keepalive_connections=args.conversations)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        start = time.perf_counter()
+        load = asyncio.gather(*(conversation(client, url, n, args.turns, stats, pids)
+                                for n in range(args.conversations)))
+        ws_replies = await websocket_conversation(url)
+        if args.drain:
+            await asyncio.sleep(args.latency * 2)
+            server_process.send_signal(signal.SIGTERM)
+        await load
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(stats["latency"]) or [0.0]
+    completed = len(stats["latency"])
+    print(f"{completed} messages in {elapsed:.1f}s ({completed / elapsed:.1f}/s) from {args.conversations} "
+          f"conversations on {args.workers} workers")
+    print(f"latency p50 {statistics.median(latencies) * 1000:.0f} ms  "
+          f"p95 {latencies[max(0, int(len(latencies) * 0.95) - 1)] * 1000:.0f} ms  max {latencies[-1] * 1000:.0f} ms")
+    print(f"503 (backpressure/draining) {len(stats['rejected'])}  other errors {len(stats['errors'])}  "
+          f"connection errors {len(stats['connection_errors'])}")
+    moved = [thread_id for thread_id, seen in pids.items() if len(seen) > 1]
+    print(f"{len(pids)} conversations, {len(set().union(*pids.values())) if pids else 0} worker pids, "
+          f"{len(moved)} moved between workers")
+    print(f"WebSocket replies: {[reply[:40] for reply in ws_replies]}")
+    ok = not moved and not stats["errors"] and (args.drain or not stats["connection_errors"])
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--max-in-flight", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.3, help="mock completion latency")
+    parser.add_argument("--port", type=int, default=8181)
+    parser.add_argument("--drain", action="store_true", help="send SIGTERM mid-load")
+    args = parser.parse_args()
+
+    mock = MockServer(latency=args.latency, token_delay=0.005, prompt_latency=0.05).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, OPENAI_API_KEY="x", OPENAI_BASE_URL=f"{mock.url}/v1", LANGCHAIN_API_KEY="x",
+                   LANGSMITH_ENDPOINT=mock.url, LANGSMITH_TRACING="false", RESPONSE_CACHE_ENABLED="false",
+                   PROMPT_SNAPSHOT_DIR=os.path.join(tmp, "prompts"))
+        server_process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "server.py"), "--host", "127.0.0.1", "--port", str(args.port),
+             "--workers", str(args.workers), "--max-in-flight", str(args.max_in_flight)],
+            env=env, cwd=tmp,
+        )
+        url = f"http://127.0.0.1:{args.port}"
+        try:
+            if not asyncio.run(wait_healthy(url)):
+                print("FAILED: server never became healthy")
+                sys.exit(1)
+            ok = asyncio.run(run(args, url, server_process))
+        finally:
+            if server_process.poll() is None:
+                server_process.send_signal(signal.SIGTERM)
+            code = server_process.wait(60)
+        print(f"server exited with {code}")
+    mock.shutdown()
+    print("OK" if ok and code == 0 else "FAILED")
+    sys.exit(0 if ok and code == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
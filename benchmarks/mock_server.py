@@ -0,0 +1,292 @@
+"""Local stand-in for the OpenAI chat-completions and LangSmith prompt/run APIs
+
+Point the agent at it with:
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 LANGSMITH_ENDPOINT=http://127.0.0.1:8765
+
+Usage: python benchmarks/mock_server.py [--port 8765] [--latency 0.3] [--token-delay 0.01] [--rpm-limit 0]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fast_classifier import extract_ticket_id, rule_classify
+
+# Stand-in for write_response_prompt_v2 (same input variables as the hub prompt)
+MOCK_PROMPT_MESSAGES = [
+    ("system",
+     "You are a helpful customer service agent.\n"
+     "Intent: {intent}\nSummary: {summary}\n{context_sections}\n"
+     "Guidelines:\n{response_guidelines}"),
+    ("human", "{message_content}"),
+]
+
+CANNED_REPLY = (
+    "Thanks for reaching out! I've looked into this for you and everything is in order. "
+    "Let me know if there's anything else I can help with."
+)
+
+
+def prompt_manifest() -> Dict[str, Any]:
+    from langchain_core.load import dumpd
+    from langchain_core.prompts import ChatPromptTemplate
+
+    return dumpd(ChatPromptTemplate.from_messages(MOCK_PROMPT_MESSAGES))
+
+
+def canned_completion(messages: list) -> str:
+    """Classification prompts get a JSON classification, everything else the canned reply"""
+    content = messages[-1].get("content", "") if messages else ""
+    if isinstance(content, str) and "Messages to classify:" in content:
+        results = []
+        for index, message in re.findall(r"^\s*(\d+)\. (.*)$", content, re.M):
+            ruled = rule_classify(message)
+            results.append({
+                "index": int(index),
+                "intent": ruled[0] if ruled else "other",
+                "summary": message[:100],
+                "ticket_id": extract_ticket_id(message),
+            })
+        return json.dumps(results)
+    if isinstance(content, str) and "Classification rules" in content:
+        match = re.search(r"Content: (.*)", content)
+        message = match.group(1).strip() if match else ""
+        ruled = rule_classify(message)
+        intent = ruled[0] if ruled else "other"
+        return json.dumps({
+            "intent": intent,
+            "summary": message[:100],
+            "ticket_id": extract_ticket_id(message),
+        })
+    return CANNED_REPLY
+
+
+def routed_completion(messages: list) -> str:
+    """A routing.ROUTE_SCHEMA reply: answer directly unless a ticket must be created or looked up"""
+    message = messages[-1].get("content", "") if messages else ""
+    context = messages[0].get("content", "") if len(messages) > 1 else ""
+    ruled = rule_classify(message)
+    intent = ruled[0] if ruled else "other"
+    ticket_id = extract_ticket_id(message)
+    action = "reply"
+    if intent == "ticket_request":
+        action = "create_ticket"
+    elif intent == "ticket_info" and ticket_id and ticket_id not in context:
+        action = "lookup_ticket"
+    return json.dumps({
+        "intent": intent,
+        "summary": message[:100],
+        "ticket_id": ticket_id,
+        "action": action,
+        "reply": CANNED_REPLY if action == "reply" else None,
+    })
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; don't let Nagle delay them
+    disable_nagle_algorithm = True
+    server: "MockServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> Optional[Dict[str, Any]]:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if self.headers.get("Content-Type", "").startswith("application/json") and body:
+            return json.loads(body)
+        return None
+
+    def _send_json(self, payload: Any, status: int = 200, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.count("GET " + self.path.split("?")[0].rsplit("/", 1)[0])
+        if self.path.startswith("/commits/"):
+            time.sleep(self.server.prompt_latency)
+            self._send_json({
+                "commit_hash": "mock0000",
+                "manifest": self.server.manifest,
+                "examples": [],
+            })
+        elif self.path.startswith("/info"):
+            self._send_json({"version": "mock", "batch_ingest_config": {}})
+        elif self.path.startswith("/settings"):
+            self._send_json({"id": str(uuid.uuid4()), "tenant_handle": "-"})
+        else:
+            self._send_json({})
+
+    def do_POST(self):
+        payload = self._read_json()
+        if self.path.endswith("/chat/completions"):
+            retry_after = self.server.take_request()
+            if retry_after:
+                self.server.count("429 /chat/completions")
+                self._send_json({"error": {"message": "Rate limit reached for requests", "type": "requests",
+                                           "code": "rate_limit_exceeded"}},
+                                status=429, headers={"retry-after": f"{retry_after:.3f}"})
+                return
+            self.server.count("POST /chat/completions")
+            self._chat_completion(payload or {})
+        else:
+            # Run ingestion (/runs, /runs/batch, /runs/multipart, ...)
+            self.server.count("POST " + self.path.split("?")[0])
+            self._send_json({}, status=202)
+
+    do_PATCH = do_POST
+
+    def _chat_completion(self, payload: Dict[str, Any]):
+        if ((payload.get("response_format") or {}).get("json_schema") or {}).get("name") == "route_turn":
+            reply = routed_completion(payload.get("messages", []))
+        else:
+            reply = canned_completion(payload.get("messages", []))
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in payload.get("messages", []))
+        completion_tokens = len(reply.split())
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = payload.get("model", "gpt-4o")
+        time.sleep(self.server.latency)
+
+        if not payload.get("stream"):
+            self._send_json({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": reply},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_event(data: str):
+            event = f"data: {data}\n\n".encode()
+            self.wfile.write(f"{len(event):X}\r\n".encode() + event + b"\r\n")
+            self.wfile.flush()
+
+        words = reply.split(" ")
+        for i, word in enumerate(words):
+            delta = {"role": "assistant", "content": word if i == 0 else " " + word}
+            send_event(json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+            }))
+            time.sleep(self.server.token_delay)
+        send_event(json.dumps({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }))
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            send_event(json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            }))
+        send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class MockServer(ThreadingHTTPServer):
+    """Threaded HTTP server with configurable latency and request counters"""
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, port: int = 0, latency: float = 0.3, token_delay: float = 0.01,
+                 prompt_latency: float = 0.1, rpm_limit: int = 0):
+        super().__init__(("127.0.0.1", port), MockHandler)
+        self.latency = latency
+        # Completions per minute before answering 429 (a bucket of rpm_limit refilled continuously, as OpenAI does)
+        self.rpm_limit = rpm_limit
+        self._allowance = float(rpm_limit)
+        self._allowance_updated = time.monotonic()
+        self.token_delay = token_delay
+        self.prompt_latency = prompt_latency
+        self.manifest = prompt_manifest()
+        self.requests: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, key: str):
+        with self._lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def take_request(self) -> float:
+        """0 if a completion may be served now, else the seconds until one could be"""
+        if not self.rpm_limit:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._allowance = min(float(self.rpm_limit),
+                                  self._allowance + (now - self._allowance_updated) * self.rpm_limit / 60)
+            self._allowance_updated = now
+            if self._allowance >= 1:
+                self._allowance -= 1
+                return 0.0
+            return (1 - self._allowance) * 60 / self.rpm_limit
+
+    def start(self) -> "MockServer":
+        threading.Thread(target=self.serve_forever, name="mock-server", daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds before each completion starts")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="seconds between streamed chunks")
+    parser.add_argument("--prompt-latency", type=float, default=0.1, help="seconds per prompt pull")
+    parser.add_argument("--rpm-limit", type=int, default=0, help="completions per minute before 429s (0: none)")
+    args = parser.parse_args()
+
+    server = MockServer(args.port, args.latency, args.token_delay, args.prompt_latency, args.rpm_limit)
+    print(f"Mock OpenAI/LangSmith server listening on {server.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
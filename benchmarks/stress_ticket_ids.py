@@ -0,0 +1,114 @@
+"""Stress test for ticket ID allocation: many processes and threads creating tickets at once
+
+Every worker process shares one throwaway database and allocates IDs with its
+own TicketIdAllocator, as separate server workers would. The table is first
+seeded with random legacy `uuid4().hex[:5]` IDs so some allocated IDs collide and
+exercise the retry path. Fails (exit 1) unless every ticket was created and all
+IDs are distinct.
+
+Usage: python benchmarks/stress_ticket_ids.py [--tickets 200000] [--processes 4] [--threads 8]
+                                              [--batch 0] [--legacy 20000] [--block-size 100]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+import database
+from metrics import metrics
+from ticket_ids import TicketIdAllocator
+
+
+def worker(db_path: str, count: int, threads: int, batch: int, block_size: int, results):
+    database.DB_PATH = db_path
+    allocator = TicketIdAllocator(database.reserve_ticket_ids, block_size)
+    failures = []
+
+    def create(n: int):
+        failed = 0
+        while n > 0:
+            if batch:
+                size = min(batch, n)
+                tickets = [
+                    {"ticket_id": allocator.next_id(), "username": f"user{i % 50}", "status": "open",
+                     "description": "stress", "priority": "medium"}
+                    for i in range(size)
+                ]
+                failed += size - sum(database.add_tickets(tickets, allocator.next_id))
+            else:
+                size = 1
+                stored = database.insert_ticket(allocator.next_id(), f"user{n % 50}", "open", "stress",
+                                                "medium", allocator.next_id)
+                failed += stored is None
+            n -= size
+        failures.append(failed)
+
+    per_thread = [count // threads + (i < count % threads) for i in range(threads)]
+    pool = [threading.Thread(target=create, args=(n,)) for n in per_thread]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    retries = sum(series["value"] for series in metrics.snapshot()["counters"].get("agent_ticket_id_retries_total", []))
+    results.put({"failed": sum(failures), "retries": retries, "blocks": allocator.stats["blocks"]})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tickets", type=int, default=200_000)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8, help="threads per process")
+    parser.add_argument("--batch", type=int, default=0, help="tickets per add_tickets commit (0: one insert_ticket each)")
+    parser.add_argument("--legacy", type=int, default=20_000, help="random legacy IDs inserted first")
+    parser.add_argument("--block-size", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "stress.db")
+        legacy = {uuid.uuid4().hex[:5] for _ in range(args.legacy)}
+        database.add_tickets([
+            {"ticket_id": ticket_id, "username": "legacy", "status": "closed", "description": "legacy",
+             "priority": "low"}
+            for ticket_id in legacy
+        ])
+        database.close_pools()
+
+        results = multiprocessing.Queue()
+        per_process = [args.tickets // args.processes + (i < args.tickets % args.processes)
+                       for i in range(args.processes)]
+        start = time.perf_counter()
+        processes = [
+            multiprocessing.Process(target=worker, args=(database.DB_PATH, n, args.threads, args.batch,
+                                                         args.block_size, results))
+            for n in per_process
+        ]
+        for process in processes:
+            process.start()
+        reports = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+        with database.get_pool().connection() as conn:
+            total, distinct = conn.execute("SELECT COUNT(*), COUNT(DISTINCT ticket_id) FROM tickets").fetchone()
+            created = conn.execute("SELECT COUNT(*) FROM tickets WHERE description = 'stress'").fetchone()[0]
+        database.close_pools()
+
+    failed = sum(report["failed"] for report in reports)
+    print(f"{created} tickets in {elapsed:.1f}s ({created / elapsed:.0f}/s) from {args.processes} processes "
+          f"x {args.threads} threads; {sum(r['blocks'] for r in reports)} blocks reserved, "
+          f"{sum(r['retries'] for r in reports)} collisions with {len(legacy)} legacy IDs retried, {failed} failures")
+    ok = failed == 0 and created == args.tickets and total == distinct == created + len(legacy)
+    print("OK" if ok else f"FAILED: expected {args.tickets} new tickets, {total} rows / {distinct} distinct IDs")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""Per-thread conversation memory with a token budget, in memory or backed by sqlite"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from fast_classifier import extract_ticket_id
+from token_count import count_tokens
+
+DEFAULT_MAX_THREADS = int(os.getenv("CONVERSATION_MAX_THREADS", "1000"))
+DEFAULT_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "1000"))
+# Share of the budget the rolling summary of dropped turns may use
+SUMMARY_SHARE = 0.25
+# Longest excerpt of a dropped turn kept in the summary
+SUMMARY_LINE_CHARS = 120
+
+
+class Turn:
+    __slots__ = ("role", "content", "tokens")
+
+    def __init__(self, role: str, content: str, tokens: int):
+        self.role = role
+        self.content = content
+        self.tokens = tokens
+
+
+class Thread:
+    """Recent turns plus a summary of the turns that no longer fit the budget"""
+    __slots__ = ("summary", "summary_tokens", "turns", "last_ticket_id")
+
+    def __init__(self, summary: str = "", turns: Optional[List[Turn]] = None, last_ticket_id: Optional[str] = None):
+        self.summary = summary
+        self.summary_tokens = count_tokens(summary) if summary else 0
+        self.turns = turns or []
+        self.last_ticket_id = last_ticket_id
+
+    @property
+    def tokens(self) -> int:
+        return self.summary_tokens + sum(turn.tokens for turn in self.turns)
+
+    def render(self) -> str:
+        """Conversation text for prompts (empty for a new thread)"""
+        lines = []
+        if self.summary:
+            lines.append(f"Earlier in this conversation:\n{self.summary}")
+        lines.extend(f"{turn.role}: {turn.content}" for turn in self.turns)
+        return "\n".join(lines)
+
+
+def _excerpt(turn: Turn) -> str:
+    """One line standing in for a dropped turn: its first sentence, clipped"""
+    first = re.split(r"(?<=[.!?])\s", turn.content.strip(), maxsplit=1)[0]
+    if len(first) > SUMMARY_LINE_CHARS:
+        first = first[:SUMMARY_LINE_CHARS].rstrip() + "..."
+    return f"- {turn.role}: {first}"
+
+
+class ConversationMemory:
+    """In-memory conversation store keyed by thread_id.
+
+    At most `max_threads` threads are kept (least recently used first out).
+    Each thread stays within `token_budget` tokens: once it would go over, the
+    oldest turns are folded into a short extractive summary, and the summary
+    itself is clipped to SUMMARY_SHARE of the budget, so prompts built from
+    render() stay bounded however long the conversation runs.
+    """
+
+    def __init__(self, max_threads: int = DEFAULT_MAX_THREADS, token_budget: int = DEFAULT_TOKEN_BUDGET):
+        self.max_threads = max_threads
+        self.token_budget = token_budget
+        self._threads: "OrderedDict[str, Thread]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.stats = {"turns": 0, "compactions": 0, "evictions": 0}
+
+    def get(self, thread_id: str) -> Thread:
+        """The thread's current state (a new, empty thread if unknown)"""
+        with self._lock:
+            thread = self._threads.get(thread_id)
+            if thread is None:
+                thread = self._load(thread_id) or Thread()
+                self._threads[thread_id] = thread
+                self._evict()
+            else:
+                self._threads.move_to_end(thread_id)
+            return thread
+
+    def context(self, thread_id: Optional[str]) -> str:
+        """render() of the thread, or "" without a thread_id"""
+        if not thread_id:
+            return ""
+        with self._lock:
+            return self.get(thread_id).render()
+
+    def last_ticket_id(self, thread_id: Optional[str]) -> Optional[str]:
+        """Most recent ticket ID mentioned or created in the thread"""
+        if not thread_id:
+            return None
+        with self._lock:
+            return self.get(thread_id).last_ticket_id
+
+    def append(self, thread_id: str, role: str, content: str, ticket_id: Optional[str] = None):
+        """Add a turn, remembering `ticket_id` (or one found in the text) as the thread's last ticket"""
+        ticket_id = ticket_id or extract_ticket_id(content)
+        with self._lock:
+            thread = self.get(thread_id)
+            turn = Turn(role, content, count_tokens(f"{role}: {content}"))
+            thread.turns.append(turn)
+            if ticket_id:
+                thread.last_ticket_id = ticket_id
+            self.stats["turns"] += 1
+            dropped = self._compact(thread)
+            self._save(thread_id, thread, turn, dropped)
+
+    def clear(self, thread_id: str):
+        with self._lock:
+            self._threads.pop(thread_id, None)
+            self._delete(thread_id)
+
+    def __len__(self) -> int:
+        return len(self._threads)
+
+    def _compact(self, thread: Thread) -> int:
+        """Fold the oldest turns into the summary until the thread fits; returns how many were dropped"""
+        dropped = 0
+        # Always keep the newest turn verbatim, clipping it if it alone is over budget
+        while thread.tokens > self.token_budget and len(thread.turns) > 1:
+            turn = thread.turns.pop(0)
+            thread.summary = f"{thread.summary}\n{_excerpt(turn)}".strip()
+            thread.summary = self._clip(thread.summary, int(self.token_budget * SUMMARY_SHARE), keep_end=True)
+            thread.summary_tokens = count_tokens(thread.summary)
+            dropped += 1
+        if thread.tokens > self.token_budget and thread.turns:
+            turn = thread.turns[0]
+            turn.content = self._clip(turn.content, max(1, self.token_budget - thread.summary_tokens - 8))
+            turn.tokens = count_tokens(f"{turn.role}: {turn.content}")
+        if dropped:
+            self.stats["compactions"] += 1
+        return dropped
+
+    @staticmethod
+    def _clip(text: str, max_tokens: int, keep_end: bool = False) -> str:
+        """Trim text to roughly `max_tokens`, dropping whole lines from the front (keep_end) or words from the back"""
+        if count_tokens(text) <= max_tokens:
+            return text
+        if keep_end:
+            lines = text.split("\n")
+            while len(lines) > 1 and count_tokens("\n".join(lines)) > max_tokens:
+                lines.pop(0)
+            text = "\n".join(lines)
+            if count_tokens(text) <= max_tokens:
+                return text
+        words = text.split(" ")
+        while len(words) > 1 and count_tokens(" ".join(words) + "...") > max_tokens:
+            words = words[: max(1, len(words) * 3 // 4)]
+        return " ".join(words) + "..."
+
+    def _evict(self):
+        while len(self._threads) > self.max_threads:
+            self._threads.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    # Persistence hooks (no-ops for the in-memory store)
+    def _load(self, thread_id: str) -> Optional[Thread]:
+        return None
+
+    def _save(self, thread_id: str, thread: Thread, turn: Turn, dropped: int):
+        pass
+
+    def _delete(self, thread_id: str):
+        pass
+
+
+class SQLiteConversationMemory(ConversationMemory):
+    """ConversationMemory that writes through to sqlite, so threads survive restarts.
+
+    The in-memory LRU acts as a cache in front of the file; threads evicted from
+    it are reloaded on their next turn. The file keeps at most `max_threads`
+    threads too, dropping the least recently updated.
+    """
+
+    def __init__(self, path: str, max_threads: int = DEFAULT_MAX_THREADS,
+                 token_budget: int = DEFAULT_TOKEN_BUDGET):
+        super().__init__(max_threads, token_budget)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS conversation_threads (
+                thread_id TEXT PRIMARY KEY,
+                summary TEXT NOT NULL DEFAULT '',
+                last_ticket_id TEXT,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS conversation_turns (
+                thread_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                PRIMARY KEY (thread_id, seq)
+            );
+            CREATE INDEX IF NOT EXISTS idx_conversation_threads_updated ON conversation_threads (updated_at);
+        """)
+        self._conn.commit()
+
+    def _load(self, thread_id: str) -> Optional[Thread]:
+        row = self._conn.execute(
+            "SELECT summary, last_ticket_id FROM conversation_threads WHERE thread_id = ?", (thread_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        turns = [
+            Turn(role, content, tokens)
+            for role, content, tokens in self._conn.execute(
+                "SELECT role, content, tokens FROM conversation_turns WHERE thread_id = ? ORDER BY seq", (thread_id,)
+            )
+        ]
+        return Thread(summary=row[0], turns=turns, last_ticket_id=row[1])
+
+    def _save(self, thread_id: str, thread: Thread, turn: Turn, dropped: int):
+        with self._conn:
+            self._conn.execute("""
+                INSERT INTO conversation_threads (thread_id, summary, last_ticket_id, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (thread_id) DO UPDATE SET
+                    summary = excluded.summary, last_ticket_id = excluded.last_ticket_id, updated_at = excluded.updated_at
+            """, (thread_id, thread.summary, thread.last_ticket_id, time.time()))
+            if dropped:
+                # Turns shifted (and the oldest kept one may be clipped): rewrite the short thread
+                self._conn.execute("DELETE FROM conversation_turns WHERE thread_id = ?", (thread_id,))
+                rows = [(thread_id, seq, t.role, t.content, t.tokens) for seq, t in enumerate(thread.turns)]
+            else:
+                rows = [(thread_id, len(thread.turns) - 1, turn.role, turn.content, turn.tokens)]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO conversation_turns (thread_id, seq, role, content, tokens) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            stale = [row[0] for row in self._conn.execute(
+                "SELECT thread_id FROM conversation_threads ORDER BY updated_at DESC LIMIT -1 OFFSET ?",
+                (self.max_threads,),
+            )]
+            for stale_id in stale:
+                self._delete_rows(stale_id)
+
+    def _delete(self, thread_id: str):
+        with self._conn:
+            self._delete_rows(thread_id)
+
+    def _delete_rows(self, thread_id: str):
+        self._conn.execute("DELETE FROM conversation_threads WHERE thread_id = ?", (thread_id,))
+        self._conn.execute("DELETE FROM conversation_turns WHERE thread_id = ?", (thread_id,))
+
+
+def create_memory(backend: Optional[str] = None, path: Optional[str] = None) -> ConversationMemory:
+    """Build the store selected by CONVERSATION_BACKEND ("memory" or "sqlite") / CONVERSATION_DB"""
+    backend = backend or os.getenv("CONVERSATION_BACKEND", "memory")
+    if backend == "sqlite":
+        return SQLiteConversationMemory(path or os.getenv("CONVERSATION_DB", "conversations.db"))
+    return ConversationMemory()
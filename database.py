@@ -1,14 +1,225 @@
 """SQLite database setup and operations for customer service chatbot"""
+import base64
+import functools
+import itertools
 import sqlite3
 import os
-from typing import List, Dict, Optional
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List, Dict, NamedTuple, Optional, Set, Tuple
+from metrics import metrics
 
 # Database file path
 DB_PATH = "customer_service.db"
 
+# Connection pool settings
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHED_STATEMENTS = int(os.getenv("DB_CACHED_STATEMENTS", "128"))
+
+
+class ConnectionPool:
+    """Reusable SQLite connections in WAL mode.
+
+    A thread checks out one connection for the duration of a `connection()`
+    block (nested blocks in the same thread reuse it). At most `pool_size`
+    connections exist; extra threads wait until one is returned. Connections
+    stay open, so sqlite's per-connection statement cache lets repeated
+    queries skip re-preparing their SQL.
+    """
+
+    def __init__(self, db_path: str, pool_size: int = DB_POOL_SIZE,
+                 busy_timeout_ms: int = DB_BUSY_TIMEOUT_MS,
+                 cached_statements: int = DB_CACHED_STATEMENTS):
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self._idle: List[sqlite3.Connection] = []
+        self._all: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection; commit on success, roll back on error"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            # Nested use in the same thread shares the outer transaction
+            yield conn
+            return
+
+        self._slots.acquire()
+        try:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._connect()
+                with self._lock:
+                    self._all.append(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+        self._local.conn = conn
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except sqlite3.ProgrammingError:
+            # Connection was closed underneath us; don't return it to the pool
+            broken = True
+            raise
+        finally:
+            self._local.conn = None
+            if not broken and conn.in_transaction:
+                # An error, or a KeyboardInterrupt / cancellation, left the transaction open
+                try:
+                    conn.rollback()
+                except sqlite3.Error:
+                    broken = True
+            with self._lock:
+                if broken:
+                    self._all.remove(conn)
+                else:
+                    self._idle.append(conn)
+            if broken:
+                conn.close()
+            self._slots.release()
+
+    @contextmanager
+    def standalone_connection(self):
+        """A new connection outside the pool and the thread's transaction, committed on its own"""
+        conn = self._connect()
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def close(self):
+        """Close every idle connection"""
+        with self._lock:
+            for conn in self._idle:
+                conn.close()
+                self._all.remove(conn)
+            self._idle.clear()
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Return the connection pool for the current DB_PATH, creating the schema on first use"""
+    pool = _pools.get(DB_PATH)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(DB_PATH)
+            if pool is None:
+                pool = ConnectionPool(DB_PATH)
+                with pool.connection() as conn:
+                    _create_schema(conn)
+                _pools[DB_PATH] = pool
+    return pool
+
+
+def close_pools():
+    """Close all pooled connections (e.g. on shutdown or before deleting the db file)"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+        _known_users.clear()
+
+
+# Users known to be in each database's users table (rows are never deleted), so
+# ticket writes can skip their INSERT OR IGNORE
+_known_users: Dict[str, Set[str]] = {}
+
+
+def _unknown_users(usernames: Iterable[str]) -> List[str]:
+    """The distinct usernames not yet known to be in the users table, in order"""
+    known = _known_users.get(DB_PATH, set())
+    return [username for username in dict.fromkeys(usernames) if username not in known]
+
+
+def _remember_users(usernames: Iterable[str]):
+    """Mark usernames as stored; call after the transaction inserting them committed"""
+    _known_users.setdefault(DB_PATH, set()).update(usernames)
+
+
+class TicketRecord(NamedTuple):
+    """One row of the tickets table"""
+    ticket_id: str
+    username: str
+    status: str
+    description: str
+    priority: str
+    created_at: str
+    updated_at: str
+
+
+# Callbacks run with a ticket_id whenever that ticket's row is written
+_ticket_listeners: List[Callable[[str], None]] = []
+
+
+def on_ticket_change(callback: Callable[[str], None]):
+    """Register a callback (e.g. a cache invalidation) for ticket writes"""
+    _ticket_listeners.append(callback)
+
+
+def _notify_ticket_change(ticket_id: str):
+    for callback in _ticket_listeners:
+        try:
+            callback(ticket_id)
+        except Exception as e:
+            print(f"Error in ticket change listener: {e}")
+
+
+# Tickets accepted but not yet committed (ticket_journal.TicketWriteQueue), which
+# reads must still find. Each source is a pair of callables: the pending row for
+# (ticket_id, username), and all of a user's pending rows
+_pending_ticket_sources: List[Tuple[Callable[[str, str], Optional[TicketRecord]],
+                                    Callable[[str], List[TicketRecord]]]] = []
+
+
+def add_pending_ticket_source(lookup: Callable[[str, str], Optional[TicketRecord]],
+                              user_tickets: Callable[[str], List[TicketRecord]]):
+    """Register a source of uncommitted tickets for lookups, history pages and searches to read"""
+    _pending_ticket_sources.append((lookup, user_tickets))
+
+
+def _pending_user_tickets(username: str, status: Optional[str] = None) -> List[TicketRecord]:
+    """The user's uncommitted tickets (optionally only those with `status`), newest first"""
+    tickets = [ticket for _, user_tickets in _pending_ticket_sources for ticket in user_tickets(username)
+               if not status or ticket.status == status]
+    return sorted(tickets, key=lambda ticket: ticket.created_at, reverse=True)
+
+
 def init_database():
     """Initialize SQLite db with users and tickets tables"""
-    conn = sqlite3.connect(DB_PATH)
+    with get_pool().connection() as conn:
+        _create_schema(conn)
+    print("Database initialized successfully")
+
+
+def _create_schema(conn: sqlite3.Connection):
     cursor = conn.cursor()
     #users table
     cursor.execute("""
@@ -31,104 +242,697 @@ def init_database():
         )
     """)
     
-    # Create index for faster lookups
+    # A user's tickets in history order (rowid is implicitly the last column, breaking
+    # ties between tickets created in the same second); also serves plain username lookups
     cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_tickets_username 
-        ON tickets (username)
+        CREATE INDEX IF NOT EXISTS idx_tickets_username_created
+        ON tickets (username, created_at)
     """)
-    
-    conn.commit()
-    conn.close()
-    print("Database initialized successfully")
+    # Superseded by the index above, whose first column it duplicates
+    cursor.execute("DROP INDEX IF EXISTS idx_tickets_username")
 
+    # Full-text index over ticket descriptions (and usernames, so a search can be
+    # narrowed to one customer inside the index), kept in sync by triggers
+    fts_exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tickets_fts'"
+    ).fetchone()
+    cursor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS tickets_fts USING fts5(
+            description, username,
+            content='tickets', content_rowid='rowid', tokenize='{FTS_TOKENIZER}'
+        )
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS tickets_fts_insert AFTER INSERT ON tickets BEGIN
+            INSERT INTO tickets_fts (rowid, description, username)
+            VALUES (new.rowid, new.description, new.username);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS tickets_fts_delete AFTER DELETE ON tickets BEGIN
+            INSERT INTO tickets_fts (tickets_fts, rowid, description, username)
+            VALUES ('delete', old.rowid, old.description, old.username);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS tickets_fts_update AFTER UPDATE OF description, username ON tickets BEGIN
+            INSERT INTO tickets_fts (tickets_fts, rowid, description, username)
+            VALUES ('delete', old.rowid, old.description, old.username);
+            INSERT INTO tickets_fts (rowid, description, username)
+            VALUES (new.rowid, new.description, new.username);
+        END
+    """)
+    if not fts_exists:
+        # Index tickets created before the index existed
+        cursor.execute("INSERT INTO tickets_fts (tickets_fts) VALUES ('rebuild')")
+
+    # Shared counters for ticket_ids.TicketIdAllocator blocks
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS id_sequences (
+            name TEXT PRIMARY KEY,
+            next_value INTEGER NOT NULL
+        )
+    """)
+
+@metrics.timed("agent_db_latency_seconds", stage="add_user")
 def add_user(username: str) -> bool:
     """Add a new user to the database"""
+    if not _unknown_users([username]):
+        return True
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("INSERT OR IGNORE INTO users (username) VALUES (?)", (username,))
-        conn.commit()
-        conn.close()
+        with get_pool().connection() as conn:
+            conn.execute("INSERT OR IGNORE INTO users (username) VALUES (?)", (username,))
+        _remember_users([username])
         return True
     except Exception as e:
         print(f"Error adding user: {e}")
+        metrics.inc("agent_errors_total", stage="add_user")
         return False
 
+@metrics.timed("agent_db_latency_seconds", stage="add_ticket")
 def add_ticket(ticket_id: str, username: str, status: str, description: str, priority: str) -> bool:
     """Add a new ticket to the database"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO tickets (ticket_id, username, status, description, priority)
-            VALUES (?, ?, ?, ?, ?)
-        """, (ticket_id, username, status, description, priority))
-        conn.commit()
-        conn.close()
+        with get_pool().connection() as conn:
+            conn.execute("""
+                INSERT INTO tickets (ticket_id, username, status, description, priority)
+                VALUES (?, ?, ?, ?, ?)
+            """, (ticket_id, username, status, description, priority))
+        _notify_ticket_change(ticket_id)
         return True
     except Exception as e:
         print(f"Error adding ticket: {e}")
+        metrics.inc("agent_errors_total", stage="add_ticket")
         return False
 
-def lookup_ticket(ticket_id: str, username: str) -> Optional[Dict]:
-    """Look up a ticket by ticket_id and username"""
+# Attempts per ticket when its ID turns out to be taken
+MAX_TICKET_ID_ATTEMPTS = 8
+
+
+def _insert_ticket(conn: sqlite3.Connection, ticket: Dict[str, str]):
+    """INSERT one ticket; IntegrityError if its ID is taken (see _id_taken).
+
+    IDs are unique across the hot and archive tables; the archive is only checked if
+    it is attached to `conn` (see _attach_archive, which can't run inside a transaction).
+    """
+    if _archived_ticket(conn, ticket["ticket_id"]) is not None:
+        raise sqlite3.IntegrityError("UNIQUE constraint failed: tickets.ticket_id (archived ticket)")
+    conn.execute("""
+        INSERT INTO tickets (ticket_id, username, status, description, priority)
+        VALUES (?, ?, ?, ?, ?)
+    """, (ticket["ticket_id"], ticket["username"], ticket["status"],
+          ticket["description"], ticket["priority"]))
+
+
+def _id_taken(error: sqlite3.IntegrityError) -> bool:
+    return "tickets.ticket_id" in str(error)
+
+
+def _begin_write(conn: sqlite3.Connection):
+    """Take the write lock up front for a transaction that reads (the archive) before it writes.
+
+    A deferred transaction that has read can't upgrade to a write once another
+    connection has committed; sqlite fails it at once with "database is locked"
+    instead of waiting out the busy timeout.
+    """
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+
+
+@metrics.timed("agent_db_latency_seconds", stage="reserve_ticket_ids")
+def reserve_ticket_ids(count: int, name: str = "ticket_id") -> int:
+    """Claim `count` consecutive sequence numbers for ticket IDs; returns the first.
+
+    The claim is committed on a connection of its own, so a caller's transaction
+    rolling back can't undo it while the block is in use. Don't call this inside
+    a write transaction: it would wait for that transaction's lock.
+    """
+    with get_pool().standalone_connection() as conn:
+        # Write before reading so the transaction holds the write lock throughout
+        conn.execute("INSERT OR IGNORE INTO id_sequences (name, next_value) VALUES (?, 0)", (name,))
+        conn.execute("UPDATE id_sequences SET next_value = next_value + ? WHERE name = ?", (count, name))
+        end = conn.execute("SELECT next_value FROM id_sequences WHERE name = ?", (name,)).fetchone()[0]
+    return end - count
+
+@metrics.timed("agent_db_latency_seconds", stage="insert_ticket")
+def insert_ticket(ticket_id: str, username: str, status: str, description: str, priority: str,
+                  next_id: Callable[[], str]) -> Optional[str]:
+    """Add the user and ticket in one commit, retrying under next_id() if ticket_id is taken.
+
+    Returns the ticket ID actually stored, or None on failure.
+    """
+    ticket = {"ticket_id": ticket_id, "username": username, "status": status,
+              "description": description, "priority": priority}
+    try:
+        for attempt in range(MAX_TICKET_ID_ATTEMPTS):
+            try:
+                with get_pool().connection() as conn:
+                    _attach_archive(conn)
+                    _begin_write(conn)
+                    if _unknown_users([username]):
+                        conn.execute("INSERT OR IGNORE INTO users (username) VALUES (?)", (username,))
+                    _insert_ticket(conn, ticket)
+                break
+            except sqlite3.IntegrityError as e:
+                if not _id_taken(e) or attempt == MAX_TICKET_ID_ATTEMPTS - 1:
+                    raise
+                metrics.inc("agent_ticket_id_retries_total")
+                # After the rollback: next_id() may reserve a block, which needs the write lock
+                ticket["ticket_id"] = next_id()
+        _remember_users([username])
+    except Exception as e:
+        print(f"Error adding ticket: {e}")
+        metrics.inc("agent_errors_total", stage="insert_ticket")
+        return None
+    _notify_ticket_change(ticket["ticket_id"])
+    return ticket["ticket_id"]
+
+@metrics.timed("agent_db_latency_seconds", stage="add_tickets")
+def add_tickets(tickets: List[Dict[str, str]], next_id: Optional[Callable[[], str]] = None) -> List[bool]:
+    """Add users and tickets in one transaction (one commit for the whole group).
+
+    Each dict has ticket_id, username, status, description and priority. With
+    `next_id`, tickets whose IDs are taken are retried under new ones (written
+    back into their dicts) in a follow-up commit; any other failing row is
+    skipped without losing the rest.
+    """
+    inserted = [False] * len(tickets)
+    remaining = list(range(len(tickets)))
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("""
+        for attempt in range(MAX_TICKET_ID_ATTEMPTS):
+            written, taken = [], []
+            with get_pool().connection() as conn:
+                _attach_archive(conn)
+                _begin_write(conn)
+                users = _unknown_users(tickets[i]["username"] for i in remaining)
+                conn.executemany("INSERT OR IGNORE INTO users (username) VALUES (?)", [(user,) for user in users])
+                for i in remaining:
+                    try:
+                        _insert_ticket(conn, tickets[i])
+                        written.append(i)
+                    except sqlite3.IntegrityError as e:
+                        if next_id is not None and _id_taken(e) and attempt < MAX_TICKET_ID_ATTEMPTS - 1:
+                            taken.append(i)
+                            continue
+                        print(f"Error adding ticket {tickets[i]['ticket_id']}: {e}")
+                        metrics.inc("agent_errors_total", stage="add_tickets")
+            _remember_users(users)
+            for i in written:
+                inserted[i] = True
+                _notify_ticket_change(tickets[i]["ticket_id"])
+            if not taken:
+                break
+            # New IDs only once committed: next_id() may reserve a block, which needs the write lock
+            for i in taken:
+                metrics.inc("agent_ticket_id_retries_total")
+                tickets[i]["ticket_id"] = next_id()
+            remaining = taken
+    except Exception as e:
+        print(f"Error adding tickets: {e}")
+        metrics.inc("agent_errors_total", stage="add_tickets")
+    return inserted
+
+@metrics.timed("agent_db_latency_seconds", stage="commit_tickets")
+def commit_tickets(tickets: List[TicketRecord]) -> List[bool]:
+    """Write tickets whose IDs were already handed out, with their users, in one transaction.
+
+    A ticket_id that is already stored counts as written when the stored row is the
+    same ticket (a journal replayed after a crash); a different row there is logged
+    and reported as False. Errors from the transaction itself are raised, and then
+    nothing was written.
+    """
+    written = []
+    with get_pool().connection() as conn:
+        _attach_archive(conn)
+        _begin_write(conn)
+        users = _unknown_users(ticket.username for ticket in tickets)
+        conn.executemany("INSERT OR IGNORE INTO users (username) VALUES (?)", [(user,) for user in users])
+        for ticket in tickets:
+            archived = _archived_ticket(conn, ticket.ticket_id)
+            if archived is not None:
+                # Already archived: this ticket (replayed long after), or an ID collision
+                same = (archived[0], archived[1]) == (ticket.username, ticket.created_at)
+                if not same:
+                    print(f"Error adding ticket {ticket.ticket_id}: the ID belongs to an archived ticket")
+                    metrics.inc("agent_errors_total", stage="commit_tickets")
+                written.append(same)
+                continue
+            cursor = conn.execute("""
+                INSERT INTO tickets (ticket_id, username, status, description, priority, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (ticket_id) DO NOTHING
+            """, ticket)
+            if cursor.rowcount:
+                written.append(True)
+                continue
+            stored = conn.execute("SELECT username, description FROM tickets WHERE ticket_id = ?",
+                                  (ticket.ticket_id,)).fetchone()
+            same = stored == (ticket.username, ticket.description)
+            if not same:
+                print(f"Error adding ticket {ticket.ticket_id}: the ID belongs to another ticket")
+                metrics.inc("agent_errors_total", stage="commit_tickets")
+            written.append(same)
+    _remember_users(users)
+    for ticket, ok in zip(tickets, written):
+        if ok:
+            _notify_ticket_change(ticket.ticket_id)
+    return written
+
+
+def ticket_id_exists(ticket_id: str) -> bool:
+    """Whether any user's ticket, hot or archived, has this ID (errors are raised)"""
+    with get_pool().connection() as conn:
+        if conn.execute("SELECT 1 FROM tickets WHERE ticket_id = ?", (ticket_id,)).fetchone() is not None:
+            return True
+        return _attach_archive(conn) and conn.execute(
+            "SELECT 1 FROM archive.tickets WHERE ticket_id = ?", (ticket_id,)).fetchone() is not None
+
+@metrics.timed("agent_db_latency_seconds", stage="lookup_ticket")
+def lookup_ticket_record(ticket_id: str, username: str) -> Optional[TicketRecord]:
+    """Look up a ticket by ticket_id and username (errors are raised, not swallowed)"""
+    for lookup, _ in _pending_ticket_sources:
+        pending = lookup(ticket_id, username)
+        if pending is not None:
+            return pending
+    with get_pool().connection() as conn:
+        result = conn.execute("""
             SELECT ticket_id, username, status, description, priority, created_at, updated_at
             FROM tickets 
             WHERE ticket_id = ? AND username = ?
-        """, (ticket_id, username))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        if result:
-            return {
-                'ticket_id': result[0],
-                'username': result[1],
-                'status': result[2],
-                'description': result[3],
-                'priority': result[4],
-                'created_at': result[5],
-                'updated_at': result[6]
-            }
-        return None
+        """, (ticket_id, username)).fetchone()
+        if result is None and _attach_archive(conn):
+            # Not a hot ticket: it may be a closed one that was archived
+            result = conn.execute("""
+                SELECT ticket_id, username, status, description, priority, created_at, updated_at
+                FROM archive.tickets
+                WHERE ticket_id = ? AND username = ?
+            """, (ticket_id, username)).fetchone()
+            metrics.inc("agent_ticket_archive_lookups_total", result="hit" if result else "miss")
+    return TicketRecord(*result) if result else None
+
+def lookup_ticket(ticket_id: str, username: str) -> Optional[Dict]:
+    """Look up a ticket by ticket_id and username"""
+    try:
+        record = lookup_ticket_record(ticket_id, username)
+        return record._asdict() if record else None
     except Exception as e:
         print(f"Error looking up ticket: {e}")
+        metrics.inc("agent_errors_total", stage="lookup_ticket")
         return None
 
-def get_user_tickets(username: str) -> List[Dict]:
-    """Get all tickets for a specific user"""
+class TicketPage(NamedTuple):
+    """One page of a user's ticket history, newest first"""
+    tickets: List[TicketRecord]
+    # Pass back to get_ticket_page for the next (older) page; None on the last page
+    next_cursor: Optional[str]
+
+
+# Most tickets returned by one get_ticket_page call
+MAX_PAGE_SIZE = 500
+
+
+def _encode_cursor(created_at: str, rowid: int, tier: str = "main") -> str:
+    position = f"{created_at}|{rowid}" if tier == "main" else f"{tier}|{created_at}|{rowid}"
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, str, int]:
+    """(tier, created_at, rowid): the page continues in the hot table ("main") or the archive"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT ticket_id, status, description, priority, created_at, updated_at
-            FROM tickets 
-            WHERE username = ?
-            ORDER BY created_at DESC
-        """, (username,))
-        
-        results = cursor.fetchall()
-        conn.close()
-        
-        tickets = []
-        for result in results:
-            tickets.append({
-                'ticket_id': result[0],
-                'status': result[1],
-                'description': result[2],
-                'priority': result[3],
-                'created_at': result[4],
-                'updated_at': result[5]
-            })
-        return tickets
+        parts = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        tier = parts.pop(0) if len(parts) == 3 else "main"
+        created_at, rowid = parts
+        if tier not in ("main", "archive"):
+            raise ValueError(tier)
+        return tier, created_at, int(rowid)
+    except ValueError as e:
+        raise ValueError(f"Invalid ticket history cursor: {cursor!r}") from e
+
+
+def _history_rows(conn: sqlite3.Connection, table: str, username: str, status: Optional[str],
+                  position: Optional[Tuple[str, int]], count: int) -> list:
+    """Up to `count` of the user's rows in `table` older than `position`, newest first, with their rowids"""
+    sql = f"""
+        SELECT ticket_id, username, status, description, priority, created_at, updated_at, rowid
+        FROM {table}
+        WHERE username = ?
+    """
+    params: list = [username]
+    if status:
+        sql += " AND status = ?"
+        params.append(status)
+    if position:
+        sql += " AND (created_at, rowid) < (?, ?)"
+        params.extend(position)
+    sql += " ORDER BY created_at DESC, rowid DESC LIMIT ?"
+    params.append(count)
+    return conn.execute(sql, params).fetchall()
+
+
+@metrics.timed("agent_db_latency_seconds", stage="get_ticket_page")
+def get_ticket_page(username: str, limit: int = 20, cursor: Optional[str] = None,
+                    status: Optional[str] = None) -> TicketPage:
+    """A page of the user's tickets, newest first, optionally only those with `status`.
+
+    Pages are keyset-paginated on (created_at, rowid) using
+    idx_tickets_username_created, so every page costs the same however deep
+    into the history it is, and tickets created meanwhile don't shift later
+    pages. Archived tickets follow once the hot table's are exhausted (so an
+    old open ticket is listed before newer archived ones). Tickets still in the
+    write-behind queue are the newest, so the first page lists them on top of
+    its `limit`. Errors are raised, not swallowed.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    tier, position = "main", None
+    if cursor:
+        tier, created_at, rowid = _decode_cursor(cursor)
+        position = (created_at, rowid)
+    with get_pool().connection() as conn:
+        # One extra row tells whether there is a next page
+        rows = []
+        if tier == "main":
+            rows = [(row, "main") for row in _history_rows(conn, "tickets", username, status, position, limit + 1)]
+        # Only closed tickets are archived
+        if len(rows) <= limit and status != "open" and _attach_archive(conn):
+            rows += [(row, "archive") for row in _history_rows(
+                conn, "archive.tickets", username, status, position if tier == "archive" else None,
+                limit + 1 - len(rows))]
+    next_cursor = None
+    if len(rows) > limit:
+        last, last_tier = rows[limit - 1]
+        next_cursor = _encode_cursor(last[5], last[7], last_tier)
+    tickets = [TicketRecord(*row[:7]) for row, _ in rows[:limit]]
+    if not cursor:
+        # A ticket committed while this page was read is already in `rows`
+        listed = {ticket.ticket_id for ticket in tickets}
+        tickets = [ticket for ticket in _pending_user_tickets(username, status)
+                   if ticket.ticket_id not in listed] + tickets
+    return TicketPage(tickets, next_cursor)
+
+
+def iter_user_tickets(username: str, status: Optional[str] = None, page_size: int = 100) -> Iterator[TicketRecord]:
+    """Every ticket of the user, newest first, read a page at a time.
+
+    No connection is held between pages, so the generator can be consumed
+    slowly or abandoned part way.
+    """
+    cursor = None
+    while True:
+        page = get_ticket_page(username, page_size, cursor, status)
+        yield from page.tickets
+        if page.next_cursor is None:
+            return
+        cursor = page.next_cursor
+
+
+def get_user_tickets(username: str, limit: Optional[int] = None, status: Optional[str] = None) -> List[Dict]:
+    """Get all tickets for a specific user, newest first (the newest `limit` if given)"""
+    try:
+        page_size = MAX_PAGE_SIZE if limit is None else max(1, min(limit, MAX_PAGE_SIZE))
+        records = list(itertools.islice(iter_user_tickets(username, status, page_size), limit))
+        return [
+            {
+                'ticket_id': record.ticket_id,
+                'status': record.status,
+                'description': record.description,
+                'priority': record.priority,
+                'created_at': record.created_at,
+                'updated_at': record.updated_at
+            }
+            for record in records
+        ]
     except Exception as e:
         print(f"Error getting user tickets: {e}")
+        metrics.inc("agent_errors_total", stage="get_user_tickets")
         return []
 
 
-if __name__ == "__main__":
+# Hot/cold storage: closed tickets not updated for TICKET_ARCHIVE_AFTER_DAYS are moved
+# by archive_closed_tickets() to a second database file, attached only when a lookup
+# misses the (smaller) hot table
+ARCHIVE_AFTER_DAYS = float(os.getenv("TICKET_ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("TICKET_ARCHIVE_BATCH_SIZE", "5000"))
+# None: next to DB_PATH (customer_service.db -> customer_service_archive.db)
+ARCHIVE_DB_PATH: Optional[str] = os.getenv("TICKET_ARCHIVE_DB_PATH") or None
+
+
+def archive_path() -> str:
+    """The archive database file for the current DB_PATH"""
+    if ARCHIVE_DB_PATH:
+        return ARCHIVE_DB_PATH
+    root, ext = os.path.splitext(DB_PATH)
+    return f"{root}_archive{ext or '.db'}"
+
+
+def _attach_archive(conn: sqlite3.Connection, create: bool = False) -> bool:
+    """Attach the archive to this connection as `archive`, if it exists (or `create`); whether it is attached"""
+    if conn.execute("SELECT 1 FROM pragma_database_list WHERE name = 'archive'").fetchone():
+        return True
+    path = archive_path()
+    if not create and (conn.in_transaction or not os.path.exists(path)):
+        # ATTACH isn't allowed inside a transaction
+        return False
+    try:
+        conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    except sqlite3.OperationalError as e:
+        # e.g. inside a write transaction, where ATTACH isn't allowed
+        if create:
+            raise
+        print(f"Error attaching ticket archive: {e}")
+        metrics.inc("agent_errors_total", stage="attach_archive")
+        return False
+    if create:
+        conn.execute("PRAGMA archive.journal_mode = WAL")
+        # Same columns as tickets; no users foreign key (that table is in the main file)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS archive.tickets (
+                ticket_id TEXT PRIMARY KEY,
+                username TEXT NOT NULL,
+                status TEXT NOT NULL,
+                description TEXT NOT NULL,
+                priority TEXT NOT NULL,
+                created_at TIMESTAMP,
+                updated_at TIMESTAMP
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_tickets_username_created ON tickets (username, created_at)")
+        conn.commit()
+    return True
+
+
+def _archived_ticket(conn: sqlite3.Connection, ticket_id: str) -> Optional[Tuple[str, str]]:
+    """(username, created_at) of the archived ticket with this ID, if the archive is attached and has one"""
+    if not conn.execute("SELECT 1 FROM pragma_database_list WHERE name = 'archive'").fetchone():
+        return None
+    return conn.execute("SELECT username, created_at FROM archive.tickets WHERE ticket_id = ?",
+                        (ticket_id,)).fetchone()
+
+
+@metrics.timed("agent_db_latency_seconds", stage="archive_batch")
+def _archive_batch(after_rowid: int, cutoff: str, batch_size: int) -> Tuple[int, int]:
+    """Move the next batch of archivable tickets; (tickets moved, last rowid scanned), (0, 0) when done"""
+    with get_pool().connection() as conn:
+        _attach_archive(conn, create=True)
+        bounds = conn.execute("""
+            SELECT MIN(rowid), MAX(rowid) FROM (
+                SELECT rowid FROM main.tickets
+                WHERE rowid > ? AND status = 'closed' AND updated_at < ?
+                ORDER BY rowid LIMIT ?
+            )
+        """, (after_rowid, cutoff, batch_size)).fetchone()
+        if bounds[0] is None:
+            return 0, 0
+        # The archive copy commits first: with WAL, a transaction writing two database files
+        # isn't atomic across them, so a crash may leave a ticket in both tiers, never in neither.
+        # The hot row is the current one (a lookup reads it first), so it updates an earlier
+        # copy of the same ticket; an archived ticket of another user under the same ID is kept.
+        conn.execute("""
+            INSERT INTO archive.tickets
+            SELECT ticket_id, username, status, description, priority, created_at, updated_at
+            FROM main.tickets
+            WHERE rowid BETWEEN ? AND ? AND status = 'closed' AND updated_at < ?
+            ON CONFLICT (ticket_id) DO UPDATE SET
+                status = excluded.status, description = excluded.description,
+                priority = excluded.priority, updated_at = excluded.updated_at
+            WHERE tickets.username = excluded.username AND tickets.created_at = excluded.created_at
+        """, (bounds[0], bounds[1], cutoff))
+    with get_pool().connection() as conn:
+        _attach_archive(conn, create=True)
+        # Rows reopened or changed since the copy, or whose ID collides with another archived
+        # ticket, stay hot
+        moved = conn.execute("""
+            DELETE FROM main.tickets
+            WHERE rowid BETWEEN ? AND ? AND status = 'closed' AND updated_at < ?
+              AND EXISTS (SELECT 1 FROM archive.tickets AS archived
+                          WHERE archived.ticket_id = tickets.ticket_id AND archived.username = tickets.username
+                            AND archived.created_at = tickets.created_at
+                            AND archived.updated_at = tickets.updated_at)
+        """, (bounds[0], bounds[1], cutoff)).rowcount
+    return moved, bounds[1]
+
+
+def archive_closed_tickets(older_than_days: float = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE,
+                           pause: float = 0.0, progress: Optional[Callable[[int], None]] = None) -> int:
+    """Move closed tickets not updated for `older_than_days` days to the archive; returns how many.
+
+    Runs online: each batch of at most `batch_size` tickets is copied to the
+    archive in one transaction and deleted from the hot table in another, so
+    the hot table's write lock is held for one batch's deletes at a time, with
+    `pause` seconds between batches for other writers. Safe to interrupt and
+    re-run. `progress(total_moved)` is called after every batch.
+    """
+    with get_pool().connection() as conn:
+        _attach_archive(conn, create=True)
+        cutoff = conn.execute("SELECT datetime('now', ?)", (f"-{older_than_days} days",)).fetchone()[0]
+    total, after_rowid = 0, 0
+    while True:
+        moved, after_rowid = _archive_batch(after_rowid, cutoff, batch_size)
+        if not after_rowid:
+            return total
+        total += moved
+        metrics.inc("agent_tickets_archived_total", moved)
+        if progress is not None:
+            progress(total)
+        if pause:
+            time.sleep(pause)
+
+
+# Tokenizer of tickets_fts; match_score stems words with it too, so the two agree
+FTS_TOKENIZER = "porter unicode61"
+
+# Words that say nothing about which ticket is meant
+SEARCH_STOPWORDS = frozenset("""
+    a about after again all am an and any are as at be been but by can case could did do does for from get got
+    had has have help hi how i if in is issue it its just last look me my need no not of on or our please
+    problem still that the their there this ticket to up was we what when where which why will with would you your
+    tickets cases issues latest newest previous recent status update any show
+""".split())
+# Most terms of a message used in one search
+MAX_SEARCH_TERMS = 12
+# Most matching tickets of one user scored per search (their newest)
+SEARCH_CANDIDATES = 200
+
+_WORD = re.compile(r"[^\W_]+")
+
+
+def _words(text: str) -> List[str]:
+    """Distinct lowercase words of `text` worth searching for, in order"""
+    words = []
+    for word in _WORD.findall(text.lower()):
+        if len(word) > 1 and word not in SEARCH_STOPWORDS and word not in words:
+            words.append(word)
+    return words
+
+
+def search_terms(text: str) -> List[str]:
+    """The words of `text` a search looks for (at most MAX_SEARCH_TERMS)"""
+    return _words(text)[:MAX_SEARCH_TERMS]
+
+
+_stemmers = threading.local()
+
+
+@functools.lru_cache(maxsize=65536)
+def _stem(word: str) -> Tuple[str, ...]:
+    """The term(s) tickets_fts indexes `word` under, from the same porter tokenizer"""
+    conn = getattr(_stemmers, "conn", None)
+    if conn is None:
+        conn = _stemmers.conn = sqlite3.connect(":memory:")
+        conn.execute(f"CREATE VIRTUAL TABLE stem USING fts5(text, tokenize='{FTS_TOKENIZER}')")
+        conn.execute("CREATE VIRTUAL TABLE stem_terms USING fts5vocab(stem, 'row')")
+    try:
+        conn.execute("INSERT INTO stem (text) VALUES (?)", (word,))
+        return tuple(term for term, in conn.execute("SELECT term FROM stem_terms"))
+    finally:
+        # Nothing is kept: the table is only used to run the tokenizer
+        conn.rollback()
+
+
+def _stems(words: List[str]) -> Set[str]:
+    return {term for word in words for term in _stem(word)}
+
+
+def match_score(query: str, text: str) -> float:
+    """Share of the query's search terms that appear in `text` (0..1), stemmed as the index stems them"""
+    wanted = _stems(search_terms(query))
+    return len(wanted & _stems(_words(text))) / len(wanted) if wanted else 0.0
+
+
+def query_term_count(query: str) -> int:
+    """How many distinct stemmed search terms `query` has"""
+    return len(_stems(search_terms(query)))
+
+
+@metrics.timed("agent_db_latency_seconds", stage="search_tickets")
+def search_tickets(query: str, username: str, limit: int = 5,
+                   status: Optional[str] = None) -> List[TicketRecord]:
+    """The user's tickets whose descriptions best match `query`, best first.
+
+    The index finds tickets containing any query word (stemmed, so "printers"
+    matches "printer"); they are ranked by how many of the query's words they
+    contain, newest first on ties. Tickets still in the write-behind queue are
+    scored the same way.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    match = "description : (" + " OR ".join(f'"{term}"' for term in terms) + ")"
+    user_words = _WORD.findall(username.lower())
+    if user_words:
+        # Narrow to this user inside the index; the exact username is checked below
+        match = f'username : "{" ".join(user_words)}" AND {match}'
+    # Ranking with bm25() would weigh every matching row in the table to score
+    # common words, which dominates at millions of tickets; the newest candidates
+    # are scored here instead (the index walks rowids backwards, no sort needed)
+    sql = """
+        SELECT t.ticket_id, t.username, t.status, t.description, t.priority, t.created_at, t.updated_at
+        FROM tickets_fts CROSS JOIN tickets t ON t.rowid = tickets_fts.rowid
+        WHERE tickets_fts MATCH ? AND t.username = ?
+    """
+    params: list = [match, username]
+    if status:
+        sql += " AND t.status = ?"
+        params.append(status)
+    sql += " ORDER BY tickets_fts.rowid DESC LIMIT ?"
+    params.append(SEARCH_CANDIDATES)
+    # Not in the index yet, and newer than anything that is
+    candidates = [ticket for ticket in _pending_user_tickets(username, status)
+                  if match_score(query, ticket.description)]
+    try:
+        with get_pool().connection() as conn:
+            pending_ids = {ticket.ticket_id for ticket in candidates}
+            candidates += [TicketRecord(*row) for row in conn.execute(sql, params) if row[0] not in pending_ids]
+    except Exception as e:
+        print(f"Error searching tickets: {e}")
+        metrics.inc("agent_errors_total", stage="search_tickets")
+        return []
+    # sorted() is stable, so equal scores stay newest first
+    return sorted(candidates, key=lambda ticket: -match_score(query, ticket.description))[:limit]
+
+
+def main():
+    import argparse
+    global DB_PATH
+
+    parser = argparse.ArgumentParser(description="Create the schema, or move old closed tickets to the archive")
+    parser.add_argument("command", nargs="?", choices=("init", "archive"), default="init")
+    parser.add_argument("--db", default=DB_PATH, help="database file")
+    parser.add_argument("--older-than-days", type=float, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=0.05, help="seconds between archive batches")
+    args = parser.parse_args()
+
+    DB_PATH = args.db
     init_database()
+    if args.command == "archive":
+        start = time.monotonic()
+        moved = archive_closed_tickets(
+            args.older_than_days, args.batch_size, args.pause,
+            progress=lambda total: print(f"\r{total} tickets archived", end="", flush=True))
+        print(f"\rArchived {moved} closed tickets not updated for {args.older_than_days:g} days "
+              f"to {archive_path()} in {time.monotonic() - start:.1f}s")
+    close_pools()
+
+
+if __name__ == "__main__":
+    main()
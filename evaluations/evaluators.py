@@ -0,0 +1,11 @@
+"""Evaluators shared by example_evaluation.py and run_evaluation.py"""
+
+
+def is_concise(outputs: dict, reference_outputs: dict) -> dict:
+    out = outputs["output"]
+    ref = reference_outputs["output"]
+    score = len(out) < 2 * len(ref)
+    return {"key": "is_concise", "score": int(score)}
+
+
+EVALUATORS = [is_concise]
@@ -2,13 +2,6 @@ from langsmith import Client
 from dotenv import load_dotenv
 import os
 
-load_dotenv()
-
-client = Client()
-
-dataset_id = os.getenv("DATASET_ID")
-
-
 example_inputs = [
     (
         "can you check on the issue - my id is 61e4e",
@@ -60,8 +53,16 @@ example_inputs = [
     ),
 ]
 
-# Convert to LangSmith example schema
-inputs = [{"message_content": q, "username": "test_user"} for q, _ in example_inputs]
-outputs = [{"output": a} for _, a in example_inputs]
 
-client.create_examples(dataset_id=dataset_id, inputs=inputs, outputs=outputs)
\ No newline at end of file
+if __name__ == "__main__":
+    load_dotenv()
+
+    client = Client()
+
+    dataset_id = os.getenv("DATASET_ID")
+
+    # Convert to LangSmith example schema
+    inputs = [{"message_content": q, "username": "test_user"} for q, _ in example_inputs]
+    outputs = [{"output": a} for _, a in example_inputs]
+
+    client.create_examples(dataset_id=dataset_id, inputs=inputs, outputs=outputs)
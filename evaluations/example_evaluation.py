@@ -6,17 +6,13 @@ from langsmith.evaluation import evaluate
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from agent import process_customer_message
+from evaluations.evaluators import is_concise
 
 # 1. Create/select dataset
 client = Client()
 dataset_name = "case_dataset"
 
-# 2. Define evaluator
-def is_concise(outputs: dict, reference_outputs: dict) -> dict:
-    out = outputs["output"]
-    ref = reference_outputs["output"]
-    score = len(out) < 2 * len(ref)
-    return {"key": "is_concise", "score": int(score)}
+# 2. Define evaluator (see evaluations/evaluators.py)
 
 def target_function(inputs: dict):
     answer = process_customer_message(inputs["message_content"], inputs["username"])  # returns a string
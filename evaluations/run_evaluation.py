@@ -0,0 +1,300 @@
+"""Parallel, resumable evaluation runner with OpenAI record/replay
+
+Runs process_customer_message over a dataset with N concurrent workers against a
+throwaway sqlite database, appending one JSON line per example to a results file.
+Re-running with the same --results file skips examples that already succeeded,
+so an interrupted run resumes where it stopped; evaluators are re-applied to
+every stored output at the end, so editing is_concise only needs a re-score.
+
+--llm record   stores every OpenAI chat completion keyed by a hash of the request
+--llm replay   serves completions from the recordings and never calls OpenAI
+
+Usage: python evaluations/run_evaluation.py [--source local|langsmith] [--concurrency 8]
+                                            [--results results.jsonl] [--llm live|record|replay]
+                                            [--recordings recordings.jsonl] [--rescore] [--upload]
+"""
+import argparse
+import asyncio
+import contextvars
+import functools
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from evaluations.evaluators import EVALUATORS
+from rate_limiter import llm_lane
+from ticket_ids import ID_SPACE, ticket_id_for
+
+EVAL_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_RESULTS_PATH = os.path.join(EVAL_DIR, "results.jsonl")
+DEFAULT_RECORDINGS_PATH = os.path.join(EVAL_DIR, "recordings.jsonl")
+
+
+class RecordingMissing(Exception):
+    """Raised in replay mode for a request that was never recorded"""
+
+
+# Ticket timestamps ("created 2024-05-01 10:02:33") differ on every run
+_TIMESTAMP = re.compile(r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}")
+
+
+def request_key(kwargs: Dict[str, Any]) -> str:
+    """Stable hash of the parts of a chat.completions.create call that affect the reply"""
+    relevant = {k: v for k, v in kwargs.items() if k not in ("stream", "stream_options", "timeout")}
+    payload = _TIMESTAMP.sub("<timestamp>", json.dumps(relevant, sort_keys=True, default=str))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LLMRecorder:
+    """Patches the OpenAI chat-completions resources to record or replay responses"""
+
+    def __init__(self, path: str, mode: str):
+        self.path = path
+        self.mode = mode
+        self.recordings: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"recorded": 0, "replayed": 0, "missing": 0}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.recordings[entry["key"]] = entry["response"]
+
+    def install(self):
+        from openai.resources.chat.completions import AsyncCompletions, Completions
+        from openai.types.chat import ChatCompletion
+
+        recorder = self
+        sync_create = Completions.create
+        async_create = AsyncCompletions.create
+
+        def create(self, **kwargs):
+            if kwargs.get("stream"):
+                return sync_create(self, **kwargs)
+            key = request_key(kwargs)
+            if recorder.mode == "replay":
+                return ChatCompletion.model_validate(recorder.lookup(key))
+            response = sync_create(self, **kwargs)
+            recorder.save(key, response)
+            return response
+
+        async def acreate(self, **kwargs):
+            if kwargs.get("stream"):
+                return await async_create(self, **kwargs)
+            key = request_key(kwargs)
+            if recorder.mode == "replay":
+                return ChatCompletion.model_validate(recorder.lookup(key))
+            response = await async_create(self, **kwargs)
+            recorder.save(key, response)
+            return response
+
+        Completions.create = create
+        AsyncCompletions.create = acreate
+
+    def lookup(self, key: str) -> Dict[str, Any]:
+        with self._lock:
+            response = self.recordings.get(key)
+            if response is None:
+                self.stats["missing"] += 1
+                raise RecordingMissing(f"No recorded OpenAI response for request {key[:12]}")
+            self.stats["replayed"] += 1
+            return response
+
+    def save(self, key: str, response: Any):
+        entry = {"key": key, "response": response.model_dump(mode="json")}
+        with self._lock:
+            self.recordings[key] = entry["response"]
+            self.stats["recorded"] += 1
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+
+
+# Per-example seed so create_ticket hands out the same ticket IDs on every run,
+# keeping the write_response request (and therefore its recording key) stable
+_ticket_seed: contextvars.ContextVar[Optional[List[Any]]] = contextvars.ContextVar("ticket_seed", default=None)
+
+
+def _seeded_ticket_id(agent: Any) -> str:
+    seed = _ticket_seed.get()
+    if seed is None:
+        return agent.get_ticket_id_allocator().next_id()
+    while True:
+        seed[1] += 1
+        digest = hashlib.blake2b(f"{seed[0]}:{seed[1]}".encode(), digest_size=8).digest()
+        ticket_id = ticket_id_for(int.from_bytes(digest, "big") % ID_SPACE)
+        if ticket_id is not None:
+            return ticket_id
+
+
+def example_id(inputs: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def load_examples(source: str, dataset_name: str, split: Optional[str]) -> List[Dict[str, Any]]:
+    """Examples as {"id", "inputs", "outputs"} dicts"""
+    if source == "local":
+        from evaluations.example_datasets import example_inputs
+
+        examples = []
+        for message, answer in example_inputs:
+            inputs = {"message_content": message, "username": "test_user"}
+            examples.append({"id": example_id(inputs), "inputs": inputs, "outputs": {"output": answer}})
+        return examples
+
+    from langsmith import Client
+
+    client = Client()
+    return [
+        {"id": str(example.id), "inputs": example.inputs, "outputs": example.outputs}
+        for example in client.list_examples(dataset_name=dataset_name, splits=[split] if split else None)
+    ]
+
+
+def load_results(path: str) -> Dict[str, Dict[str, Any]]:
+    """Latest stored result per example id"""
+    results = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    result = json.loads(line)
+                    results[result["id"]] = result
+    return results
+
+
+async def run_examples(agent, examples: List[Dict[str, Any]], results_path: str, concurrency: int) -> int:
+    """Run the examples concurrently, appending each result as soon as it finishes"""
+    semaphore = asyncio.Semaphore(concurrency)
+    errors = 0
+
+    async def one(example: Dict[str, Any], out):
+        nonlocal errors
+        async with semaphore:
+            _ticket_seed.set([example["id"], 0])
+            # Examples run concurrently in one database: a username of its own keeps each
+            # example's ticket history and duplicate checks independent of the others
+            username = f"{example['inputs']['username']}_{example['id'][:8]}"
+            start = time.perf_counter()
+            result = {"id": example["id"], "inputs": example["inputs"], "reference": example["outputs"]}
+            try:
+                output = await agent.aprocess_customer_message(example["inputs"]["message_content"], username)
+                result.update(output=output, error=None)
+            except Exception as e:
+                errors += 1
+                result.update(output=None, error=f"{type(e).__name__}: {e}")
+                print(f"Error on example {example['id']}: {e}")
+            result["latency_s"] = round(time.perf_counter() - start, 4)
+            # One loop thread writes, so lines never interleave
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+
+    with open(results_path, "a") as out:
+        await asyncio.gather(*(one(example, out) for example in examples))
+    return errors
+
+
+def score(results: Dict[str, Dict[str, Any]], examples: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Apply EVALUATORS to stored outputs and return the mean score per key"""
+    totals: Dict[str, List[float]] = {}
+    for example in examples:
+        result = results.get(example["id"])
+        if not result or result.get("error"):
+            continue
+        for evaluator in EVALUATORS:
+            feedback = evaluator({"output": result["output"]}, example["outputs"])
+            totals.setdefault(feedback["key"], []).append(feedback["score"])
+    return {key: sum(values) / len(values) for key, values in totals.items()}
+
+
+def upload(results: Dict[str, Dict[str, Any]], dataset_name: str, split: Optional[str], concurrency: int):
+    """Push stored outputs to LangSmith as an experiment (no model calls)"""
+    from langsmith import Client
+    from langsmith.evaluation import evaluate
+
+    client = Client()
+    by_inputs = {example_id(result["inputs"]): result for result in results.values()}
+
+    def target_function(inputs: dict):
+        result = by_inputs.get(example_id(inputs)) or {}
+        return {"output": result.get("output") or ""}
+
+    evaluate(
+        target_function,
+        data=client.list_examples(dataset_name=dataset_name, splits=[split] if split else None),
+        evaluators=EVALUATORS,
+        experiment_prefix="case_dataset_experiment",
+        metadata={"model_name": "gpt-4o"},
+        max_concurrency=concurrency,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", choices=["local", "langsmith"], default="local",
+                        help="evaluations/example_datasets.py or a LangSmith dataset")
+    parser.add_argument("--dataset", default="case_dataset")
+    parser.add_argument("--split", default="test1")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--results", default=DEFAULT_RESULTS_PATH, help="per-example results file (resumed if present)")
+    parser.add_argument("--llm", choices=["live", "record", "replay"], default="live")
+    parser.add_argument("--recordings", default=DEFAULT_RECORDINGS_PATH)
+    parser.add_argument("--rescore", action="store_true", help="only re-apply evaluators to stored results")
+    parser.add_argument("--retry-errors", action="store_true", help="re-run examples whose stored result is an error")
+    parser.add_argument("--upload", action="store_true", help="record the scored outputs as a LangSmith experiment")
+    args = parser.parse_args()
+
+    examples = load_examples(args.source, args.dataset, args.split)
+    results = load_results(args.results)
+
+    if not args.rescore:
+        pending = [
+            example for example in examples
+            if example["id"] not in results or (args.retry_errors and results[example["id"]].get("error"))
+        ]
+        print(f"{len(examples) - len(pending)} of {len(examples)} examples already done, running {len(pending)}")
+        if pending:
+            recorder = None
+            if args.llm != "live":
+                recorder = LLMRecorder(args.recordings, args.llm)
+                recorder.install()
+
+            tmp = tempfile.TemporaryDirectory()
+            # Fresh database per run; cached replies would hide changes to the pipeline
+            os.environ["RESPONSE_CACHE_ENABLED"] = "false"
+            os.environ.pop("RESPONSE_CACHE_DB", None)
+            import database
+            database.DB_PATH = os.path.join(tmp.name, "evaluation.db")
+            import agent
+            agent.next_ticket_id = functools.partial(_seeded_ticket_id, agent)
+            # Queue behind interactive traffic when sharing an OpenAI budget with it
+            llm_lane.set("evaluation")
+            try:
+                start = time.perf_counter()
+                errors = asyncio.run(run_examples(agent, pending, args.results, args.concurrency))
+                print(f"Ran {len(pending)} examples in {time.perf_counter() - start:.1f}s ({errors} errors)")
+                if recorder is not None:
+                    print(f"LLM {args.llm}: {recorder.stats}")
+            finally:
+                database.close_pools()
+                tmp.cleanup()
+            results = load_results(args.results)
+
+    for key, mean in score(results, examples).items():
+        print(f"{key}: {mean:.3f}")
+
+    if args.upload:
+        upload(results, args.dataset, args.split, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Labelled messages for the local intent model in fast_classifier.py
+
+Kept apart from evaluations/example_datasets.py: the evaluation examples measure
+the classifier, so they must not be part of what it is trained on.
+"""
+
+training_examples = [
+    # ticket_info: questions about an existing ticket
+    ("where are we with ticket 4f2a9?", "ticket_info"),
+    ("status of case 88b1c please", "ticket_info"),
+    ("has anyone looked at my ticket 3c4d5 yet", "ticket_info"),
+    ("any progress on 7e7e1?", "ticket_info"),
+    ("can you give me an update on my case", "ticket_info"),
+    ("is ticket 0a9b8 resolved", "ticket_info"),
+    ("please reopen ticket 5d6e7", "ticket_info"),
+    ("I'd like to close case 2b3c4, it's sorted now", "ticket_info"),
+    ("what's happening with the ticket I opened yesterday", "ticket_info"),
+    ("check ticket a1b2c for me", "ticket_info"),
+    ("who is handling my ticket 9f8e7", "ticket_info"),
+    ("when will ticket 6c5b4 be fixed", "ticket_info"),
+    ("show me my open tickets", "ticket_info"),
+    ("what was my previous ticket about", "ticket_info"),
+    ("what priority is my case 1d2e3", "ticket_info"),
+    ("I never heard back about ticket 44c2a", "ticket_info"),
+    ("following up on case 7b8c9", "ticket_info"),
+    ("did you close my last ticket?", "ticket_info"),
+    ("look up the status of my support request", "ticket_info"),
+    ("is there news on my ticket", "ticket_info"),
+    # ticket_request: a new problem to open a ticket for
+    ("the app crashes every time I open settings", "ticket_request"),
+    ("I can't reset my password", "ticket_request"),
+    ("my invoices page shows an error", "ticket_request"),
+    ("payments keep failing at checkout", "ticket_request"),
+    ("the export to csv button does nothing", "ticket_request"),
+    ("search results are empty even though I have data", "ticket_request"),
+    ("I was charged twice this month", "ticket_request"),
+    ("two factor codes never arrive", "ticket_request"),
+    ("the mobile app won't sync my files", "ticket_request"),
+    ("reports take minutes to load", "ticket_request"),
+    ("I'm getting a 500 error on the billing page", "ticket_request"),
+    ("my account got locked after one attempt", "ticket_request"),
+    ("images don't show up in the gallery", "ticket_request"),
+    ("the calendar integration is broken", "ticket_request"),
+    ("login keeps timing out", "ticket_request"),
+    ("data from last week is missing from my dashboard", "ticket_request"),
+    ("I'm unable to add new team members", "ticket_request"),
+    ("the api returns wrong totals", "ticket_request"),
+    ("notifications arrive hours late", "ticket_request"),
+    ("the site logs me out every few minutes", "ticket_request"),
+    # other: greetings, thanks, general questions
+    ("hello!", "other"),
+    ("good morning", "other"),
+    ("hey, anyone there?", "other"),
+    ("thank you so much", "other"),
+    ("great, thanks for the help", "other"),
+    ("bye for now", "other"),
+    ("how does billing work?", "other"),
+    ("what are your support hours", "other"),
+    ("do you offer a student discount", "other"),
+    ("can I change my plan to annual", "other"),
+    ("what payment methods do you accept", "other"),
+    ("is there a mobile app", "other"),
+    ("how do I invite a colleague", "other"),
+    ("where can I find the documentation", "other"),
+    ("ok, that makes sense", "other"),
+    ("perfect, appreciate it", "other"),
+    ("who am I talking to?", "other"),
+    ("can I speak to a human", "other"),
+    ("what's new in the latest release", "other"),
+    ("do you have an API", "other"),
+]
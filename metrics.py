@@ -0,0 +1,263 @@
+"""In-process latency/token/error metrics with Prometheus text and JSON export"""
+import bisect
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Tuple
+
+# Histogram bucket upper bounds in seconds (Prometheus style, +Inf is implicit)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Fixed-bucket latency histogram for one label set"""
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Approximate quantile (upper bound of the bucket containing it)"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        running = 0
+        for i, bucket_count in enumerate(self.counts):
+            running += bucket_count
+            if running >= target:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+class Metrics:
+    """Thread-safe registry of histograms and counters keyed by name and labels"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def observe(self, name: str, value: float, **labels: str):
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: str):
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    @contextmanager
+    def timer(self, name: str, **labels: str):
+        """Time a block; exceptions are counted in agent_errors_total and re-raised"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc("agent_errors_total", **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name: str, **labels: str) -> Callable:
+        """Decorator form of timer() for sync, async and async-generator functions"""
+        def decorator(fn: Callable) -> Callable:
+            if inspect.isasyncgenfunction(fn):
+                @functools.wraps(fn)
+                async def agen_wrapper(*args, **kwargs):
+                    with self.timer(name, **labels):
+                        async for item in fn(*args, **kwargs):
+                            yield item
+                return agen_wrapper
+
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    with self.timer(name, **labels):
+                        return await fn(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record_usage(self, call: str, usage: Any):
+        """Count prompt/completion tokens from an OpenAI `usage` object"""
+        if usage is None:
+            return
+        self.inc("agent_llm_tokens_total", getattr(usage, "prompt_tokens", 0) or 0, call=call, kind="prompt")
+        self.inc("agent_llm_tokens_total", getattr(usage, "completion_tokens", 0) or 0, call=call, kind="completion")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-friendly view of every series"""
+        with self._lock:
+            histograms = {
+                name: [
+                    {
+                        "labels": dict(key),
+                        "count": h.count,
+                        "sum": h.sum,
+                        "p50": h.quantile(0.5),
+                        "p95": h.quantile(0.95),
+                        "p99": h.quantile(0.99),
+                    }
+                    for key, h in series.items()
+                ]
+                for name, series in self._histograms.items()
+            }
+            counters = {
+                name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                for name, series in self._counters.items()
+            }
+            gauges = {
+                name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                for name, series in self._gauges.items()
+            }
+        return {"timestamp": time.time(), "histograms": histograms, "counters": counters, "gauges": gauges}
+
+    def render_prometheus(self) -> str:
+        """Render every series in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, h in series.items():
+                    running = 0
+                    for bound, bucket_count in zip(h.buckets + (float("inf"),), h.counts):
+                        running += bucket_count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{_labels(key, le=le)} {running}")
+                    lines.append(f"{name}_sum{_labels(key)} {h.sum}")
+                    lines.append(f"{name}_count{_labels(key)} {h.count}")
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_labels(key)} {value}")
+            for name, series in sorted(self._gauges.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} gauge")
+                for key, value in series.items():
+                    lines.append(f"{name}{_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+    def start_json_dump(self, path: str, interval: float = 60.0) -> threading.Thread:
+        """Write snapshot() to `path` every `interval` seconds on a daemon thread"""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    tmp_path = f"{path}.tmp"
+                    with open(tmp_path, "w") as f:
+                        json.dump(self.snapshot(), f)
+                    os.replace(tmp_path, path)
+                except Exception as e:
+                    print(f"Error writing metrics to {path}: {e}")
+
+        thread = threading.Thread(target=loop, name="metrics-dump", daemon=True)
+        thread.start()
+        return thread
+
+    def start_http_server(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Serve render_prometheus() at /metrics on a daemon thread (local only unless `host` says otherwise)"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render_prometheus().encode()
+                self.send_response(200 if self.path.startswith("/metrics") else 404)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+
+def _labels(key: LabelKey, **extra: str) -> str:
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+# Process-wide registry used by agent.py and database.py
+metrics = Metrics(enabled=os.getenv("METRICS_ENABLED", "true").lower() != "false")
+metrics.describe("agent_stage_latency_seconds", "Latency of each process_customer_message stage")
+metrics.describe("agent_db_latency_seconds", "Latency of database.py operations")
+metrics.describe("agent_time_to_first_token_seconds", "Time from the streaming completion request to its first token")
+metrics.describe("agent_llm_tokens_total", "Tokens reported by OpenAI responses")
+metrics.describe("agent_errors_total", "Errors by stage")
+metrics.describe("agent_response_cache_total", "write_response cache lookups by result (hit/miss)")
+metrics.describe("agent_ticket_cache_total", "Ticket lookup cache lookups by result (hit/miss)")
+metrics.describe("agent_trace_runs_total", "LangSmith runs by result (exported/unsampled/dropped)")
+metrics.describe("agent_llm_queue_depth", "OpenAI requests waiting for rate-limit budget, by lane")
+metrics.describe("agent_llm_queue_wait_seconds", "Time OpenAI requests waited for rate-limit budget, by lane")
+metrics.describe("agent_server_in_flight", "Messages a server worker is processing")
+metrics.describe("agent_server_rejected_total", "Server requests turned away (busy/draining/worker_unavailable), by transport")
+metrics.describe("agent_classifications_total", "Messages classified by source (rules/model locally, llm when escalated)")
+metrics.describe("agent_speculation_total", "Speculative ticket lookups by result (started/used/discarded)")
+metrics.describe("agent_routing_total", "Single-call routing completions by intent and action (reply/lookup_ticket/create_ticket)")
+metrics.describe("agent_ticket_queue_depth", "New tickets journaled but not yet committed by the write-behind queue")
+metrics.describe("agent_ticket_group_commits_total", "Write-behind group commits (tickets committed / commits = mean group size)")
+metrics.describe("agent_ticket_group_committed_total", "Tickets written by write-behind group commits")
+metrics.describe("agent_ticket_dead_letters_total", "Queued tickets the database refused (ID taken), kept in the dead-letter file")
+metrics.describe("agent_ticket_archive_lookups_total", "Lookups that missed the hot table and searched the archive, by result (hit/miss)")
+metrics.describe("agent_tickets_archived_total", "Closed tickets moved to the archive database")
+metrics.describe("agent_llm_retries_total", "OpenAI requests retried after a rate-limit or transient error, by lane")
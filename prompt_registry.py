@@ -0,0 +1,207 @@
+"""In-memory prompt registry with TTL, stale-while-refresh and on-disk snapshots"""
+import os
+import threading
+import time
+import warnings
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Default settings (overridable from the environment)
+DEFAULT_TTL_SECONDS = float(os.getenv("PROMPT_TTL_SECONDS", "300"))
+DEFAULT_SNAPSHOT_DIR = os.getenv("PROMPT_SNAPSHOT_DIR", "prompt_snapshots")
+
+
+class _Entry:
+    """A cached prompt and the time it was loaded"""
+    __slots__ = ("prompt", "loaded_at")
+
+    def __init__(self, prompt: Any, loaded_at: float):
+        self.prompt = prompt
+        self.loaded_at = loaded_at
+
+
+def _snapshot_filename(identifier: str) -> str:
+    """write_response_prompt_v2 -> write_response_prompt_v2.json, with a pin: ...@a1b2c3d4.json"""
+    return identifier.replace(":", "@").replace("/", "_").replace(os.sep, "_") + ".json"
+
+
+class PromptRegistry:
+    """Load hub prompts once and serve them from memory.
+
+    Entries younger than `ttl` are returned directly. Stale entries are still
+    returned while a background thread re-pulls them, so a request never waits
+    on the hub once a prompt has been loaded. Concurrent cold misses of one
+    prompt share a single pull. If the hub can't be reached the registry falls
+    back to the last snapshot written to `snapshot_dir` for the same identifier.
+
+    Pins map a prompt name to a commit hash or tag, e.g.
+    {"write_response_prompt_v2": "a1b2c3d4"} pulls "write_response_prompt_v2:a1b2c3d4".
+    A pinned prompt only falls back to a snapshot of that commit.
+    """
+
+    def __init__(self, pull: Callable[[str], Any], ttl: float = DEFAULT_TTL_SECONDS,
+                 snapshot_dir: Optional[str] = DEFAULT_SNAPSHOT_DIR,
+                 pins: Optional[Dict[str, str]] = None):
+        self._pull = pull
+        self.ttl = ttl
+        self.snapshot_dir = snapshot_dir
+        self.pins = dict(pins or {})
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        # One lock per prompt name, held while a cold miss pulls it
+        self._load_locks: Dict[str, threading.Lock] = {}
+        # Bumped by pin() and invalidate(); a pull started before a bump isn't stored
+        self._generations: Dict[str, int] = {}
+        self.stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "snapshot_loads": 0,
+        }
+
+    def identifier(self, name: str) -> str:
+        """Return the hub identifier for a prompt, including any pinned commit"""
+        pin = self.pins.get(name)
+        return f"{name}:{pin}" if pin else name
+
+    def pin(self, name: str, commit: Optional[str]):
+        """Pin a prompt to a commit/tag (None unpins) and drop the cached copy"""
+        with self._lock:
+            if commit:
+                self.pins[name] = commit
+            else:
+                self.pins.pop(name, None)
+            self._entries.pop(name, None)
+            self._generations[name] = self._generations.get(name, 0) + 1
+
+    def __contains__(self, name: str) -> bool:
+        """True if the prompt is in memory, i.e. get() won't block on the hub"""
+        return name in self._entries
+
+    def get(self, name: str) -> Any:
+        """Return the prompt for `name`, pulling it from the hub only on a cold miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                if now - entry.loaded_at < self.ttl:
+                    self.stats["hits"] += 1
+                    return entry.prompt
+                self.stats["stale_hits"] += 1
+                schedule = name not in self._refreshing
+                if schedule:
+                    self._refreshing.add(name)
+            else:
+                self.stats["misses"] += 1
+
+        if entry is not None:
+            if schedule:
+                threading.Thread(target=self._refresh_one, args=(name,), daemon=True).start()
+            return entry.prompt
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(name)
+            if entry is not None:
+                # Another caller pulled it while we waited
+                return entry.prompt
+            return self._load(name)
+
+    def refresh(self, name: Optional[str] = None):
+        """Synchronously re-pull one prompt, or every cached prompt"""
+        with self._lock:
+            names = [name] if name else list(self._entries)
+        for prompt_name in names:
+            self._refresh_one(prompt_name)
+
+    def invalidate(self, name: Optional[str] = None):
+        """Drop one prompt, or all prompts, from memory"""
+        with self._lock:
+            for prompt_name in [name] if name else list(self._entries):
+                self._entries.pop(prompt_name, None)
+                self._generations[prompt_name] = self._generations.get(prompt_name, 0) + 1
+
+    def _version(self, name: str) -> Tuple[str, int]:
+        """(hub identifier, generation) to pull with and to check before storing the result"""
+        with self._lock:
+            return self.identifier(name), self._generations.get(name, 0)
+
+    def _store(self, name: str, generation: int, prompt: Any) -> bool:
+        """Cache a pulled prompt unless pin()/invalidate() happened since the pull started"""
+        with self._lock:
+            if self._generations.get(name, 0) != generation:
+                return False
+            self._entries[name] = _Entry(prompt, time.monotonic())
+            return True
+
+    def _load(self, name: str) -> Any:
+        """Pull from the hub, falling back to the local snapshot of the same identifier on failure"""
+        identifier, generation = self._version(name)
+        try:
+            prompt = self._pull(identifier)
+        except Exception as e:
+            prompt = self._read_snapshot(identifier)
+            if prompt is None:
+                raise
+            print(f"Prompt hub unavailable ({e}), using local snapshot for '{identifier}'")
+            with self._lock:
+                self.stats["snapshot_loads"] += 1
+        else:
+            self._write_snapshot(identifier, prompt)
+
+        self._store(name, generation, prompt)
+        return prompt
+
+    def _refresh_one(self, name: str):
+        identifier, generation = self._version(name)
+        try:
+            prompt = self._pull(identifier)
+        except Exception as e:
+            print(f"Error refreshing prompt '{name}': {e}")
+            with self._lock:
+                self.stats["refresh_errors"] += 1
+            return
+        finally:
+            with self._lock:
+                self._refreshing.discard(name)
+
+        self._write_snapshot(identifier, prompt)
+        if self._store(name, generation, prompt):
+            with self._lock:
+                self.stats["refreshes"] += 1
+
+    def _snapshot_path(self, identifier: str) -> str:
+        return os.path.join(self.snapshot_dir, _snapshot_filename(identifier))
+
+    def _write_snapshot(self, identifier: str, prompt: Any):
+        if not self.snapshot_dir:
+            return
+        try:
+            from langchain_core.load import dumps
+
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            path = self._snapshot_path(identifier)
+            # Unique per thread: a refresh and a cold pull of the same prompt can write at once
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(dumps(prompt, pretty=True))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Error writing prompt snapshot for '{identifier}': {e}")
+
+    def _read_snapshot(self, identifier: str) -> Optional[Any]:
+        if not self.snapshot_dir or not os.path.exists(self._snapshot_path(identifier)):
+            return None
+        try:
+            from langchain_core.load import loads
+
+            with open(self._snapshot_path(identifier)) as f, warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                return loads(f.read())
+        except Exception as e:
+            print(f"Error reading prompt snapshot for '{identifier}': {e}")
+            return None
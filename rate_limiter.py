@@ -0,0 +1,287 @@
+"""Client-side request and token budgets for OpenAI calls, with priority lanes
+
+Every chat-completions call goes through one RateLimiter per process. A call
+first takes one request from the requests-per-minute bucket and its estimated
+tokens (prompt counted with tiktoken, plus the expected completion) from the
+tokens-per-minute bucket; with no token budget set, nothing is counted. Callers that don't fit wait in a queue ordered by
+lane, so interactive turns are served before batch and evaluation work, and
+in arrival order within a lane. A 429 pauses the whole queue for a jittered
+backoff (or the server's Retry-After) instead of letting every caller retry
+on its own.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from metrics import metrics
+from token_count import count_tokens
+
+# 0 means no budget: calls are never queued, but failures are still retried with backoff
+DEFAULT_RPM = int(os.getenv("OPENAI_RPM_LIMIT", "0"))
+DEFAULT_TPM = int(os.getenv("OPENAI_TPM_LIMIT", "0"))
+DEFAULT_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+# Completion tokens assumed for a call without max_tokens; corrected from `usage` afterwards
+COMPLETION_TOKENS_ESTIMATE = int(os.getenv("OPENAI_COMPLETION_TOKENS_ESTIMATE", "300"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+# Highest priority first
+LANES = ("interactive", "batch", "evaluation")
+_LANE_RANK = {lane: rank for rank, lane in enumerate(LANES)}
+
+# Set by batch.py and evaluations/run_evaluation.py; anything else is an interactive turn
+llm_lane: "contextvars.ContextVar[str]" = contextvars.ContextVar("llm_lane", default="interactive")
+
+
+def estimate_tokens(messages: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> int:
+    """Prompt tokens (with the ~4 token per-message overhead) plus the expected completion"""
+    prompt = 3 + sum(4 + count_tokens(str(message.get("content") or "")) for message in messages)
+    return prompt + (max_tokens or COMPLETION_TOKENS_ESTIMATE)
+
+
+def _retryable(error: Exception) -> bool:
+    import openai
+
+    return isinstance(error, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError,
+                              openai.InternalServerError))
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds from a Retry-After header on the error's response, if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after-ms")) / 1000
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class _Waiter:
+    __slots__ = ("lane", "tokens", "wake")
+
+    def __init__(self, lane: str, tokens: int, wake: Callable[[], None]):
+        self.lane = lane
+        self.tokens = tokens
+        self.wake = wake
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute token buckets shared by all threads and event loops.
+
+    Buckets hold up to one minute of budget and refill continuously. Only the
+    head of the queue is ever granted, so a large request isn't starved by
+    smaller ones behind it. Token estimates are settled against the `usage`
+    OpenAI reports, so a bad estimate only affects the next few calls.
+    """
+
+    def __init__(self, rpm: int = DEFAULT_RPM, tpm: int = DEFAULT_TPM, max_retries: int = DEFAULT_MAX_RETRIES):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        # (lane rank, arrival, waiter): the smallest entry is served next
+        self._queue: List[Tuple[int, int, _Waiter]] = []
+        self._arrivals = itertools.count()
+        self._depth = {lane: 0 for lane in LANES}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "queued": 0, "retries": 0, "rate_limited": 0}
+
+    # Bucket accounting (caller holds the lock)
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(float(self.rpm), self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(float(self.tpm), self._tokens + elapsed * self.tpm / 60)
+
+    def _take(self, tokens: int, now: float) -> float:
+        """Consume budget for one call and return 0, or return the seconds until it could be"""
+        self._refill(now)
+        wait = self._paused_until - now
+        if self.rpm:
+            wait = max(wait, (1 - self._requests) * 60 / self.rpm)
+        if self.tpm:
+            # A call bigger than the whole budget goes through once the bucket is full
+            wait = max(wait, (min(tokens, self.tpm) - self._tokens) * 60 / self.tpm)
+        if wait > 0:
+            return wait
+        self._requests -= 1
+        self._tokens -= tokens
+        return 0.0
+
+    def _set_depth(self, lane: str, change: int):
+        self._depth[lane] += change
+        metrics.set_gauge("agent_llm_queue_depth", self._depth[lane], lane=lane)
+
+    def _wake_head(self):
+        if self._queue:
+            self._queue[0][2].wake()
+
+    # Queueing
+
+    def _enter(self, lane: str, tokens: int, wake: Callable[[], None],
+               arrival: Optional[int]) -> Tuple[Optional[Tuple[int, int, _Waiter]], int]:
+        """Grant immediately if nobody is waiting and the budget allows, else join the queue"""
+        if arrival is None:
+            arrival = next(self._arrivals)
+        with self._lock:
+            self.stats["calls"] += 1
+            if not self._queue and not self._take(tokens, time.monotonic()):
+                return None, arrival
+            entry = (_LANE_RANK.get(lane, len(LANES)), arrival, _Waiter(lane, tokens, wake))
+            heapq.heappush(self._queue, entry)
+            self.stats["queued"] += 1
+            self._set_depth(lane, 1)
+            return entry, arrival
+
+    def _poll(self, entry: Tuple[int, int, _Waiter]) -> Optional[float]:
+        """None once granted; otherwise the seconds to wait (0 = until woken by the head's grant)"""
+        with self._lock:
+            if self._queue[0] is not entry:
+                return 0.0
+            wait = self._take(entry[2].tokens, time.monotonic())
+            if wait:
+                return wait
+            heapq.heappop(self._queue)
+            self._set_depth(entry[2].lane, -1)
+            self._wake_head()
+            return None
+
+    def _leave(self, entry: Tuple[int, int, _Waiter]):
+        """Remove a waiter that gave up (its task was cancelled)"""
+        with self._lock:
+            if entry in self._queue:
+                was_head = self._queue[0] is entry
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._set_depth(entry[2].lane, -1)
+                if was_head:
+                    self._wake_head()
+
+    def _observe_wait(self, lane: str, started: float):
+        metrics.observe("agent_llm_queue_wait_seconds", time.perf_counter() - started, lane=lane)
+
+    def acquire(self, tokens: int, lane: Optional[str] = None, arrival: Optional[int] = None) -> int:
+        """Block until a call of `tokens` estimated tokens may be sent; returns its place in line"""
+        lane = lane or llm_lane.get()
+        started = time.perf_counter()
+        event = threading.Event()
+        entry, arrival = self._enter(lane, tokens, event.set, arrival)
+        if entry is not None:
+            while True:
+                event.clear()
+                wait = self._poll(entry)
+                if wait is None:
+                    break
+                event.wait(wait or None)
+        self._observe_wait(lane, started)
+        return arrival
+
+    async def aacquire(self, tokens: int, lane: Optional[str] = None, arrival: Optional[int] = None) -> int:
+        """Async version of acquire: waits without blocking the event loop"""
+        lane = lane or llm_lane.get()
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        entry, arrival = self._enter(lane, tokens, lambda: loop.call_soon_threadsafe(event.set), arrival)
+        if entry is not None:
+            try:
+                while True:
+                    event.clear()
+                    wait = self._poll(entry)
+                    if wait is None:
+                        break
+                    try:
+                        await asyncio.wait_for(event.wait(), wait or None)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                self._leave(entry)
+                raise
+        self._observe_wait(lane, started)
+        return arrival
+
+    def settle(self, estimated: int, response: Any):
+        """Correct the token bucket by the difference between the estimate and the reported usage"""
+        total = getattr(getattr(response, "usage", None), "total_tokens", None)
+        if not self.tpm or total is None:
+            return
+        with self._lock:
+            self._tokens = min(float(self.tpm), self._tokens + estimated - total)
+            self._wake_head()
+
+    def _estimate(self, kwargs: Dict[str, Any]) -> int:
+        """Estimated tokens for a call; without a token budget there is nothing to count them against"""
+        if not self.tpm:
+            return 0
+        return estimate_tokens(kwargs.get("messages", []), kwargs.get("max_tokens"))
+
+    def _backoff(self, error: Exception, attempt: int, lane: str) -> Optional[float]:
+        """Seconds to wait before retrying, or None if `error` shouldn't be retried"""
+        if attempt >= self.max_retries or not _retryable(error):
+            return None
+        import openai
+
+        # Full jitter, so callers that failed together don't retry together
+        delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+        self.stats["retries"] += 1
+        metrics.inc("agent_llm_retries_total", lane=lane, error=type(error).__name__)
+        if isinstance(error, openai.RateLimitError):
+            delay = max(delay, _retry_after(error) or 0.0)
+            # Hold back everyone, not just this caller: the quota is shared
+            with self._lock:
+                self.stats["rate_limited"] += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    def call(self, create: Callable[..., Any], **kwargs: Any) -> Any:
+        """create(**kwargs) (a chat.completions.create) within budget, retrying rate-limit and transient errors"""
+        lane = llm_lane.get()
+        tokens = self._estimate(kwargs)
+        arrival = None
+        for attempt in itertools.count():
+            # A retry keeps its original place in line
+            arrival = self.acquire(tokens, lane, arrival)
+            try:
+                response = create(**kwargs)
+            except Exception as e:
+                delay = self._backoff(e, attempt, lane)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self.settle(tokens, response)
+            return response
+
+    async def acall(self, create: Callable[..., Awaitable[Any]], **kwargs: Any) -> Any:
+        """Async version of call (for streams, the estimate is not settled)"""
+        lane = llm_lane.get()
+        tokens = self._estimate(kwargs)
+        arrival = None
+        for attempt in itertools.count():
+            arrival = await self.aacquire(tokens, lane, arrival)
+            try:
+                response = await create(**kwargs)
+            except Exception as e:
+                delay = self._backoff(e, attempt, lane)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self.settle(tokens, response)
+            return response
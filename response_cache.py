@@ -0,0 +1,277 @@
+"""Cache of write_response replies keyed on intent, normalized message and search results"""
+import hashlib
+import itertools
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Only these intents are cached; ticket_request replies always describe a brand new ticket
+CACHEABLE_INTENTS = {"other", "ticket_info"}
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2048"))
+DEFAULT_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+DEFAULT_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+DEFAULT_SIMILARITY_THRESHOLD = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.92"))
+# Semantic lookups compare against at most this many of the most recent entries with the same intent and results
+DEFAULT_MAX_CANDIDATES = int(os.getenv("RESPONSE_CACHE_MAX_CANDIDATES", "256"))
+
+EMBEDDING_DIM = 512
+
+_NON_WORD = re.compile(r"[^a-z0-9 ]+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_message(message_content: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace ("Thanks!!" == "thanks")"""
+    text = message_content.lower().replace("’", "'").replace("'", "")
+    text = _NON_WORD.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+def fingerprint_results(search_results: List[Any], context: str = "") -> str:
+    """Stable hash of the search results (and conversation context) passed to write_response"""
+    digest = hashlib.blake2b(digest_size=12)
+    for doc in search_results or []:
+        text = doc.get("page_content", "") if isinstance(doc, dict) else str(doc)
+        digest.update(text.encode())
+        digest.update(b"\0")
+    if context:
+        digest.update(b"\1")
+        digest.update(context.encode())
+    return digest.hexdigest()
+
+
+def embed(text: str):
+    """Cheap local embedding: hashed word unigrams + character trigrams, L2-normalized"""
+    import numpy as np
+
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    words = text.split()
+    padded = f" {text} "
+    features = words + [padded[i:i + 3] for i in range(len(padded) - 2)]
+    for feature in features:
+        h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=4).digest(), "little")
+        vector[h % EMBEDDING_DIM] += 1.0 if (h >> 31) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class _Entry:
+    __slots__ = ("response", "created_at", "ticket_id", "size", "vector")
+
+    def __init__(self, response: str, created_at: float, ticket_id: Optional[str], size: int, vector=None):
+        self.response = response
+        self.created_at = created_at
+        self.ticket_id = ticket_id
+        self.size = size
+        self.vector = vector
+
+
+CacheKey = Tuple[str, str, str]
+# (intent, fingerprint): the entries a semantic lookup may match
+GroupKey = Tuple[str, str]
+
+
+class ResponseCache:
+    """LRU + TTL cache of generated replies with a memory cap and optional sqlite persistence.
+
+    Exact mode matches on (intent, normalized message, fingerprint of the search
+    results and conversation context).
+    Semantic mode additionally accepts a cached reply whose message embedding has
+    cosine similarity >= `similarity_threshold` with the same intent and results,
+    comparing against the `max_candidates` most recently used such entries.
+    Entries for a ticket are dropped by invalidate_ticket() when that ticket changes.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl: float = DEFAULT_TTL_SECONDS, persist_path: Optional[str] = None,
+                 semantic: bool = False, similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+                 max_candidates: int = DEFAULT_MAX_CANDIDATES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.semantic = semantic
+        self.similarity_threshold = similarity_threshold
+        self.max_candidates = max_candidates
+        self._entries: "OrderedDict[CacheKey, _Entry]" = OrderedDict()
+        self._by_ticket: Dict[str, Set[CacheKey]] = {}
+        # Semantic mode: each group's keys, least recently used first
+        self._by_group: "Dict[GroupKey, OrderedDict[CacheKey, None]]" = {}
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        if persist_path:
+            self._open(persist_path)
+
+    @staticmethod
+    def make_key(intent: str, message_content: str, search_results: List[Any], context: str = "") -> CacheKey:
+        return intent, normalize_message(message_content), fingerprint_results(search_results, context)
+
+    def get(self, intent: str, message_content: str, search_results: List[Any], context: str = "") -> Optional[str]:
+        """Return a cached reply or None"""
+        if intent not in CACHEABLE_INTENTS:
+            return None
+        key = self.make_key(intent, message_content, search_results, context)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.created_at >= self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._touch(key)
+                self.stats["hits"] += 1
+                return entry.response
+
+            if self.semantic:
+                match = self._nearest(key, now)
+                if match is not None:
+                    self._touch(match)
+                    self.stats["semantic_hits"] += 1
+                    return self._entries[match].response
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, intent: str, message_content: str, search_results: List[Any], response: str,
+            ticket_id: Optional[str] = None, context: str = ""):
+        """Store a reply; ticket_id links ticket_info entries for invalidation"""
+        if intent not in CACHEABLE_INTENTS or not response:
+            return
+        key = self.make_key(intent, message_content, search_results, context)
+        # Persisted as stored in memory, so a reload links (and invalidates) the same entries
+        ticket_id = ticket_id if intent == "ticket_info" else None
+        created_at = time.time()
+        self._insert(key, response, created_at, ticket_id)
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?, ?)",
+                    (*key, ticket_id, response, created_at),
+                )
+                self._conn.commit()
+
+    def invalidate_ticket(self, ticket_id: str):
+        """Drop every cached reply built from this ticket's data"""
+        with self._lock:
+            keys = self._by_ticket.pop(ticket_id, set())
+            for key in list(keys):
+                self._remove(key)
+            if keys:
+                self.stats["invalidations"] += len(keys)
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM response_cache WHERE ticket_id = ?", (ticket_id,))
+                self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_ticket.clear()
+            self._by_group.clear()
+            self._bytes = 0
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM response_cache")
+                self._conn.commit()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def _insert(self, key: CacheKey, response: str, created_at: float, ticket_id: Optional[str]):
+        size = sys.getsizeof(response) + sum(sys.getsizeof(part) for part in key)
+        vector = embed(key[1]) if self.semantic else None
+        if vector is not None:
+            size += vector.nbytes
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(response, created_at, ticket_id, size, vector)
+            self._bytes += size
+            if ticket_id:
+                self._by_ticket.setdefault(ticket_id, set()).add(key)
+            if vector is not None:
+                self._by_group.setdefault((key[0], key[2]), OrderedDict())[key] = None
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest, persisted=True)
+                self.stats["evictions"] += 1
+
+    def _remove(self, key: CacheKey, persisted: bool = False):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size
+        if entry.ticket_id:
+            keys = self._by_ticket.get(entry.ticket_id)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._by_ticket[entry.ticket_id]
+        if entry.vector is not None:
+            group = self._by_group.get((key[0], key[2]))
+            if group is not None:
+                group.pop(key, None)
+                if not group:
+                    del self._by_group[(key[0], key[2])]
+        if self._conn is not None and persisted:
+            self._conn.execute(
+                "DELETE FROM response_cache WHERE intent = ? AND message = ? AND fingerprint = ?", key
+            )
+
+    def _touch(self, key: CacheKey):
+        """Mark an entry most recently used (call with the lock held)"""
+        self._entries.move_to_end(key)
+        group = self._by_group.get((key[0], key[2]))
+        if group is not None and key in group:
+            group.move_to_end(key)
+
+    def _nearest(self, key: CacheKey, now: float) -> Optional[CacheKey]:
+        """Most similar live entry among the most recent ones with the same intent and search results"""
+        import numpy as np
+
+        intent, message, fingerprint = key
+        group = self._by_group.get((intent, fingerprint))
+        if not group:
+            return None
+        candidates = [
+            k for k in itertools.islice(reversed(group), self.max_candidates)
+            if now - self._entries[k].created_at < self.ttl
+        ]
+        if not candidates:
+            return None
+        matrix = np.stack([self._entries[k].vector for k in candidates])
+        scores = matrix @ embed(message)
+        best = int(scores.argmax())
+        return candidates[best] if scores[best] >= self.similarity_threshold else None
+
+    def _open(self, persist_path: str):
+        self._conn = sqlite3.connect(persist_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS response_cache (
+                intent TEXT NOT NULL,
+                message TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                ticket_id TEXT,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (intent, message, fingerprint)
+            )
+        """)
+        self._conn.execute("DELETE FROM response_cache WHERE created_at < ?", (time.time() - self.ttl,))
+        self._conn.commit()
+        rows = self._conn.execute("""
+            SELECT intent, message, fingerprint, ticket_id, response, created_at
+            FROM response_cache ORDER BY created_at
+        """).fetchall()
+        for intent, message, fingerprint, ticket_id, response, created_at in rows:
+            self._insert((intent, message, fingerprint), response, created_at, ticket_id)
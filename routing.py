@@ -0,0 +1,85 @@
+"""Single-call routing: one structured completion that classifies and, when it can, answers
+
+The model gets the customer's message, the conversation so far and the ticket
+context already on hand (the ticket named in the message, the customer's best
+matching or newest tickets), and replies with JSON that matches ROUTE_SCHEMA.
+It either gives the final reply, or asks for a tool whose result the reply
+depends on (looking up a ticket that isn't in the context, or creating one).
+"""
+import json
+from typing import Any, Dict, List, NamedTuple, Optional
+
+INTENTS = ("ticket_info", "ticket_request", "other")
+# "reply": `reply` is the answer. The others need a tool result before answering.
+ACTIONS = ("reply", "lookup_ticket", "create_ticket")
+
+ROUTE_SCHEMA: Dict[str, Any] = {
+    "name": "route_turn",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "intent": {"type": "string", "enum": list(INTENTS)},
+            "summary": {"type": "string"},
+            "ticket_id": {"type": ["string", "null"]},
+            "action": {"type": "string", "enum": list(ACTIONS)},
+            "reply": {"type": ["string", "null"]},
+        },
+        "required": ["intent", "summary", "ticket_id", "action", "reply"],
+        "additionalProperties": False,
+    },
+}
+
+ROUTE_SYSTEM_PROMPT = """You are a helpful customer service agent. Classify the customer's latest message and, if you can, answer it.
+
+Intents:
+- "ticket_info": the customer asks about a past issue or a specific ticket
+- "ticket_request": the customer states a current problem that needs a new support ticket
+- "other": casual conversation, greetings, or non-support questions
+
+Set ticket_id to the 5-character ticket ID the customer means (from the message, the conversation or the
+ticket context), or null. Summarize the message in one sentence.
+
+Actions:
+- "reply": you can answer now; put the full reply to the customer in "reply". Use this for "other", and for
+  "ticket_info" when the ticket they mean is in the ticket context below (or they need to give an ID).
+- "lookup_ticket": the customer names a ticket that is not in the ticket context; set ticket_id, reply null.
+- "create_ticket": always for "ticket_request"; reply null (the ticket ID is only known once it exists).
+
+When replying: present ticket information clearly, be conversational, friendly and professional, and offer
+further help. Never invent ticket details that are not in the context."""
+
+
+class Route(NamedTuple):
+    intent: str
+    summary: str
+    ticket_id: Optional[str]
+    action: str
+    reply: Optional[str]
+
+
+def route_messages(message_content: str, history: str = "", ticket_context: Optional[List[str]] = None) -> list:
+    """Chat messages for the routing completion"""
+    system = ROUTE_SYSTEM_PROMPT
+    if history:
+        system += f"\n\nConversation so far:\n{history}"
+    if ticket_context:
+        system += "\n\nTicket context:\n" + "\n".join(f"- {line}" for line in ticket_context)
+    return [{"role": "system", "content": system}, {"role": "user", "content": message_content}]
+
+
+def parse_route(content: Optional[str]) -> Optional[Route]:
+    """The Route in a routing completion, or None if it doesn't follow the schema"""
+    try:
+        data = json.loads(content or "")
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or data.get("intent") not in INTENTS or data.get("action") not in ACTIONS:
+        return None
+    reply = data.get("reply")
+    if data["action"] == "reply" and not (isinstance(reply, str) and reply.strip()):
+        return None
+    ticket_id = data.get("ticket_id")
+    if not isinstance(ticket_id, str) or ticket_id.lower() in ("", "null", "none"):
+        ticket_id = None
+    return Route(data["intent"], str(data.get("summary") or ""), ticket_id, data["action"], reply)
@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""HTTP/WebSocket front end for the agent, with optional worker processes
+
+    POST /v1/messages  {"message": ..., "username": ..., "thread_id": ...} -> {"reply": ..., "thread_id": ...}
+    GET  /v1/ws?username=...&thread_id=...  WebSocket: send {"message": ...} (or plain text), receive
+         {"type": "chunk", "text": ...} as the reply streams, then {"type": "done", "reply": ...}
+    GET  /healthz  200 while serving, 503 while draining or if a worker is down
+
+With --workers 1 the process serves the port itself. With more, it starts that
+many worker processes on the ports after --port and routes every request to
+the worker chosen by a hash of its thread_id, so a conversation (and its
+in-process memory) stays on one worker. A worker at its in-flight limit answers
+503 with Retry-After instead of queueing. SIGTERM/SIGINT stop new work and let
+in-flight messages finish (up to SERVER_SHUTDOWN_TIMEOUT seconds).
+
+Usage: python server.py [--port 8080] [--workers 4] [--max-in-flight 64]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import time
+import uuid
+import zlib
+from typing import Any, Dict, List, Optional, Set
+
+import tornado.httpclient
+import tornado.httpserver
+import tornado.httputil
+import tornado.ioloop
+import tornado.web
+import tornado.websocket
+from dotenv import load_dotenv
+
+from metrics import metrics
+
+load_dotenv()
+
+# Loopback unless configured: there is no authentication, so put a proxy that has it in front
+DEFAULT_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+DEFAULT_PORT = int(os.getenv("SERVER_PORT", "8080"))
+DEFAULT_WORKERS = int(os.getenv("SERVER_WORKERS", "1"))
+# Messages a worker processes at once before answering 503
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("SERVER_MAX_IN_FLIGHT", "64"))
+SHUTDOWN_TIMEOUT = float(os.getenv("SERVER_SHUTDOWN_TIMEOUT", "30"))
+# Seconds the router waits for a worker's reply
+WORKER_REQUEST_TIMEOUT = float(os.getenv("SERVER_WORKER_TIMEOUT", "120"))
+MAX_MESSAGE_BYTES = 64 * 1024
+
+
+def worker_index(thread_id: str, workers: int) -> int:
+    """Stable across processes (unlike hash()), so every router agrees"""
+    return zlib.crc32(thread_id.encode()) % workers
+
+
+class WorkerState:
+    """In-flight accounting and drain state for one worker process"""
+
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.draining = False
+        self.sockets: Set["ChatSocket"] = set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def try_begin(self) -> bool:
+        if self.draining or self.in_flight >= self.max_in_flight:
+            return False
+        self.in_flight += 1
+        self._idle.clear()
+        metrics.set_gauge("agent_server_in_flight", self.in_flight)
+        return True
+
+    def end(self):
+        self.in_flight -= 1
+        metrics.set_gauge("agent_server_in_flight", self.in_flight)
+        if not self.in_flight:
+            self._idle.set()
+
+    async def wait_idle(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+def _reject(transport: str, reason: str):
+    metrics.inc("agent_server_rejected_total", transport=transport, reason=reason)
+
+
+class JSONHandler(tornado.web.RequestHandler):
+    def write_json(self, payload: Dict[str, Any], status: int = 200):
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps(payload))
+
+    def request_json(self) -> Optional[Dict[str, Any]]:
+        if len(self.request.body) > MAX_MESSAGE_BYTES:
+            return None
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except ValueError:
+            return None
+        return body if isinstance(body, dict) else None
+
+
+class MessageHandler(JSONHandler):
+    def initialize(self, state: WorkerState):
+        self.state = state
+
+    async def post(self):
+        import agent
+
+        body = self.request_json()
+        message = body.get("message") if body else None
+        if not isinstance(message, str) or not message.strip():
+            self.write_json({"error": "expected a JSON object with a non-empty \"message\""}, 400)
+            return
+        username = str(body.get("username") or "guest")
+        thread_id = str(body.get("thread_id") or uuid.uuid4())
+        if not self.state.try_begin():
+            _reject("http", "draining" if self.state.draining else "busy")
+            self.set_header("Retry-After", "1")
+            self.write_json({"error": "server busy, retry shortly"}, 503)
+            return
+        try:
+            reply = await agent.aprocess_customer_message(message, username, thread_id,
+                                                          langsmith_extra={"metadata": {"thread_id": thread_id}})
+        except Exception as e:
+            print(f"Error processing message for thread {thread_id}: {e}")
+            metrics.inc("agent_errors_total", stage="server")
+            self.write_json({"error": "internal error", "thread_id": thread_id}, 500)
+            return
+        finally:
+            self.state.end()
+        self.set_header("X-Worker-Pid", str(os.getpid()))
+        self.write_json({"reply": reply, "thread_id": thread_id})
+
+
+class ChatSocket(tornado.websocket.WebSocketHandler):
+    """One conversation per connection; messages are answered one at a time, in order"""
+
+    def initialize(self, state: WorkerState):
+        self.state = state
+
+    def check_origin(self, origin: str) -> bool:
+        return True
+
+    def open(self):
+        self.username = self.get_query_argument("username", "guest")
+        self.thread_id = self.get_query_argument("thread_id", "") or str(uuid.uuid4())
+        self.state.sockets.add(self)
+        self.write_message({"type": "session", "thread_id": self.thread_id, "worker_pid": os.getpid()})
+
+    async def on_message(self, raw: Any):
+        # Tornado waits for this coroutine before delivering the next message on this socket
+        import agent
+
+        try:
+            payload = json.loads(raw)
+            message = payload.get("message") if isinstance(payload, dict) else None
+        except ValueError:
+            message = raw
+        if not isinstance(message, str) or not message.strip():
+            await self._send({"type": "error", "error": "empty message"})
+            return
+        if not self.state.try_begin():
+            _reject("websocket", "draining" if self.state.draining else "busy")
+            await self._send({"type": "error", "error": "server busy, retry shortly", "retry_after": 1})
+            return
+        chunks: List[str] = []
+        try:
+            async for chunk in agent.aprocess_customer_message_stream(
+                    message, self.username, self.thread_id,
+                    langsmith_extra={"metadata": {"thread_id": self.thread_id}}):
+                chunks.append(chunk)
+                await self._send({"type": "chunk", "text": chunk})
+            await self._send({"type": "done", "reply": "".join(chunks)})
+        except tornado.websocket.WebSocketClosedError:
+            pass
+        except Exception as e:
+            print(f"Error processing message for thread {self.thread_id}: {e}")
+            metrics.inc("agent_errors_total", stage="server")
+            if self.ws_connection is not None:
+                await self.write_message({"type": "error", "error": "internal error"})
+        finally:
+            self.state.end()
+
+    async def _send(self, payload: Dict[str, Any]):
+        if self.ws_connection is None:
+            raise tornado.websocket.WebSocketClosedError()
+        await self.write_message(payload)
+
+    def on_close(self):
+        self.state.sockets.discard(self)
+
+
+class HealthHandler(JSONHandler):
+    def initialize(self, state: WorkerState):
+        self.state = state
+
+    def get(self):
+        self.write_json({
+            "status": "draining" if self.state.draining else "ok",
+            "pid": os.getpid(),
+            "in_flight": self.state.in_flight,
+            "max_in_flight": self.state.max_in_flight,
+        }, 503 if self.state.draining else 200)
+
+
+def _stop_event() -> asyncio.Event:
+    """Set on SIGTERM or SIGINT"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    return stop
+
+
+async def serve_worker(host: str, port: int, max_in_flight: int, shutdown_timeout: float = SHUTDOWN_TIMEOUT):
+    """Serve the agent on host:port until SIGTERM/SIGINT, then drain"""
+    import agent
+    import database
+
+    agent.get_trace_exporter()
+    # Schema, clients, classifier and prompt up front, so the first customer doesn't wait
+    await asyncio.to_thread(agent.bootstrap)
+    state = WorkerState(max_in_flight)
+    app = tornado.web.Application([
+        (r"/v1/messages", MessageHandler, {"state": state}),
+        (r"/v1/ws", ChatSocket, {"state": state}),
+        (r"/healthz", HealthHandler, {"state": state}),
+    ])
+    server = tornado.httpserver.HTTPServer(app, xheaders=True)
+    server.listen(port, host)
+    print(f"Worker {os.getpid()} serving on {host}:{port}", flush=True)
+
+    await _stop_event().wait()
+    state.draining = True
+    server.stop()
+    if not await state.wait_idle(shutdown_timeout):
+        print(f"Worker {os.getpid()}: {state.in_flight} messages still running after {shutdown_timeout}s")
+    for socket in list(state.sockets):
+        socket.close(1001, "server shutting down")
+    try:
+        await asyncio.wait_for(server.close_all_connections(), 5)
+    except asyncio.TimeoutError:
+        pass
+    ticket_queue = agent.get_ticket_write_queue()
+    if ticket_queue is not None:
+        # Commit journaled tickets now rather than on the next start
+        await asyncio.to_thread(ticket_queue.close)
+    database.close_pools()
+    exporter = agent.get_trace_exporter()
+    if exporter is not None:
+        exporter.close()
+    print(f"Worker {os.getpid()} stopped", flush=True)
+
+
+def _worker_main(host: str, port: int, max_in_flight: int, shutdown_timeout: float):
+    # The router handles Ctrl-C for the whole group; a worker only stops on the router's SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(serve_worker(host, port, max_in_flight, shutdown_timeout))
+
+
+class Router:
+    """Starts, watches and addresses the worker processes"""
+
+    def __init__(self, ports: List[int], max_in_flight: int, shutdown_timeout: float):
+        self.ports = ports
+        self.max_in_flight = max_in_flight
+        self.shutdown_timeout = shutdown_timeout
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * len(ports)
+        self.draining = False
+        self.in_flight = 0
+        # Fresh interpreters: nothing (threads, pools, clients) is inherited from the router
+        self._context = multiprocessing.get_context("spawn")
+
+    def start(self, index: int):
+        process = self._context.Process(
+            target=_worker_main, name=f"agent-worker-{index}",
+            args=("127.0.0.1", self.ports[index], self.max_in_flight, self.shutdown_timeout),
+        )
+        process.start()
+        self.processes[index] = process
+
+    def restart_dead(self):
+        if self.draining:
+            return
+        for index, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                print(f"Worker {index} (pid {process.pid}) exited with {process.exitcode}; restarting")
+                metrics.inc("agent_errors_total", stage="server_worker")
+                self.start(index)
+
+    def url_for(self, thread_id: str, path: str, scheme: str = "http") -> str:
+        return f"{scheme}://127.0.0.1:{self.ports[worker_index(thread_id, len(self.ports))]}{path}"
+
+    async def stop(self):
+        self.draining = True
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + self.shutdown_timeout + 10
+        for process in self.processes:
+            if process is not None:
+                await asyncio.to_thread(process.join, max(0.0, deadline - time.monotonic()))
+                if process.is_alive():
+                    process.kill()
+
+
+class RouterMessageHandler(JSONHandler):
+    def initialize(self, router: Router):
+        self.router = router
+
+    async def post(self):
+        body = self.request_json()
+        if body is None:
+            self.write_json({"error": "expected a JSON object with a non-empty \"message\""}, 400)
+            return
+        if self.router.draining:
+            _reject("http", "draining")
+            self.set_header("Retry-After", "1")
+            self.write_json({"error": "server shutting down"}, 503)
+            return
+        body["thread_id"] = str(body.get("thread_id") or uuid.uuid4())
+        self.router.in_flight += 1
+        try:
+            response = await tornado.httpclient.AsyncHTTPClient().fetch(
+                self.router.url_for(body["thread_id"], "/v1/messages"), method="POST", body=json.dumps(body),
+                headers={"Content-Type": "application/json", "X-Forwarded-For": self.request.remote_ip},
+                request_timeout=WORKER_REQUEST_TIMEOUT, raise_error=False,
+            )
+        finally:
+            self.router.in_flight -= 1
+        if response.code == 599:
+            # Connection refused or timed out: the worker is down or restarting
+            _reject("http", "worker_unavailable")
+            self.set_header("Retry-After", "1")
+            self.write_json({"error": "worker unavailable, retry shortly"}, 503)
+            return
+        self.set_status(response.code)
+        for name in ("Content-Type", "Retry-After", "X-Worker-Pid"):
+            if name in response.headers:
+                self.set_header(name, response.headers[name])
+        self.finish(response.body)
+
+
+class RouterSocket(tornado.websocket.WebSocketHandler):
+    """Relays a client WebSocket to the worker that owns its thread_id"""
+
+    def initialize(self, router: Router):
+        self.router = router
+        self.upstream: Optional[tornado.websocket.WebSocketClientConnection] = None
+
+    def check_origin(self, origin: str) -> bool:
+        return True
+
+    async def open(self):
+        if self.router.draining:
+            self.close(1013, "server shutting down")
+            return
+        username = self.get_query_argument("username", "guest")
+        thread_id = self.get_query_argument("thread_id", "") or str(uuid.uuid4())
+        url = self.router.url_for(thread_id, "/v1/ws", "ws")
+        try:
+            self.upstream = await tornado.websocket.websocket_connect(
+                tornado.httpclient.HTTPRequest(
+                    f"{url}?{tornado.httputil.urlencode({'username': username, 'thread_id': thread_id})}",
+                    connect_timeout=5,
+                ),
+                max_message_size=MAX_MESSAGE_BYTES,
+            )
+        except Exception as e:
+            print(f"Error connecting WebSocket for thread {thread_id} to its worker: {e}")
+            _reject("websocket", "worker_unavailable")
+            self.close(1013, "worker unavailable")
+            return
+        tornado.ioloop.IOLoop.current().spawn_callback(self._relay_from_worker)
+
+    async def _relay_from_worker(self):
+        while True:
+            message = await self.upstream.read_message()
+            if message is None:
+                self.close(1001, "worker closed the connection")
+                return
+            try:
+                await self.write_message(message)
+            except tornado.websocket.WebSocketClosedError:
+                self.upstream.close()
+                return
+
+    async def on_message(self, message: Any):
+        if self.upstream is not None:
+            await self.upstream.write_message(message)
+
+    def on_close(self):
+        if self.upstream is not None:
+            self.upstream.close()
+
+
+class RouterHealthHandler(JSONHandler):
+    def initialize(self, router: Router):
+        self.router = router
+
+    async def get(self):
+        client = tornado.httpclient.AsyncHTTPClient()
+        workers = []
+        for index, port in enumerate(self.router.ports):
+            try:
+                response = await client.fetch(f"http://127.0.0.1:{port}/healthz", request_timeout=2, raise_error=False)
+                status = json.loads(response.body)["status"] if response.code in (200, 503) else "down"
+            except OSError:
+                # Not listening: still starting, or exited and about to be restarted
+                status = "down"
+            workers.append({"index": index, "port": port, "status": status})
+        ok = not self.router.draining and all(worker["status"] == "ok" for worker in workers)
+        self.write_json({"status": "draining" if self.router.draining else ("ok" if ok else "degraded"),
+                         "workers": workers}, 200 if ok else 503)
+
+
+async def serve_router(host: str, port: int, workers: int, max_in_flight: int,
+                       shutdown_timeout: float = SHUTDOWN_TIMEOUT):
+    """Run `workers` worker processes behind a thread_id-affine router on host:port"""
+    router = Router([port + 1 + i for i in range(workers)], max_in_flight, shutdown_timeout)
+    for index in range(workers):
+        router.start(index)
+    # The default client allows 10 concurrent fetches; allow every worker's full in-flight limit
+    tornado.httpclient.AsyncHTTPClient.configure(None, max_clients=workers * max_in_flight + 16)
+    app = tornado.web.Application([
+        (r"/v1/messages", RouterMessageHandler, {"router": router}),
+        (r"/v1/ws", RouterSocket, {"router": router}),
+        (r"/healthz", RouterHealthHandler, {"router": router}),
+    ])
+    server = tornado.httpserver.HTTPServer(app, xheaders=True)
+    server.listen(port, host)
+    watchdog = tornado.ioloop.PeriodicCallback(router.restart_dead, 1000)
+    watchdog.start()
+    print(f"Router {os.getpid()} serving on {host}:{port} with {workers} workers", flush=True)
+
+    await _stop_event().wait()
+    watchdog.stop()
+    server.stop()
+    # Workers finish their in-flight messages, whose replies are relayed before the router exits
+    await router.stop()
+    deadline = time.monotonic() + 5
+    while router.in_flight and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    try:
+        await asyncio.wait_for(server.close_all_connections(), 5)
+    except asyncio.TimeoutError:
+        pass
+    print(f"Router {os.getpid()} stopped", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="worker processes (1: serve in this process, no router)")
+    parser.add_argument("--max-in-flight", type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                        help="messages per worker at once before answering 503")
+    parser.add_argument("--shutdown-timeout", type=float, default=SHUTDOWN_TIMEOUT)
+    args = parser.parse_args()
+
+    if args.workers <= 1:
+        asyncio.run(serve_worker(args.host, args.port, args.max_in_flight, args.shutdown_timeout))
+    else:
+        asyncio.run(serve_router(args.host, args.port, args.workers, args.max_in_flight, args.shutdown_timeout))
+
+
+if __name__ == "__main__":
+    main()
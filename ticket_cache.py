@@ -0,0 +1,106 @@
+"""Read-through LRU + TTL cache of ticket lookups keyed on (ticket_id, username)"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from database import TicketRecord
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("TICKET_CACHE_MAX_ENTRIES", "4096"))
+# Bounds how long a write made by another process (which can't invalidate this cache) goes unseen
+DEFAULT_TTL_SECONDS = float(os.getenv("TICKET_CACHE_TTL_SECONDS", "30"))
+
+TicketKey = Tuple[str, str]
+
+
+class _Entry:
+    __slots__ = ("record", "search_results", "loaded_at")
+
+    def __init__(self, record: TicketRecord, search_results: Tuple[str, ...], loaded_at: float):
+        self.record = record
+        self.search_results = search_results
+        self.loaded_at = loaded_at
+
+
+class TicketCache:
+    """Ticket rows and their formatted search results.
+
+    At most `max_entries` lookups are kept, least recently used first out, each
+    for at most `ttl` seconds. invalidate_ticket() drops every entry for a
+    ticket_id; register it with database.on_ticket_change so any write to the
+    row in this process clears it, while the TTL covers writes made by other
+    processes. "Not found" is never cached: the ticket may be created (or
+    committed from another process's queue) a moment later. A lookup that
+    raced with an invalidation is returned but not stored, so a stale row read
+    just before a write can't outlive it.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[TicketKey, _Entry]" = OrderedDict()
+        self._by_ticket: Dict[str, Set[str]] = {}
+        # Bumped by every invalidation; loads started before a bump aren't stored
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get_or_load(self, ticket_id: str, username: str,
+                    load: Callable[[str, str], Optional[TicketRecord]],
+                    render: Callable[[str, str, Optional[TicketRecord]], Tuple[str, ...]]) -> Tuple[Tuple[str, ...], bool]:
+        """(search results, hit): cached, or load(ticket_id, username) and render() them.
+
+        Exceptions from `load` propagate and nothing is cached.
+        """
+        key = (ticket_id, username)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.loaded_at >= self.ttl:
+                del self._entries[key]
+                self._discard_index(ticket_id, username)
+                self.stats["expirations"] += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry.search_results, True
+            self.stats["misses"] += 1
+            generation = self._generation
+
+        loaded_at = time.monotonic()
+        record = load(ticket_id, username)
+        search_results = render(ticket_id, username, record)
+        with self._lock:
+            if record is not None and self._generation == generation:
+                self._entries[key] = _Entry(record, search_results, loaded_at)
+                self._by_ticket.setdefault(ticket_id, set()).add(username)
+                while len(self._entries) > self.max_entries:
+                    (old_id, old_user), _ = self._entries.popitem(last=False)
+                    self._discard_index(old_id, old_user)
+                    self.stats["evictions"] += 1
+        return search_results, False
+
+    def invalidate_ticket(self, ticket_id: str):
+        """Drop cached lookups of this ticket for every user"""
+        with self._lock:
+            self._generation += 1
+            for username in self._by_ticket.pop(ticket_id, set()):
+                if self._entries.pop((ticket_id, username), None) is not None:
+                    self.stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._by_ticket.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _discard_index(self, ticket_id: str, username: str):
+        usernames = self._by_ticket.get(ticket_id)
+        if usernames is not None:
+            usernames.discard(username)
+            if not usernames:
+                del self._by_ticket[ticket_id]
@@ -0,0 +1,73 @@
+"""Collision-free 5-character ticket IDs handed out from reserved blocks"""
+import os
+import threading
+from typing import Callable, Optional
+
+ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyz"
+ID_LENGTH = 5
+ID_SPACE = len(ALPHABET) ** ID_LENGTH
+
+# Sequence numbers are scattered over the ID space by n -> (n * A + B) mod ID_SPACE.
+# A shares no factor with ID_SPACE (2^10 * 3^10), so this is a bijection: distinct
+# sequence numbers always give distinct IDs, and consecutive ones don't look consecutive.
+_MULTIPLIER = 16_777_619
+_OFFSET = 11_352_983
+
+DEFAULT_BLOCK_SIZE = int(os.getenv("TICKET_ID_BLOCK_SIZE", "100"))
+
+
+def ticket_id_for(sequence: int) -> Optional[str]:
+    """The ticket ID for a sequence number, or None if it would be all letters.
+
+    Messages are scanned for ticket IDs with fast_classifier.TICKET_ID_PATTERN,
+    which needs at least one digit, so the ~20% of the space that is letters only
+    is never handed out.
+    """
+    value = (sequence * _MULTIPLIER + _OFFSET) % ID_SPACE
+    chars = []
+    for _ in range(ID_LENGTH):
+        value, digit = divmod(value, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    ticket_id = "".join(reversed(chars))
+    return ticket_id if any(c.isdigit() for c in ticket_id) else None
+
+
+class TicketIdAllocator:
+    """Hands out unique ticket IDs from blocks of sequence numbers.
+
+    `reserve(count)` atomically claims `count` sequence numbers in shared storage
+    (database.reserve_ticket_ids) and returns the first. Each process claims a
+    block at a time and serves IDs from memory, so concurrent workers only touch
+    the shared counter once per block and never hand out the same ID. Numbers
+    left in a block when the process exits are skipped, not reused.
+    """
+
+    def __init__(self, reserve: Callable[[int], int], block_size: int = DEFAULT_BLOCK_SIZE):
+        self.reserve = reserve
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+        self.stats = {"ids": 0, "blocks": 0}
+
+    def next_id(self) -> str:
+        while True:
+            with self._lock:
+                sequence = self._next if self._next < self._end else None
+                if sequence is not None:
+                    self._next += 1
+            if sequence is None:
+                # Reserve without holding the lock: another thread's reservation may
+                # be waiting for a write transaction to finish
+                start = self.reserve(self.block_size)
+                with self._lock:
+                    self._next, self._end = start, start + self.block_size
+                    self.stats["blocks"] += 1
+                continue
+            if sequence >= ID_SPACE:
+                raise RuntimeError(f"Ticket ID space exhausted ({ID_SPACE} sequence numbers used)")
+            ticket_id = ticket_id_for(sequence)
+            if ticket_id is not None:
+                with self._lock:
+                    self.stats["ids"] += 1
+                return ticket_id
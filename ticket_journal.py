@@ -0,0 +1,238 @@
+"""Write-behind ticket creation: journal the ticket, answer with its ID, commit in groups"""
+import itertools
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, TextIO, Tuple
+
+from database import TicketRecord
+from metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: no journal locking, one process per journal path
+    fcntl = None
+
+DEFAULT_JOURNAL_PATH = os.getenv("TICKET_JOURNAL_PATH", "ticket_journal.jsonl")
+DEFAULT_BATCH_SIZE = int(os.getenv("TICKET_WRITE_BATCH_SIZE", "256"))
+# Seconds the writer waits for more tickets to join a commit
+DEFAULT_FLUSH_INTERVAL = float(os.getenv("TICKET_WRITE_FLUSH_INTERVAL", "0.02"))
+# fsync every journal append (survives power loss, not just a crashed process)
+DEFAULT_FSYNC = os.getenv("TICKET_JOURNAL_FSYNC", "false").lower() == "true"
+# Rewrite the journal with only the uncommitted tickets once it grows past this
+COMPACT_BYTES = 1 << 20
+# Journal files tried per path when other processes hold the first ones
+MAX_JOURNAL_SLOTS = 64
+RETRY_DELAY = 0.5
+
+
+def _timestamp() -> str:
+    """The current time as sqlite's CURRENT_TIMESTAMP formats it"""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _claim_journal(path: str) -> Tuple[str, TextIO]:
+    """The first journal path (path, path.1, ...) no other process holds, and its held lock file"""
+    root, ext = os.path.splitext(path)
+    for slot in range(MAX_JOURNAL_SLOTS if fcntl is not None else 1):
+        slot_path = path if slot == 0 else f"{root}.{slot}{ext}"
+        # The lock is on a separate file because compaction replaces the journal itself
+        lock = open(slot_path + ".lock", "a")
+        if fcntl is None:
+            return slot_path, lock
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return slot_path, lock
+        except OSError:
+            lock.close()
+    raise RuntimeError(f"All {MAX_JOURNAL_SLOTS} ticket journals at {path} are in use")
+
+
+class TicketWriteQueue:
+    """Durable write-behind queue for new tickets.
+
+    `submit()` appends the ticket to a local journal (one JSON line) and returns
+    at once; a background thread commits queued tickets `batch_size` at a time
+    with `commit(tickets)` (database.commit_tickets), which writes their users
+    and rows in one transaction. Until then `pending()` and `pending_for_user()`
+    serve the ticket to lookups, history pages and searches. Tickets left in
+    the journal by a stopped process are committed when the next one claims
+    that journal. Each process locks its own journal file, so server workers
+    sharing a path get path, path.1, ... .
+
+    The customer already has the ticket's ID, so a ticket the database refuses
+    (its ID turned out to be taken) is never dropped: it is appended to the
+    dead-letter file next to the journal (ticket_journal.failed.jsonl), logged
+    and counted in agent_ticket_dead_letters_total, for support to re-create.
+    """
+
+    def __init__(self, commit: Callable[[List[TicketRecord]], List[bool]],
+                 journal_path: str = DEFAULT_JOURNAL_PATH, batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL, fsync: bool = DEFAULT_FSYNC):
+        self.commit = commit
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.journal_path, self._journal_lock = _claim_journal(journal_path)
+        root, ext = os.path.splitext(self.journal_path)
+        self.dead_letter_path = f"{root}.failed{ext}"
+        self._journal: Optional[TextIO] = None
+        # Uncommitted tickets in journal order
+        self._pending: Dict[str, TicketRecord] = {}
+        self._closed = False
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self.stats = {"submitted": 0, "recovered": 0, "committed": 0, "commits": 0, "failed": 0,
+                      "commit_errors": 0, "dead_letter_errors": 0}
+        self._recover()
+        self._worker = threading.Thread(target=self._run, name="ticket-writer", daemon=True)
+        self._worker.start()
+
+    def _recover(self):
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, encoding="utf-8") as journal:
+                for line in journal:
+                    try:
+                        ticket = TicketRecord(**json.loads(line))
+                    except (ValueError, TypeError):
+                        # A line cut short by a crash mid-append was never acknowledged
+                        continue
+                    self._pending[ticket.ticket_id] = ticket
+        self.stats["recovered"] = len(self._pending)
+        if self._pending:
+            print(f"Recovered {len(self._pending)} uncommitted tickets from {self.journal_path}")
+        # Appends go to the end; rewrite so a torn last line can't swallow the next one
+        self._rewrite_journal()
+
+    def submit(self, ticket_id: str, username: str, status: str, description: str, priority: str) -> TicketRecord:
+        """Journal a ticket for writing and return it as lookups will see it"""
+        now = _timestamp()
+        ticket = TicketRecord(ticket_id, username, status, description, priority, now, now)
+        line = json.dumps(ticket._asdict()) + "\n"
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("ticket write queue is closed")
+            self._journal.write(line)
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            self._pending[ticket_id] = ticket
+            self.stats["submitted"] += 1
+            metrics.set_gauge("agent_ticket_queue_depth", len(self._pending))
+            self._changed.notify_all()
+        return ticket
+
+    def pending(self, ticket_id: str, username: str) -> Optional[TicketRecord]:
+        """The ticket if it is queued for this user and not yet committed"""
+        ticket = self._pending.get(ticket_id)
+        return ticket if ticket is not None and ticket.username == username else None
+
+    def pending_for_user(self, username: str) -> List[TicketRecord]:
+        """The user's queued, uncommitted tickets, newest first"""
+        # list() copies the values in one step, so a concurrent submit or commit can't break the loop
+        return [ticket for ticket in reversed(list(self._pending.values())) if ticket.username == username]
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._closed:
+                    self._changed.wait()
+                if not self._pending:
+                    return
+                # Let a burst of submissions join this commit
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._pending) < self.batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._changed.wait(remaining)
+                batch = list(itertools.islice(self._pending.values(), self.batch_size))
+            try:
+                written = self.commit(batch)
+            except Exception as e:
+                print(f"Error committing {len(batch)} queued tickets (will retry): {e}")
+                metrics.inc("agent_errors_total", stage="ticket_write_queue")
+                self.stats["commit_errors"] += 1
+                time.sleep(RETRY_DELAY)
+                continue
+            refused = [ticket for ticket, ok in zip(batch, written) if not ok]
+            if refused:
+                try:
+                    self._dead_letter(refused)
+                except OSError as e:
+                    # Keep them queued (the batch's committed tickets replay as already written)
+                    print(f"Error writing {len(refused)} refused tickets to {self.dead_letter_path} (will retry): {e}")
+                    metrics.inc("agent_errors_total", stage="ticket_dead_letter")
+                    self.stats["dead_letter_errors"] += 1
+                    time.sleep(RETRY_DELAY)
+                    continue
+            metrics.inc("agent_ticket_group_commits_total")
+            metrics.inc("agent_ticket_group_committed_total", len(batch))
+            with self._lock:
+                for ticket in batch:
+                    del self._pending[ticket.ticket_id]
+                self.stats["committed"] += sum(written)
+                self.stats["failed"] += len(written) - sum(written)
+                self.stats["commits"] += 1
+                metrics.set_gauge("agent_ticket_queue_depth", len(self._pending))
+                if not self._pending:
+                    # Everything is committed (a replay of these lines would be skipped anyway)
+                    self._journal.seek(0)
+                    self._journal.truncate()
+                elif self._journal.tell() > COMPACT_BYTES:
+                    self._rewrite_journal()
+                self._changed.notify_all()
+
+    def _dead_letter(self, tickets: List[TicketRecord]):
+        """Durably keep tickets the database refused; their IDs were already given to customers"""
+        with open(self.dead_letter_path, "a", encoding="utf-8") as dead_letters:
+            for ticket in tickets:
+                dead_letters.write(json.dumps(ticket._asdict()) + "\n")
+            dead_letters.flush()
+            os.fsync(dead_letters.fileno())
+        for ticket in tickets:
+            print(f"Ticket {ticket.ticket_id} for {ticket.username} could not be stored (ID already taken); "
+                  f"kept in {self.dead_letter_path}")
+        metrics.inc("agent_ticket_dead_letters_total", len(tickets))
+
+    def _rewrite_journal(self):
+        """Replace the journal with one holding only the uncommitted tickets (call with the lock held)"""
+        if self._journal is not None:
+            self._journal.close()
+        temp_path = self.journal_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as journal:
+            for ticket in self._pending.values():
+                journal.write(json.dumps(ticket._asdict()) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+        # Atomic: a crash leaves either the old journal or the new one
+        os.replace(temp_path, self.journal_path)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait (up to `timeout` seconds) until every ticket submitted so far is committed"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self._pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._worker.is_alive():
+                    return False
+                self._changed.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 5.0):
+        """Commit what's queued, then stop the writer; anything left stays in the journal"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._changed.notify_all()
+        self._worker.join(timeout)
+        if not self._worker.is_alive():
+            self._journal.close()
+            self._journal_lock.close()
@@ -0,0 +1,39 @@
+"""Token counting for prompts: tiktoken when its encoding can be loaded, else an estimate"""
+import threading
+from typing import Callable
+
+TOKENIZER_MODEL = "gpt-4o"
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _count_tokens_fallback(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def _token_counter() -> Callable[[str], int]:
+    """tiktoken encoder for TOKENIZER_MODEL, or a ~4 chars/token estimate if it can't be loaded"""
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken
+
+                    encoder = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+                    _encoding = lambda text: len(encoder.encode(text, disallowed_special=()))
+                except Exception as e:
+                    # The BPE file is downloaded on first use; offline hosts estimate instead
+                    print(f"tiktoken unavailable ({e}), estimating token counts")
+                    _encoding = _count_tokens_fallback
+    return _encoding
+
+
+def load_encoder():
+    """Load (and on first use download) the encoding now; it blocks, so call it off the event loop"""
+    _token_counter()
+
+
+def count_tokens(text: str) -> int:
+    return _token_counter()(text)
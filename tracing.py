@@ -0,0 +1,340 @@
+"""Sampled, buffered export of LangSmith runs
+
+TraceExporter stands in for the LangSmith client that @traceable / trace() send
+runs to (install() registers it with langsmith.configure). Request threads only
+make a sampling decision and put the run on a bounded queue; a background
+thread serializes and ships runs in batches to LangSmith and/or a local JSONL
+file. When the queue is full the run is dropped and counted, never waited for.
+"""
+import atexit
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from metrics import metrics
+
+DEFAULT_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+DEFAULT_BATCH_SIZE = int(os.getenv("TRACE_BATCH_SIZE", "100"))
+DEFAULT_FLUSH_INTERVAL = float(os.getenv("TRACE_FLUSH_INTERVAL", "1.0"))
+# Unsampled traces whose unfinished runs are held back in case one of them fails
+MAX_HELD_TRACES = 1000
+# Sampling decisions remembered for traces still in progress
+MAX_OPEN_TRACES = 10000
+
+# ("create" | "update", run fields as passed to Client.create_run / update_run)
+RunOp = Tuple[str, Dict[str, Any]]
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """"default=0.1,llm=0.05,process_customer_message=0.2" -> {"default": 0.1, ...}"""
+    rates = {}
+    for part in spec.split(","):
+        if "=" in part:
+            key, value = part.split("=", 1)
+            rates[key.strip()] = min(1.0, max(0.0, float(value)))
+    return rates
+
+
+class SamplingPolicy:
+    """Head-based sampling: one keep/drop decision per trace, made at its root run.
+
+    The rate is looked up by the root run's name, then its run_type, then
+    "default" (1.0 if unset). The decision is a hash of the trace ID, so every
+    process agrees on it. With `always_on_error`, an unsampled trace is still
+    exported if any of its runs fails: the failed run with the runs still open
+    around it (the root and the failed run's parents), not the runs that
+    finished before it.
+    """
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None, always_on_error: bool = True):
+        self.rates = rates or {}
+        self.always_on_error = always_on_error
+
+    def rate_for(self, name: str, run_type: str) -> float:
+        for key in (name, run_type, "default"):
+            if key in self.rates:
+                return self.rates[key]
+        return 1.0
+
+    def sample(self, trace_id: Any, name: str, run_type: str) -> bool:
+        rate = self.rate_for(name, run_type)
+        if rate >= 1.0:
+            return True
+        return int(str(trace_id).replace("-", "")[:8], 16) / 0x100000000 < rate
+
+
+class FileSink:
+    """Appends runs to a JSONL file: {"op": "create" | "update", "run": {...}} per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, ops: List[RunOp]):
+        lines = [json.dumps({"op": op, "run": run}, default=str) for op, run in ops]
+        with open(self.path, "a") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+class LangSmithSink:
+    """Sends runs with one batch-ingest request per flush"""
+
+    def __init__(self, get_client: Callable[[], Any]):
+        self.get_client = get_client
+
+    def write(self, ops: List[RunOp]):
+        creates = [run for op, run in ops if op == "create"]
+        updates = [dict(run, id=run.pop("run_id")) if "run_id" in run else run
+                   for op, run in ops if op == "update"]
+        self.get_client().batch_ingest_runs(create=creates, update=updates, pre_sampled=True)
+
+
+class TraceExporter:
+    """Client-compatible sink for LangSmith runs with sampling and a bounded queue"""
+
+    def __init__(self, sinks: List[Any], policy: Optional[SamplingPolicy] = None,
+                 queue_size: int = DEFAULT_QUEUE_SIZE, batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.sinks = sinks
+        self.policy = policy or SamplingPolicy()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Optional[RunOp]]" = queue.Queue(maxsize=queue_size)
+        self._decisions: "OrderedDict[str, bool]" = OrderedDict()
+        # trace_id -> run_id -> create of an unsampled run that hasn't finished yet
+        self._held: "OrderedDict[str, Dict[str, RunOp]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._idle = threading.Event()
+        self._idle.set()
+        self.stats = {"queued": 0, "exported": 0, "dropped": 0, "unsampled": 0, "kept_on_error": 0,
+                      "export_errors": 0}
+
+    # Called by langsmith's RunTree.post() / patch()
+    def create_run(self, name: str, inputs: Dict[str, Any], run_type: str, **kwargs: Any):
+        run = dict(kwargs, name=name, inputs=inputs, run_type=run_type)
+        self._route("create", run)
+
+    def update_run(self, run_id: Any, **kwargs: Any):
+        self._route("update", dict(kwargs, run_id=run_id))
+
+    def _route(self, op: str, run: Dict[str, Any]):
+        for key in ("api_key", "api_url"):
+            run.pop(key, None)
+        trace_id = str(run.get("trace_id") or run.get("id") or run.get("run_id"))
+        run_id = str(run.get("id") or run.get("run_id"))
+        is_root = run_id == trace_id
+        failed = bool(run.get("error"))
+        with self._lock:
+            keep = self._decisions.get(trace_id)
+            if keep is None:
+                keep = _head_kept.get() or self.policy.sample(trace_id, run.get("name", ""), run.get("run_type", ""))
+                self._decisions[trace_id] = keep
+                while len(self._decisions) > MAX_OPEN_TRACES:
+                    self._decisions.popitem(last=False)
+            if not keep and failed and self.policy.always_on_error:
+                # Export the trace from here on, with the open runs the failed one belongs under
+                keep = self._decisions[trace_id] = True
+                held = list(self._held.pop(trace_id, {}).values())
+                self.stats["kept_on_error"] += 1
+                self.stats["unsampled"] -= len(held)
+            else:
+                held = []
+            if not keep:
+                open_runs = self._held.get(trace_id)
+                if not self.policy.always_on_error or (is_root and op == "update"):
+                    self._held.pop(trace_id, None)
+                elif op == "create" and not run.get("end_time"):
+                    # Only runs in progress are held: a finished run that didn't fail is never exported
+                    if open_runs is None:
+                        open_runs = self._held[trace_id] = {}
+                    open_runs[run_id] = (op, run)
+                    while len(self._held) > MAX_HELD_TRACES:
+                        self._held.popitem(last=False)
+                elif open_runs is not None:
+                    open_runs.pop(run_id, None)
+                self.stats["unsampled"] += 1
+                metrics.inc("agent_trace_runs_total", result="unsampled")
+            if is_root and op == "update":
+                # The trace is finished
+                self._decisions.pop(trace_id, None)
+                if not keep:
+                    self._held.pop(trace_id, None)
+        if keep:
+            for item in held + [(op, run)]:
+                self._enqueue(item)
+
+    def _enqueue(self, item: RunOp):
+        self._start_worker()
+        self._idle.clear()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.stats["dropped"] += 1
+            metrics.inc("agent_trace_runs_total", result="dropped")
+            return
+        self.stats["queued"] += 1
+
+    def _start_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._worker.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._export(batch)
+                    return
+                batch.append(item)
+            self._export(batch)
+            if self._queue.empty():
+                self._idle.set()
+
+    def _export(self, batch: List[RunOp]):
+        for sink in self.sinks:
+            try:
+                # Each sink gets its own copies (LangSmithSink renames fields in place)
+                sink.write([(op, dict(run)) for op, run in batch])
+            except Exception as e:
+                print(f"Error exporting {len(batch)} trace runs to {type(sink).__name__}: {e}")
+                self.stats["export_errors"] += 1
+                metrics.inc("agent_errors_total", stage="trace_export")
+        self.stats["exported"] += len(batch)
+        metrics.inc("agent_trace_runs_total", len(batch), result="exported")
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait (up to `timeout` seconds) until everything queued so far is exported"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._queue.empty() and self._idle.wait(max(0.0, deadline - time.monotonic())):
+                if self._queue.empty():
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def close(self, timeout: float = 5.0):
+        """Export what's queued, then stop the background thread"""
+        if self._worker is None:
+            return
+        self.flush(timeout)
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self._worker.join(timeout)
+
+    # Rarely used Client methods that RunTree may call
+    def get_run_url(self, *args: Any, **kwargs: Any) -> str:
+        return ""
+
+
+_installed: Optional[TraceExporter] = None
+# Set while running a call head_sampled() decided to trace, so the exporter keeps its trace
+_head_kept: "contextvars.ContextVar[bool]" = contextvars.ContextVar("trace_head_kept", default=False)
+
+
+@contextlib.contextmanager
+def _head_sampling(name: str, run_type: str):
+    exporter = _installed
+    if exporter is None or exporter.policy.always_on_error:
+        yield
+        return
+    from langsmith import tracing_context
+    from langsmith.run_helpers import get_current_run_tree
+
+    if get_current_run_tree() is not None:
+        # Part of a trace that's already running: it follows that trace's decision
+        yield
+    elif random.random() < exporter.policy.rate_for(name, run_type):
+        previous = _head_kept.get()
+        _head_kept.set(True)
+        try:
+            yield
+        finally:
+            _head_kept.set(previous)
+    else:
+        exporter.stats["unsampled"] += 1
+        metrics.inc("agent_trace_runs_total", result="unsampled")
+        with tracing_context(enabled=False):
+            yield
+
+
+def head_sampled(name: str, run_type: str = "chain") -> Callable:
+    """Decorator (outside @traceable) for entry points: don't build runs for dropped traces.
+
+    The exporter can only drop runs after langsmith has built and serialized
+    them. When errors don't have to be kept (TRACE_ERRORS_ALWAYS=false), the
+    decision for a new trace is made here instead and an unsampled call runs
+    with tracing off, so it costs nothing. Calls inside a traced parent follow
+    the parent.
+    """
+    def decorator(fn: Callable) -> Callable:
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def gen_wrapper(*args, **kwargs):
+                # langsmith starts the run on first iteration, so iterate inside the scope
+                with _head_sampling(name, run_type):
+                    async for item in fn(*args, **kwargs):
+                        yield item
+            return gen_wrapper
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with _head_sampling(name, run_type):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _head_sampling(name, run_type):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def install(get_ls_client: Callable[[], Any]) -> Optional[TraceExporter]:
+    """Route all LangSmith runs through a TraceExporter configured from the environment.
+
+    TRACE_EXPORT=false leaves langsmith's own client in place. TRACE_SINK picks
+    "langsmith", "file" or "both"; the file is TRACE_FILE (traces.jsonl).
+    """
+    if os.getenv("TRACE_EXPORT", "true").lower() == "false":
+        return None
+    import langsmith
+
+    sink_names = os.getenv("TRACE_SINK", "langsmith").lower()
+    sinks: List[Any] = []
+    if sink_names in ("langsmith", "both"):
+        sinks.append(LangSmithSink(get_ls_client))
+    if sink_names in ("file", "both"):
+        sinks.append(FileSink(os.getenv("TRACE_FILE", "traces.jsonl")))
+    policy = SamplingPolicy(
+        parse_sample_rates(os.getenv("TRACE_SAMPLE_RATES", "")),
+        always_on_error=os.getenv("TRACE_ERRORS_ALWAYS", "true").lower() != "false",
+    )
+    global _installed
+    exporter = _installed = TraceExporter(sinks, policy)
+    langsmith.configure(client=exporter)
+    atexit.register(exporter.close)
+    return exporter